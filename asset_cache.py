@@ -0,0 +1,129 @@
+import hashlib
+import re
+import sqlite3
+from pathlib import Path
+from urllib.parse import urljoin
+
+# Consecutive snapshots of a site load the same logos, CSS, JS and fonts again and again.
+# This Playwright route handler keeps archived assets in a content-addressed cache on disk
+# (one file per unique body, named after its sha256) and serves repeats from there.
+# Wayback toolbar files and trackers are blocked outright, they never end up in a screenshot anyway.
+ASSET_DIR = Path("data/asset_cache")
+
+CACHED_TYPES = {"image", "stylesheet", "script", "font", "media"}   # never the page (document) itself
+ARCHIVED_ASSET = re.compile(r"/web/\d{1,14}[a-z_]*/")                 # e.g. /web/20100115094530im_/http://...
+REDIRECTS = {301, 302, 303, 307, 308}
+MAX_HOPS = 5
+
+BLOCKED_URL_PARTS = (
+    # the Wayback toolbar (WAYBACK_CLEAN_JS deletes it afterwards anyway)
+    "/_static/js/bundle-playback", "/_static/js/ruffle", "/_static/js/wm.js",
+    "/_static/css/banner-styles", "/_static/css/iconochive", "/_static/images/toolbar",
+    # analytics and font trackers, live or archived
+    "google-analytics.com", "googletagmanager.com", "analytics.archive.org", "doubleclick.net",
+    "scorecardresearch.com", "quantserve.com", "hotjar.com", "p.typekit.net", "connect.facebook.net",
+)
+
+# headers that describe the transfer, not the body (Playwright already hands me the decoded body)
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+def _connect(cache_dir):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(str(cache_dir / "index.sqlite"), timeout=30)
+    con.execute("CREATE TABLE IF NOT EXISTS assets (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, content_type TEXT)")
+    return con
+
+def is_blocked(url):
+    return any(part in url for part in BLOCKED_URL_PARTS)
+
+def make_route_handler(cache_dir=ASSET_DIR):
+    """
+    Returns (handler, stats, close). Use it as `await context.route("**/*", handler)`.
+    - blocked URLs are aborted
+    - archived assets are served from the disk cache when I already have them; Wayback's redirects to the
+      nearest capture are followed by hand, so a different timestamp of the same asset still hits the cache
+    - everything else goes to the network as usual
+    """
+    cache_dir = Path(cache_dir)
+    blob_dir = cache_dir / "blobs"
+    con = _connect(cache_dir)
+    stats = {"hits": 0, "misses": 0, "blocked": 0, "bytes_from_cache": 0, "bytes_downloaded": 0}
+
+    def lookup(url):
+        row = con.execute("SELECT sha256, content_type FROM assets WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        path = blob_dir / row[0][:2] / row[0]
+        return (path.read_bytes(), row[1]) if path.exists() else None
+
+    def remember(urls, body, content_type):
+        sha = hashlib.sha256(body).hexdigest()
+        path = blob_dir / sha[:2] / sha
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(body)
+            tmp.replace(path)
+        con.executemany("INSERT OR REPLACE INTO assets VALUES (?, ?, ?)", [(u, sha, content_type) for u in urls])
+        con.commit()
+
+    async def serve(route, body, content_type):
+        stats["hits"] += 1
+        stats["bytes_from_cache"] += len(body)
+        headers = {"content-type": content_type} if content_type else {}
+        await route.fulfill(status=200, headers=headers, body=body)
+
+    async def handler(route):
+        request = route.request
+        url = request.url
+        if is_blocked(url):
+            stats["blocked"] += 1
+            await route.abort()
+            return
+        if request.method != "GET" or request.resource_type not in CACHED_TYPES or not ARCHIVED_ASSET.search(url):
+            await route.continue_()
+            return
+
+        cached = lookup(url)
+        if cached:
+            await serve(route, *cached)
+            return
+
+        # Wayback answers /web/<requested ts>/... with a redirect to the capture it really has
+        seen = [url]
+        try:
+            resp = await route.fetch(max_redirects=0)
+            while resp.status in REDIRECTS and len(seen) <= MAX_HOPS and resp.headers.get("location"):
+                target = urljoin(seen[-1], resp.headers["location"])
+                cached = lookup(target)
+                if cached:
+                    remember(seen, *cached)
+                    await serve(route, *cached)
+                    return
+                seen.append(target)
+                resp = await route.fetch(url=target, max_redirects=0)
+            body = await resp.body()
+        except Exception:
+            # if my own fetch fails, the browser gets to try it the normal way
+            await route.continue_()
+            return
+
+        stats["misses"] += 1
+        stats["bytes_downloaded"] += len(body)
+        headers = {k: v for k, v in resp.headers.items() if k.lower() not in DROP_HEADERS}
+        if resp.status == 200:
+            remember(seen, body, resp.headers.get("content-type"))
+        await route.fulfill(status=resp.status, headers=headers, body=body)
+
+    return handler, stats, con.close
+
+def report(stats, snapshots=0):
+    """Prints the hit rate and how many bytes came from the cache vs. the network."""
+    total = stats["hits"] + stats["misses"]
+    rate = 100 * stats["hits"] / total if total else 0.0
+    mb = 1024 * 1024
+    print(f"[INFO] Asset cache: {stats['hits']} hit(s), {stats['misses']} miss(es) ({rate:.0f}% hit rate), "
+          f"{stats['blocked']} blocked, {stats['bytes_from_cache'] / mb:.1f} MB from cache, "
+          f"{stats['bytes_downloaded'] / mb:.1f} MB downloaded")
+    if snapshots:
+        print(f"[INFO] Downloaded {stats['bytes_downloaded'] / mb / snapshots:.2f} MB of assets per snapshot")
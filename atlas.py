@@ -0,0 +1,148 @@
+import json
+from pathlib import Path
+import numpy as np
+import pygame
+import image_codecs
+from process_images import MEDIA_DIR, saved_pair, screenshot_index
+from regions import load_regions, regions_path
+
+# All frames and glitch overlays, already scaled to the viewer's image area, in one big file of raw RGB pixels.
+# The viewer memory-maps it and its loader thread copies the pixels out, so scrubbing through
+# a long timeline never decodes a PNG or scales anything. index.json says where each picture starts.
+ATLAS_DIR = Path("media/atlas")
+COMPACT_WASTE = 0.5   # rewrite the file when more than half of it belongs to frames that are gone
+
+def fit(size, max_size):
+    """The size an image gets when it is scaled to fit into max_size, and its offset to be centered."""
+    iw, ih = size
+    mw, mh = max_size
+    scale = min(mw / iw, mh / ih)
+    new_size = (int(iw * scale), int(ih * scale))
+    return new_size, ((mw - new_size[0]) // 2, (mh - new_size[1]) // 2)
+
+def scaled_pixels(surf, size):
+    """The RGB bytes of a surface smoothscaled to `size` (works without a display)."""
+    return pygame.image.tobytes(pygame.transform.smoothscale(surf, size), "RGB")
+
+def glitch_surface(path):
+    arr = image_codecs.load_glitch(path)
+    return pygame.image.frombuffer(arr.tobytes(), (arr.shape[1], arr.shape[0]), "RGB")
+
+def load_index(atlas_dir=ATLAS_DIR):
+    try:
+        return json.loads((Path(atlas_dir) / "index.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def _signature(path):
+    st = path.stat()
+    return f"{path.name}:{st.st_size}:{st.st_mtime_ns}"
+
+def build_atlas(area, atlas_dir=ATLAS_DIR, media_dir=MEDIA_DIR):
+    """
+    Adds every frame and overlay of media_dir that isn't in the atlas yet (scaled to `area`, the viewer's
+    image area). Frames are stored once per pixel hash (see frame_store.py); overlays are redone when their
+    file changed.
+    """
+    atlas_dir = Path(atlas_dir)
+    atlas_dir.mkdir(parents=True, exist_ok=True)
+    data_file = atlas_dir / "atlas.bin"
+    old = load_index(atlas_dir)
+    if not old or old.get("area") != list(area) or not data_file.exists():
+        old = {"frames": {}, "overlays": {}}
+        data_file.unlink(missing_ok=True)
+
+    shots = screenshot_index(media_dir)
+    frames, overlays, added = {}, {}, 0
+    with open(data_file, "ab") as out:
+        offset = out.tell()
+
+        def append(pixels, size, pos):
+            nonlocal offset, added
+            out.write(pixels)
+            entry = [offset, size[0], size[1], pos[0], pos[1]]
+            offset += len(pixels)
+            added += 1
+            return entry
+
+        for path, digest in shots:
+            if digest in frames:
+                continue
+            if digest in old["frames"]:
+                frames[digest] = old["frames"][digest]
+                continue
+            surf = pygame.image.load(str(path))
+            size, pos = fit(surf.get_size(), area)
+            frames[digest] = append(scaled_pixels(surf, size), size, pos)
+
+        for (path_a, hash_a), (path_b, hash_b) in zip(shots, shots[1:]):
+            if hash_a == hash_b:
+                continue
+            glitch_path, mask_path = saved_pair(path_a.stem, path_b.stem, media_dir)
+            if not glitch_path:
+                continue
+            index = load_regions(regions_path(mask_path)) if mask_path else None
+            if index and index["changed_pixels"] == 0:
+                continue
+            name, sig = f"{path_a.stem}__{path_b.stem}", _signature(glitch_path)
+            prev = old["overlays"].get(name)
+            if prev and prev[5] == sig:
+                overlays[name] = prev
+                continue
+            # like the viewer always did: the overlay gets the size and position of frame A
+            _, w, h, x, y = frames[hash_a]
+            overlays[name] = append(scaled_pixels(glitch_surface(glitch_path), (w, h)), (w, h), (x, y)) + [sig]
+
+    used = sum(e[1] * e[2] * 3 for e in list(frames.values()) + list(overlays.values()))
+    if offset and used < (1 - COMPACT_WASTE) * offset:
+        _compact(data_file, frames, overlays)
+
+    index = {"area": list(area), "frames": frames, "overlays": overlays}
+    tmp = atlas_dir / "index.json.tmp"
+    tmp.write_text(json.dumps(index), encoding="utf-8")
+    tmp.replace(atlas_dir / "index.json")
+    print(f"[INFO] Atlas: {len(frames)} frame(s), {len(overlays)} overlay(s), {added} new, "
+          f"{data_file.stat().st_size / 1024 / 1024:.0f} MB")
+    return index
+
+def _compact(data_file, frames, overlays):
+    """Copies only the pictures still in use into a new file (offsets in the entries are updated)."""
+    old = np.memmap(data_file, dtype=np.uint8, mode="r")
+    tmp = data_file.with_suffix(".tmp")
+    with open(tmp, "wb") as out:
+        for entry in list(frames.values()) + list(overlays.values()):
+            n = entry[1] * entry[2] * 3
+            start = out.tell()
+            out.write(old[entry[0]:entry[0] + n])
+            entry[0] = start
+    del old
+    tmp.replace(data_file)
+
+class Atlas:
+    """The memory-mapped atlas, as the viewer uses it."""
+    def __init__(self, index, data):
+        self.index = index
+        self.data = data
+
+    def _pixels(self, entry):
+        offset, w, h, x, y = entry[:5]
+        # a real copy on the loader thread: reading it is what pulls the pages in from disk. A surface
+        # straight on the mapped bytes would only move that read to convert() in the render loop
+        return bytes(self.data[offset:offset + w * h * 3]), (w, h), (x, y)
+
+    def frame_pixels(self, digest):
+        """(RGB bytes, size, position) of a frame, or None."""
+        entry = self.index["frames"].get(digest)
+        return self._pixels(entry) if entry else None
+
+    def overlay_pixels(self, stem_a, stem_b):
+        entry = self.index["overlays"].get(f"{stem_a}__{stem_b}")
+        return self._pixels(entry) if entry else None
+
+def open_atlas(area, atlas_dir=ATLAS_DIR):
+    """The atlas for `area`, or None if there is none (or it was built for another window size)."""
+    index = load_index(atlas_dir)
+    data_file = Path(atlas_dir) / "atlas.bin"
+    if not index or index.get("area") != list(area) or not data_file.exists() or data_file.stat().st_size == 0:
+        return None
+    return Atlas(index, np.memmap(data_file, dtype=np.uint8, mode="r"))
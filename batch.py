@@ -0,0 +1,162 @@
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from dateutil import parser
+from playwright.async_api import async_playwright
+from atlas import ATLAS_DIR, build_atlas
+from get_url import CDX_WORKERS, get_snapshots, screenshot_digests
+from helper import clean_domain
+from manifest import MANIFEST_FILE
+import metrics
+from pipeline import capture_and_analyse_all
+from process_images import ANALYSIS_WORKERS, analyse_all, media_dirs
+from resolve import REDIRECT_CACHE, resolve_snapshots
+from selection import select_urls
+from thumbnails import THUMB_DIR, build_thumbnails
+from viewer import IMAGE_AREA
+
+# Many domains in one run, without any questions asked (for a scheduler, e.g. a nightly cron job).
+# Every domain gets its own directory, runs/<domain>/media (screenshots, masks, glitches, atlas, ...) and
+# runs/<domain>/data (URL list, capture manifest, redirects), so nothing is shared except the caches that
+# are meant to be shared (CDX cache, asset cache). Domains run at the same time, but under global limits:
+# one semaphore for the CDX requests, one browser with a limited number of open pages, and one pool of
+# analysis processes.
+BATCH_DIR = Path("runs")
+DOMAIN_LIMIT = 8       # domains in progress at the same time
+PAGE_LIMIT = 8         # browser pages open at the same time, over all domains
+DEFAULTS = {
+    "start": None,            # None: earliest / today
+    "end": None,
+    "frequency_days": 1,
+    "select": "even",         # see selection.select_urls
+    "max_snaps": 5,
+    "viewport": [1280, 800],
+    "retries": 2,
+    "readiness": "stable",
+    "atlas": True,            # build the viewer's atlas and thumbnails right away
+}
+
+def load_jobs(path, defaults=None):
+    """
+    Reads a job file: a JSON list of domains, either plain strings or objects with "domain" and any key of
+    DEFAULTS, or an object {"defaults": {...}, "jobs": [...]}. Returns one complete dict per domain.
+    """
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    base = dict(DEFAULTS, **(defaults or {}))
+    if isinstance(data, dict):
+        base.update(data.get("defaults", {}))
+        data = data.get("jobs", [])
+    return [make_job(entry if isinstance(entry, dict) else {"domain": entry}, base) for entry in data]
+
+def make_job(entry, defaults=None):
+    job = dict(DEFAULTS, **(defaults or {}))
+    job.update({k: v for k, v in entry.items() if v is not None})
+    unknown = set(job) - set(DEFAULTS) - {"domain"}
+    if unknown or not job.get("domain"):
+        raise ValueError(f"Bad job {entry}: " + (f"unknown keys {sorted(unknown)}" if unknown else "no domain"))
+    job["domain"] = clean_domain(job["domain"])
+    return job
+
+def job_dirs(job, root=BATCH_DIR):
+    """The media and data directory of a domain."""
+    base = Path(root) / job["domain"].replace("/", "_").replace(":", "_")
+    return base / "media", base / "data"
+
+def date_range(job):
+    """The job's dates in CDX form (YYYYMMDD), parsed as flexibly as main.py does."""
+    start = parser.parse(str(job["start"])).strftime("%Y%m%d") if job["start"] else "19960101"
+    end = parser.parse(str(job["end"])).strftime("%Y%m%d") if job["end"] else date.today().strftime("%Y%m%d")
+    return start, end
+
+class Limits:
+    """What all domains of a batch share."""
+    def __init__(self, domains, cdx, analysis_workers, page_limit, browser=None):
+        self.domains = asyncio.Semaphore(domains)
+        self.cdx = threading.BoundedSemaphore(cdx)
+        self.pages = asyncio.Semaphore(page_limit)
+        self.browser = browser
+        self.analysis_workers = analysis_workers
+        self.analysis = threading.BoundedSemaphore(analysis_workers)   # pairs diffed while capturing
+        # pairs left over after capturing; forkserver, because forking this process would copy the browser's threads
+        self.pool = ProcessPoolExecutor(analysis_workers, mp_context=multiprocessing.get_context("forkserver"))
+
+async def run_domain(job, limits, root=BATCH_DIR):
+    """All steps of main.py for one domain, without the viewer. Returns a summary dict (never raises)."""
+    domain = job["domain"]
+    media_dir, data_dir = job_dirs(job, root)
+    summary = {"domain": domain, "media": str(media_dir), "found": 0, "used": 0, "saved": 0, "skipped": 0,
+               "pairs": 0, "error": None}
+    async with limits.domains:
+        with metrics.span("batch.domain", domain=domain) as span:
+            started = time.perf_counter()
+            try:
+                data_dir.mkdir(parents=True, exist_ok=True)
+                start_date, end_date = date_range(job)
+                urls = await asyncio.to_thread(
+                    get_snapshots, domain=domain, start_date=start_date, end_date=end_date,
+                    frequency_days=job["frequency_days"], skip_digests=screenshot_digests(media_dirs(media_dir)[0]),
+                    limiter=limits.cdx)
+                summary["found"] = len(urls)
+                urls = select_urls(urls, job["select"], job["max_snaps"])
+                urls = await asyncio.to_thread(resolve_snapshots, urls, data_dir / REDIRECT_CACHE.name)
+                summary["used"] = len(urls)
+                (data_dir / "snapshot_urls.txt").write_text("\n".join(urls), encoding="utf-8")
+                print(f"[{domain}] {summary['found']} snapshot(s) found, using {len(urls)}")
+
+                if urls:
+                    saved, skipped, pairs = await capture_and_analyse_all(
+                        urls, media_dir, analysis_slots=limits.analysis, browser=limits.browser,
+                        page_limit=limits.pages, manifest_file=data_dir / MANIFEST_FILE.name,
+                        viewport=tuple(job["viewport"]), retries=job["retries"], readiness=job["readiness"])
+                    summary.update(saved=len(saved), skipped=len(skipped), pairs=pairs)
+
+                await asyncio.to_thread(analyse_all, workers=limits.analysis_workers, media_dir=media_dir,
+                                        pool=limits.pool)
+                if job["atlas"]:
+                    await asyncio.to_thread(build_atlas, IMAGE_AREA, media_dir / ATLAS_DIR.name, media_dir)
+                    await asyncio.to_thread(build_thumbnails, media_dir / THUMB_DIR.name, media_dir)
+            except Exception as e:
+                # one broken domain shouldn't stop the others
+                summary["error"] = f"{type(e).__name__}: {e}"
+                print(f"[{domain}] ERROR: {summary['error']}")
+                span.set(error=summary["error"])
+                metrics.count("batch.failed_domains")
+            summary["seconds"] = round(time.perf_counter() - started, 1)
+            print(f"[{domain}] done in {summary['seconds']}s: {summary['saved']} screenshot(s), "
+                  f"{summary['skipped']} skipped, {summary['pairs']} pair(s)")
+    return summary
+
+async def run_batch_async(jobs, root=BATCH_DIR, domains=DOMAIN_LIMIT, cdx=CDX_WORKERS,
+                          analysis_workers=ANALYSIS_WORKERS, pages=PAGE_LIMIT, headless=True):
+    # the blocking steps run on threads; every domain can hold a few at once (CDX, queue hand-over, analysis)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(domains * 4 + 8))
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless)
+        limits = Limits(domains, cdx, analysis_workers, pages, browser)
+        try:
+            return await asyncio.gather(*(run_domain(job, limits, root) for job in jobs))
+        finally:
+            limits.pool.shutdown()
+            await browser.close()
+
+def run_batch(jobs, root=BATCH_DIR, domains=DOMAIN_LIMIT, cdx=CDX_WORKERS, analysis_workers=ANALYSIS_WORKERS,
+              pages=PAGE_LIMIT, headless=True):
+    """
+    Runs all jobs (see load_jobs/make_job) and writes root/batch_summary.json.
+    Returns the number of domains that failed.
+    """
+    started = time.perf_counter()
+    results = asyncio.run(run_batch_async(jobs, root, domains, cdx, analysis_workers, pages, headless))
+    failed = [r["domain"] for r in results if r["error"]]
+    Path(root).mkdir(parents=True, exist_ok=True)
+    (Path(root) / "batch_summary.json").write_text(json.dumps(
+        {"seconds": round(time.perf_counter() - started, 1), "failed": failed, "domains": results}, indent=1),
+        encoding="utf-8")
+    print(f"\n[INFO] Batch: {len(results) - len(failed)} of {len(results)} domain(s) done"
+          + (f", failed: {', '.join(failed)}" if failed else "") + f" (summary in {Path(root) / 'batch_summary.json'})")
+    return len(failed)
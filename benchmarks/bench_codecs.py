@@ -0,0 +1,61 @@
+import io
+import tempfile
+from pathlib import Path
+import numpy as np
+from common import measure, page, record
+import image_codecs
+
+# Encode time, decode time and size of every mask and glitch codec in image_codecs.py,
+# on synthetic page-like frames (flat blocks with a bit of "text" noise) with a changed band.
+RESOLUTIONS = [(1280, 800), (1920, 1080), (1280, 6000)]
+REPEAT = 3
+
+def mask_for(w, h, rng):
+    mask = np.zeros((h, w), dtype=bool)
+    top = h // 5
+    mask[top:top + h // 6] = rng.random((h // 6, w)) < 0.7
+    return mask
+
+def run(kind, data, codecs, write, load, tmp, repeat):
+    results = []
+    for codec, suffix in codecs.items():
+        def encode():
+            buf = io.BytesIO()
+            write(data, buf, codec)
+            return buf.getvalue()
+        enc, blob = measure(encode, repeat, warmup=0)
+        path = tmp / f"bench_{kind}{suffix}"
+        path.write_bytes(blob)
+        dec, decoded = measure(lambda: load(path), repeat, warmup=0)
+        assert np.array_equal(decoded, data), f"{kind} codec {codec} is not lossless"
+        path.unlink()
+        case = f"{data.shape[1]}x{data.shape[0]}/{kind}/{codec}"
+        results.append(record("codec_encode", case, enc, kb=len(blob) / 1024))
+        results.append(record("codec_decode", case, dec))
+    return results
+
+def collect(resolutions=RESOLUTIONS, repeat=REPEAT):
+    """The result records for run_all.py: encode and decode time (and size) per resolution, kind and codec."""
+    rng = np.random.default_rng(0)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for w, h in resolutions:
+            results += run("mask", mask_for(w, h, rng), image_codecs.MASK_SUFFIXES,
+                           image_codecs.write_mask, image_codecs.load_mask, Path(tmp), repeat)
+            results += run("glitch", page(w, h, rng), image_codecs.GLITCH_SUFFIXES,
+                           image_codecs.write_glitch, image_codecs.load_glitch, Path(tmp), repeat)
+    return results
+
+def main():
+    print(f"{'resolution':>12} {'what':>7} {'codec':>9} {'enc ms':>8} {'dec ms':>8} {'KB':>9}")
+    last = None
+    results = collect()
+    for enc, dec in zip(results[::2], results[1::2]):
+        resolution, kind, codec = enc["case"].split("/")
+        if resolution != last:
+            print(f"{resolution:>12}")
+            last = resolution
+        print(f"{'':>12} {kind:>7} {codec:>9} {enc['best'] * 1000:8.1f} {dec['best'] * 1000:8.1f} {enc['kb']:9.0f}")
+
+if __name__ == "__main__":
+    main()
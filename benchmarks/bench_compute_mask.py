@@ -0,0 +1,54 @@
+import tracemalloc
+import numpy as np
+from common import measure, record   # also puts the repo root on sys.path
+from process_images import diff_mask
+
+# Old diff (int64 copies + np.abs temporary) vs. the uint8 kernel in process_images.diff_mask,
+# on synthetic frames: time per pair and the peak memory the diff itself allocates.
+RESOLUTIONS = [(1280, 800), (1920, 1080), (2560, 1440), (1280, 6000)]   # the last one is a full-page capture
+STRIPS = [None, 256, 64]
+REPEAT = 5
+
+def old_diff(arr_a, arr_b, threshold=15):
+    return np.abs(arr_a.astype(int) - arr_b.astype(int)).max(axis=2) > threshold
+
+def frames(w, h, changed=0.2, seed=0):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    b = a.copy()
+    rows = int(h * changed)
+    b[:rows] = rng.integers(0, 256, (rows, w, 3), dtype=np.uint8)
+    return a, b
+
+def peak_memory(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def collect(resolutions=RESOLUTIONS, repeat=REPEAT):
+    """The result records (see common.record) for run_all.py, one per resolution and kernel."""
+    results = []
+    for w, h in resolutions:
+        a, b = frames(w, h)
+        times, reference = measure(lambda: old_diff(a, b), repeat)
+        results.append(record("diff_kernel", f"{w}x{h}/int64", times,
+                              peak_mb=peak_memory(lambda: old_diff(a, b)) / 2 ** 20, frame_mb=a.nbytes / 2 ** 20))
+        for strip in STRIPS:
+            times, mask = measure(lambda: diff_mask(a, b, 15, strip), repeat)
+            assert np.array_equal(mask, reference), "uint8 kernel must give the same mask"
+            results.append(record("diff_kernel", f"{w}x{h}/uint8/{strip or 'full'}", times,
+                                  peak_mb=peak_memory(lambda: diff_mask(a, b, 15, strip)) / 2 ** 20,
+                                  frame_mb=a.nbytes / 2 ** 20))
+    return results
+
+def main():
+    print(f"{'resolution':>12} {'kernel':>12} {'ms':>8} {'peak MB':>8} {'x frame':>8}")
+    for r in collect():
+        resolution, kernel = r["case"].split("/", 1)
+        print(f"{resolution if kernel == 'int64' else '':>12} {kernel:>12} {r['best'] * 1000:8.1f} "
+              f"{r['peak_mb']:8.1f} {r['peak_mb'] / r['frame_mb']:8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import numpy as np
+from common import measure, record
+from glitch import GlitchRenderer
+from process_images import shift
+
+# The old make_glitch (six shift() copies + boolean mask indexing) vs. glitch.GlitchRenderer,
+# on synthetic frames with different amounts of change. Only the array work is timed, no PIL conversions.
+RESOLUTIONS = [(1280, 800), (1920, 1080), (1280, 6000)]
+DENSITIES = [0.01, 0.2, 0.5, 1.0]   # share of changed pixels, spread over the whole frame
+BANDS = [0.1, 0.3]                   # or all changes in one band of rows (a new header, a new banner)
+REPEAT = 7
+
+def old_glitch(arr_a, arr_b, mask):
+    shifted_a = [shift(arr_a[..., 0], dx=-10), shift(arr_a[..., 1], dy=10), shift(arr_a[..., 2], dx=10)]
+    shifted_b = [shift(arr_b[..., 0], dx=10), shift(arr_b[..., 1], dy=10), shift(arr_b[..., 2], dx=10)]
+    out = arr_b.copy()
+    for c in range(3):
+        out[..., c][mask] = ((shifted_a[c][mask] + shifted_b[c][mask]) // 2).astype(np.uint8)
+    return out
+
+def masks(rng, h, w):
+    for density in DENSITIES:
+        yield f"{density:.0%}", rng.random((h, w)) < density
+    for band in BANDS:
+        mask = np.zeros((h, w), dtype=bool)
+        mask[h // 4:h // 4 + int(h * band)] = True
+        yield f"band {band:.0%}", mask
+
+def collect(resolutions=RESOLUTIONS, repeat=REPEAT):
+    """The result records for run_all.py: the old and the new glitch per resolution and amount of change."""
+    rng = np.random.default_rng(0)
+    renderer = GlitchRenderer()
+    results = []
+    for w, h in resolutions:
+        a = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        b = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        for changed, mask in masks(rng, h, w):
+            assert np.array_equal(old_glitch(a, b, mask), renderer.render(a, b, mask)), "default preset must match"
+            for name, fn in (("old", old_glitch), ("new", renderer.render)):
+                times, _ = measure(lambda: fn(a, b, mask), repeat)
+                results.append(record("glitch_kernel", f"{w}x{h}/{changed}/{name}", times))
+    return results
+
+def main():
+    print(f"{'resolution':>12} {'changed':>9} {'old ms':>8} {'new ms':>8} {'speedup':>8}")
+    results = collect()
+    for old, new in zip(results[::2], results[1::2]):
+        resolution, changed, _ = old["case"].split("/")
+        t_old, t_new = old["best"], new["best"]
+        print(f"{resolution:>12} {changed:>9} {t_old * 1000:8.1f} {t_new * 1000:8.1f} {t_old / t_new:7.1f}x")
+
+if __name__ == "__main__":
+    main()
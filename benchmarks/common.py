@@ -0,0 +1,108 @@
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+# What all benchmarks share: synthetic page-like screenshots (fixed seeds, so every run times the same pixels),
+# timing with a warm-up and best/median of several runs, and the result records run_all.py writes to JSON.
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "test"))   # for cdx_fake_server
+
+TILE = 32   # changes are whole tiles of this many pixels, like boxes, images and lines of text that changed
+
+def page(w, h, rng):
+    """A page-like frame: light background, a few flat boxes (headers, images) and a bit of "text" noise."""
+    img = np.full((h, w, 3), 245, dtype=np.uint8)
+    for _ in range(12):
+        y, x = rng.integers(0, h - 50), rng.integers(0, w - 50)
+        img[y:y + rng.integers(20, h // 4), x:x + rng.integers(20, w // 2)] = rng.integers(0, 256, 3)
+    text = rng.random((h, w)) < 0.04
+    img[text] = 30
+    return img
+
+def change(frame, density, rng):
+    """A copy of `frame` where about `density` of the area (in TILE x TILE tiles) has new content."""
+    out = frame.copy()
+    h, w = frame.shape[:2]
+    rows, cols = -(-h // TILE), -(-w // TILE)
+    picked = np.flatnonzero(rng.random(rows * cols) < density)
+    for tile in picked:
+        y, x = divmod(int(tile), cols)
+        block = out[y * TILE:(y + 1) * TILE, x * TILE:(x + 1) * TILE]
+        block[:] = rng.integers(0, 256, 3)
+        block[rng.random(block.shape[:2]) < 0.1] = 30
+    return out
+
+def sequence(n, w, h, density, seed=0):
+    """n screenshots in a row, every one changed from the one before by `density`."""
+    rng = np.random.default_rng(seed)
+    frames = [page(w, h, rng)]
+    while len(frames) < n:
+        frames.append(change(frames[-1], density, rng))
+    return frames
+
+def timestamps(n, start=datetime(2010, 1, 1), step=timedelta(days=30)):
+    return [(start + i * step).strftime("%Y%m%d%H%M%S") for i in range(n)]
+
+def write_screenshots(frames, screenshot_dir):
+    """Saves the frames as <timestamp>.png, the way capture.py names them. Returns the paths."""
+    screenshot_dir = Path(screenshot_dir)
+    screenshot_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for ts, frame in zip(timestamps(len(frames)), frames):
+        path = screenshot_dir / f"{ts}.png"
+        Image.fromarray(frame).save(path, compress_level=1)
+        paths.append(path)
+    return paths
+
+def measure(fn, repeat=5, setup=None, warmup=1):
+    """
+    Runs fn() `warmup` + `repeat` times (with `setup()` before every run, not timed) and returns
+    (seconds of every timed run, the last result).
+    """
+    times, result = [], None
+    for i in range(warmup + repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed)
+    return times, result
+
+def record(group, case, times, **extra):
+    """One result line: the best run is what gets compared, the median and spread show how noisy it was."""
+    return {"group": group, "case": case, "best": min(times), "median": statistics.median(times),
+            "runs": len(times), **extra}
+
+def skipped(group, reason):
+    return {"group": group, "case": "*", "skipped": reason}
+
+@contextlib.contextmanager
+def quiet():
+    """Swallows the progress prints of the functions being timed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+@contextlib.contextmanager
+def scratch_dir():
+    """
+    A temporary working directory: the code under test writes to relative paths (data/..., media/...),
+    so everything it creates (caches, manifests, screenshots) ends up in here and is gone afterwards.
+    """
+    old = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="wtc-bench-") as tmp:
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(old)
@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from common import ROOT, measure, quiet, record, scratch_dir, sequence, skipped, timestamps, write_screenshots
+import bench_codecs
+import bench_compute_mask
+import bench_glitch
+import cdx_fake_server
+import wayback_server
+from process_images import ANALYSIS_WORKERS, analyse_all, compute_mask, make_glitch, media_dirs, shift
+from get_url import get_snapshots
+from selection import parse_timestamps, thin_by_gap
+
+# All benchmarks in one run, with the results in one JSON file so two runs (before/after a change,
+# or this machine against a saved baseline) can be compared case by case:
+#     python benchmarks/run_all.py --out before.json
+#     ... change something ...
+#     python benchmarks/run_all.py --baseline before.json
+# Everything works on generated data with fixed seeds: page-like screenshots with a given share of
+# changed tiles, a fake CDX server (test/cdx_fake_server.py) with up to a million rows, and a fake
+# Wayback Machine (wayback_server.py) with slow assets for the capture, also captured with 1, 2, 4 and 8
+# pages at once to see how the throughput scales. --quick runs the small cases only.
+RESOLUTIONS = [(1280, 800), (1920, 1080), (1280, 6000)]
+DENSITIES = [0.01, 0.1, 0.5]        # share of the page that changes from one screenshot to the next
+SEQUENCE = 8                        # screenshots per analyse_all run
+CDX_ROWS = [100_000, 1_000_000]
+CDX_FREQUENCY_DAYS = 7
+CAPTURE_SNAPSHOTS = 8
+CAPTURE_ASSETS = 6
+ASSET_DELAY = 0.2                   # seconds the fake Wayback Machine takes per asset
+CONCURRENCY_SWEEP = [1, 2, 4, 8]    # pages open at once; pages/s should grow about as fast as this
+SWEEP_SNAPSHOTS = 16                # per sweep run, so even the biggest N gets two rounds
+TOLERANCE = 0.25                    # slower than the baseline by more than this counts as a regression
+REPEAT = 5
+
+def analysis(quick):
+    """compute_mask, shift, make_glitch on one pair and analyse_all on a sequence, per resolution and change."""
+    results = []
+    repeat = 3 if quick else REPEAT
+    for w, h in RESOLUTIONS[:1] if quick else RESOLUTIONS:
+        for density in DENSITIES:
+            case = f"{w}x{h}/{density:.0%}"
+            frames = sequence(SEQUENCE, w, h, density, seed=1)
+            img_a, img_b = Image.fromarray(frames[0]), Image.fromarray(frames[1])
+
+            times, (mask, a, b) = measure(lambda: compute_mask(img_a, img_b), repeat)
+            results.append(record("compute_mask", case, times, changed=float(mask.mean())))
+            times, _ = measure(lambda: make_glitch(a, b, mask), repeat)
+            results.append(record("make_glitch", case, times))
+            if density == DENSITIES[0]:
+                channel = np.ascontiguousarray(frames[0][..., 0])
+                times, _ = measure(lambda: shift(channel, dy=10, dx=-10), repeat)
+                results.append(record("shift", f"{w}x{h}", times))
+
+            # a fresh media directory per run: screenshots only, the frame store, masks and glitches are rebuilt
+            with scratch_dir() as tmp:
+                media = tmp / "media"
+                write_screenshots(frames, media_dirs(media)[0])
+
+                def reset():
+                    for d in media_dirs(media)[1:]:
+                        shutil.rmtree(d, ignore_errors=True)
+
+                for workers in sorted({1, ANALYSIS_WORKERS}):
+                    def run():
+                        with quiet():
+                            analyse_all(workers=workers, media_dir=media)
+                    times, _ = measure(run, 2 if quick else 3, setup=reset, warmup=0)
+                    results.append(record("analyse_all", f"{case}/{workers}w", times, pairs=len(frames) - 1,
+                                          per_pair=min(times) / (len(frames) - 1)))
+    return results
+
+def cdx(quick):
+    """get_snapshots against the fake CDX server (streamed, filling the cache, from the cache) and the thinning alone."""
+    results = []
+    for n in CDX_ROWS[:1] if quick else CDX_ROWS:
+        stamps = cdx_fake_server.make_timestamps(n, step_seconds=600)
+        times, keep = measure(lambda: thin_by_gap(parse_timestamps(stamps), CDX_FREQUENCY_DAYS), REPEAT)
+        results.append(record("thin", f"{n}rows", times, kept=int(keep.size)))
+
+        server, cdx_url = cdx_fake_server.start_server(cdx_fake_server.make_rows(stamps))
+        try:
+            with scratch_dir() as tmp:
+                def fetch(use_cache):
+                    with quiet():
+                        return get_snapshots("example.com", "19960101", "20301231", CDX_FREQUENCY_DAYS,
+                                             cdx_url=cdx_url, use_cache=use_cache, include_www=False)
+
+                def drop_cache():
+                    for f in (tmp / "data").glob("cdx_cache.sqlite*"):
+                        f.unlink()
+
+                repeat = 1 if n >= 1_000_000 else 3
+                times, urls = measure(lambda: fetch(False), repeat, warmup=0)
+                results.append(record("get_snapshots", f"{n}rows/stream", times, urls=len(urls), rows_per_s=n / min(times)))
+                times, _ = measure(lambda: fetch(True), repeat, setup=drop_cache, warmup=0)
+                results.append(record("get_snapshots", f"{n}rows/cache_fill", times))
+                times, cached = measure(lambda: fetch(True), repeat, warmup=0)
+                assert cached == urls, "the cache must give the same snapshots"
+                results.append(record("get_snapshots", f"{n}rows/cache_warm", times))
+        finally:
+            server.shutdown()
+            server.server_close()
+        del stamps
+    return results
+
+async def _browser_works():
+    from playwright.async_api import async_playwright
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        await browser.close()
+
+def capture(quick):
+    """
+    capture_all against the fake Wayback Machine, with an empty and with a filled asset cache, and then
+    with CONCURRENCY_SWEEP pages at once (asset cache off, so every page waits for its assets).
+    """
+    try:
+        from capture import capture_all
+        asyncio.run(_browser_works())
+    except Exception as e:
+        return [skipped("capture", f"no browser: {str(e).splitlines()[0]}")]
+
+    results = []
+    n = 4 if quick else CAPTURE_SNAPSHOTS
+    server, base = wayback_server.start_server(assets=CAPTURE_ASSETS, asset_delay=ASSET_DELAY)
+    stats = server.RequestHandlerClass.stats
+    urls = wayback_server.snapshot_urls(base, timestamps(n))
+    try:
+        with scratch_dir() as tmp:
+            for readiness in ("stable", "load"):
+                def run():
+                    out = tmp / "shots"
+                    shutil.rmtree(out, ignore_errors=True)
+                    with quiet():
+                        return asyncio.run(capture_all(urls, out, readiness=readiness, manifest_file=None))
+
+                def drop_assets():
+                    shutil.rmtree(tmp / "data" / "asset_cache", ignore_errors=True)
+
+                before = stats["assets"]
+                times, (saved, failed) = measure(run, 1 if quick else 2, setup=drop_assets, warmup=0)
+                results.append(record("capture", f"{n}snaps/{readiness}/cold", times, saved=len(saved),
+                                      failed=len(failed), per_snapshot=min(times) / n,
+                                      assets_fetched=(stats["assets"] - before) // len(times)))
+                before = stats["assets"]
+                times, (saved, failed) = measure(run, 1 if quick else 2, warmup=0)
+                results.append(record("capture", f"{n}snaps/{readiness}/warm", times, saved=len(saved),
+                                      failed=len(failed), per_snapshot=min(times) / n,
+                                      assets_fetched=(stats["assets"] - before) // len(times)))
+
+            sweep = wayback_server.snapshot_urls(base, timestamps(SWEEP_SNAPSHOTS // 2 if quick else SWEEP_SNAPSHOTS))
+            serial = None
+            for concurrency in CONCURRENCY_SWEEP:
+                def run():
+                    out = tmp / "sweep"
+                    shutil.rmtree(out, ignore_errors=True)
+                    with quiet():
+                        return asyncio.run(capture_all(sweep, out, concurrency=concurrency, use_asset_cache=False,
+                                                       manifest_file=None))
+
+                times, (saved, failed) = measure(run, 1 if quick else 2, warmup=0)
+                pages_per_s = len(sweep) / min(times)
+                serial = serial or pages_per_s
+                results.append(record("capture_scaling", f"{len(sweep)}snaps/{concurrency}pages", times,
+                                      concurrency=concurrency, saved=len(saved), failed=len(failed),
+                                      pages_per_s=pages_per_s, speedup=pages_per_s / serial))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+def kernels(quick):
+    """The older single-purpose benchmarks (diff kernel, glitch kernel, codecs)."""
+    resolutions = RESOLUTIONS[:1] if quick else RESOLUTIONS
+    return (bench_compute_mask.collect(resolutions, 3 if quick else bench_compute_mask.REPEAT)
+            + bench_glitch.collect(resolutions, 3 if quick else bench_glitch.REPEAT)
+            + bench_codecs.collect(resolutions, 2 if quick else bench_codecs.REPEAT))
+
+GROUPS = {"analysis": analysis, "cdx": cdx, "capture": capture, "kernels": kernels}
+
+def environment(quick):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"date": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": commit, "quick": quick,
+            "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Prints every case that is in both runs with its change against the baseline (best run against best run).
+    Returns the cases that got slower by more than `tolerance`.
+    """
+    old = {(r["group"], r["case"]): r for r in baseline["results"] if "best" in r}
+    regressions = []
+    print(f"\n{'group':>14} {'case':<28} {'baseline ms':>12} {'now ms':>10} {'change':>8}")
+    for r in results:
+        before = old.get((r["group"], r["case"]))
+        if before is None or "best" not in r:
+            continue
+        ratio = r["best"] / before["best"]
+        slower = ratio > 1 + tolerance
+        if slower:
+            regressions.append(r)
+        print(f"{r['group']:>14} {r['case']:<28} {before['best'] * 1000:12.1f} {r['best'] * 1000:10.1f} "
+              f"{ratio - 1:+8.0%}{'  <-- slower' if slower else ''}")
+    return regressions
+
+def main():
+    args = argparse.ArgumentParser(description="Runs the benchmarks and writes the results as JSON.")
+    args.add_argument("--only", nargs="+", choices=GROUPS, help="run only these groups")
+    args.add_argument("--quick", action="store_true", help="small cases only (a minute instead of many)")
+    args.add_argument("--out", default=str(ROOT / "benchmarks" / "results.json"), help="where the results go")
+    args.add_argument("--baseline", help="earlier results to compare against; exits with 1 on a regression")
+    args.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, 0.25 = 25%%")
+    opts = args.parse_args()
+
+    results = []
+    for name in opts.only or GROUPS:
+        started = time.perf_counter()
+        print(f"[INFO] Benchmark group {name} ...", flush=True)
+        results += GROUPS[name](opts.quick)
+        print(f"[INFO] ... done in {time.perf_counter() - started:.0f}s", flush=True)
+
+    for r in results:
+        if "skipped" in r:
+            print(f"{r['group']:>14} skipped: {r['skipped']}")
+        else:
+            print(f"{r['group']:>14} {r['case']:<28} {r['best'] * 1000:10.1f} ms (median {r['median'] * 1000:.1f})")
+
+    out = Path(opts.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"environment": environment(opts.quick), "results": results}, indent=1), encoding="utf-8")
+    print(f"[INFO] Results in {out}")
+
+    if opts.baseline:
+        baseline = json.loads(Path(opts.baseline).read_text(encoding="utf-8"))
+        if baseline.get("environment", {}).get("platform") != platform.platform():
+            print("[WARN] The baseline comes from a different machine, the numbers may not be comparable.")
+        regressions = compare(results, baseline, opts.tolerance)
+        if regressions:
+            print(f"[WARN] {len(regressions)} case(s) slower than the baseline by more than {opts.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import io
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from PIL import Image
+
+# A local stand-in for web.archive.org, so capture can be timed without the network (and without
+# hammering the real thing). It answers the URLs capture.py and asset_cache.py know:
+#   /web/<ts>/<url>             an archived page: the Wayback toolbar, some text that changes with <ts>,
+#                               and `assets` images plus a stylesheet and a script
+#   /web/<ts>im_/<url> (cs_, js_)  an archived asset: first a redirect to the one capture the asset "really" has
+#                               (like Wayback's redirect to the nearest capture), which then answers after `asset_delay`
+#
+# Run it with: python benchmarks/wayback_server.py 0.5
+# and open http://127.0.0.1:8766/web/20100101000000/http://example.com/
+ASSET_CAPTURE = "20090101000000"   # every asset redirects to this timestamp
+PAGE = re.compile(r"^/web/(\d{14})/(.*)$")
+ASSET = re.compile(r"^/web/(\d{14})(im_|cs_|js_)/(.*)$")
+
+def _image(k):
+    rng = np.random.default_rng(k)
+    pixels = np.repeat(np.repeat(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8), 10, 0), 10, 1)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "PNG")
+    return buf.getvalue()
+
+def page_html(ts, site, assets):
+    images = "".join(f'<img src="/web/{ts}im_/{site}img/{k}.png" width="160" height="120">' for k in range(assets))
+    return f"""<!DOCTYPE html>
+<html><head><title>{site} {ts}</title>
+<link rel="stylesheet" href="/web/{ts}cs_/{site}style.css">
+<script src="/web/{ts}js_/{site}app.js"></script></head>
+<body><div id="wm-ipp-base" style="height:60px;background:#333">Wayback toolbar</div>
+<h1>{site}</h1><p>Snapshot from {ts[:4]}-{ts[4:6]}-{ts[6:8]}, version {int(ts) % 97}.</p>
+<div class="gallery">{images}</div></body></html>""".encode("utf-8")
+
+def make_handler(assets=6, asset_delay=0.2, page_delay=0.0):
+    images = [_image(k) for k in range(assets)]
+    static = {"cs_": (b"body{font-family:sans-serif;margin:20px} img{margin:4px}", "text/css"),
+              "js_": (b"document.documentElement.dataset.ready = '1';", "application/javascript")}
+    stats = {"pages": 0, "assets": 0, "redirects": 0}
+    lock = threading.Lock()
+
+    class WaybackHandler(BaseHTTPRequestHandler):
+        def count(self, key):
+            with lock:
+                stats[key] += 1
+
+        def send(self, status, body=b"", content_type="text/plain", headers=()):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            asset = ASSET.match(self.path)
+            if asset:
+                ts, kind, url = asset.groups()
+                if ts != ASSET_CAPTURE:
+                    self.count("redirects")
+                    self.send(302, headers=[("Location", f"/web/{ASSET_CAPTURE}{kind}/{url}")])
+                    return
+                time.sleep(asset_delay)   # a slow, far away archive
+                self.count("assets")
+                if kind == "im_":
+                    number = re.search(r"img/(\d+)\.png$", url)
+                    k = int(number.group(1)) if number else 0
+                    self.send(200, images[k % len(images)], "image/png")
+                else:
+                    self.send(200, *static[kind])
+                return
+
+            found = PAGE.match(self.path)
+            if not found:
+                self.send(404, b"not archived")
+                return
+            time.sleep(page_delay)
+            self.count("pages")
+            ts, site = found.groups()
+            self.send(200, page_html(ts, site, assets), "text/html; charset=utf-8")
+
+        def log_message(self, *args):
+            pass
+
+    WaybackHandler.stats = stats
+    return WaybackHandler
+
+def start_server(port=0, assets=6, asset_delay=0.2, page_delay=0.0):
+    """
+    Starts the server in a background thread and returns (server, base_url); the request counts are in
+    server.RequestHandlerClass.stats.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(assets, asset_delay, page_delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def snapshot_urls(base_url, timestamps, site="http://example.com/"):
+    return [f"{base_url}/web/{ts}/{site}" for ts in timestamps]
+
+if __name__ == "__main__":
+    delay = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    server = ThreadingHTTPServer(("127.0.0.1", 8766), make_handler(asset_delay=delay))
+    print(f"Fake Wayback Machine with {delay}s per asset on http://127.0.0.1:8766/web/20100101000000/http://example.com/")
+    server.serve_forever()
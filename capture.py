@@ -0,0 +1,327 @@
+import asyncio
+import base64
+import hashlib
+import json
+from pathlib import Path
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
+from helper import snapshot_timestamp
+import asset_cache
+import manifest
+import metrics
+
+# The capture engine: screenshots several snapshots at the same time with async Playwright.
+# screenshot.py and screenshots.py both use it, so they behave the same way.
+
+CONCURRENCY = 4           # how many pages are open at the same time
+NAV_TIMEOUT_MS = 20_000   # budget for the full "load" event on the slow path
+IMAGES_TIMEOUT_MS = 10_000
+
+# "stable" readiness: instead of waiting for every last asset (or a fixed sleep), I take tiny frames of the
+# page in a loop and capture as soon as STABLE_FRAMES frames in a row look exactly the same.
+STABLE_FRAMES = 3
+STABLE_INTERVAL = 0.1     # seconds between two probe frames
+STABLE_MAX_SECONDS = 10   # hard upper bound, after that I take the screenshot anyway
+PROBE_SCALE = 0.25        # probe frames are 1/4 of the viewport size...
+PROBE_QUALITY = 20        # ...and low quality JPEGs, which is enough to see if something still changes
+
+# ChatGPT prompt: "Write a Python function that removes the Wayback Machine’s toolbar and banners from a webpage when
+# using Playwright. It should run JavaScript in page.evaluate() to select and delete all elements with IDs starting with wm-"
+WAYBACK_CLEAN_JS = """
+() => {
+  const selAll = (q) => document.querySelectorAll(q);
+  [...selAll('[id^="wm-"]'), ...selAll('#donato'), ...selAll('#banner')]
+    .forEach(el => el && el.remove());
+  if (document.body) document.body.style.marginTop = '0';
+}
+"""
+
+# "I used AI to write this particular part:
+# Inject a small JavaScript snippet into every page BEFORE it loads.
+# This removes Wayback Machine’s toolbar/banner and also disables CSS animations
+INIT_JS = """
+  document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[id^="wm-"], #donato, #banner')
+      .forEach(el => el.remove());
+    if (document.body) document.body.style.marginTop = '0';
+    const style = document.createElement('style');
+    style.type = 'text/css';
+    style.textContent = "*, *::before, *::after { animation: none !important; transition: none !important; }";
+    document.head.appendChild(style);
+  });
+"""
+
+# This part makes the script wait until all images report as fully loaded (img.complete)
+# and actually have pixels (naturalWidth > 0).
+IMAGES_LOADED_JS = "Array.from(document.images).every(img => img.complete && img.naturalWidth > 0)"
+
+async def _probe_frame(page, cdp):
+    """One cheap, low-resolution frame of the viewport (through the Chrome DevTools protocol if I can)."""
+    if cdp is not None:
+        size = page.viewport_size or {"width": 1280, "height": 800}
+        shot = await cdp.send("Page.captureScreenshot", {
+            "format": "jpeg", "quality": PROBE_QUALITY,
+            "clip": {"x": 0, "y": 0, "width": size["width"], "height": size["height"], "scale": PROBE_SCALE},
+        })
+        return base64.b64decode(shot["data"])
+    return await page.screenshot(type="jpeg", quality=PROBE_QUALITY)
+
+async def wait_until_stable(page, frames=STABLE_FRAMES, interval=STABLE_INTERVAL, max_seconds=STABLE_MAX_SECONDS):
+    """
+    Waits until `frames` probe frames in a row hash the same, but never longer than `max_seconds`.
+    Returns True if the page became stable, False if the time ran out.
+    """
+    try:
+        cdp = await page.context.new_cdp_session(page)
+    except Exception:
+        cdp = None   # not Chromium, so I fall back to normal (full size) screenshots
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_seconds
+    last, same = None, 0
+    try:
+        while loop.time() < deadline:
+            digest = hashlib.blake2b(await _probe_frame(page, cdp), digest_size=16).digest()
+            same = same + 1 if digest == last else 1
+            last = digest
+            if same >= frames:
+                return True
+            await asyncio.sleep(interval)
+        return False
+    finally:
+        if cdp is not None:
+            try:
+                await cdp.detach()
+            except Exception:
+                pass
+
+async def _slow_path(page, url, wait):
+    """
+    - Opens the URL ("stable": until the DOM is there, "load": until the full load event).
+    - Waits until the <body> is present (so we know the page really exists).
+    - Removes the Wayback Machine toolbar/banner.
+    - "stable": captures as soon as the page stops changing visually.
+      "load": optionally waits for all images and a few extra seconds.
+
+    Use this first — it gives the cleanest and most complete screenshot.
+    """
+    stable = wait["readiness"] == "stable"
+    with metrics.span("capture.goto", url=url):
+        await page.goto(url, wait_until="domcontentloaded" if stable else "load", timeout=NAV_TIMEOUT_MS)
+        await page.wait_for_selector("body", timeout=5_000)
+    await page.evaluate(WAYBACK_CLEAN_JS)
+    if stable:
+        with metrics.span("capture.stable_wait") as span:
+            span.set(stable=await wait_until_stable(page))
+        return
+
+    if wait["wait_for_images"]:
+        with metrics.span("capture.images_wait") as span:
+            try:
+                await page.wait_for_function(IMAGES_LOADED_JS, timeout=IMAGES_TIMEOUT_MS)
+            except PlaywrightTimeout:
+                span.set(timeout=True)
+                metrics.count("capture.image_timeouts")
+    if wait["wait_seconds_after_load"] > 0:
+        await asyncio.sleep(wait["wait_seconds_after_load"])
+
+async def _best_effort_path(page, url):
+    """
+    The fallback screenshot method (if _slow_path fails).
+    - Tries to open the page quickly, even if not all assets load.
+    - Waits only briefly for a <body> tag.
+    - Still removes Wayback banners/toolbars.
+    - May result in partial content, but better than nothing I guess
+    """
+    metrics.count("capture.fallbacks")
+    try:
+        await page.goto(url, wait_until="domcontentloaded", timeout=8_000)
+    except PlaywrightTimeout:
+        pass
+    try:
+        await page.wait_for_selector("body", timeout=2_000)
+    except PlaywrightTimeout:
+        pass
+    await page.evaluate(WAYBACK_CLEAN_JS)
+
+def _write_metadata(file_path, url, served_url):
+    """
+    Writes <timestamp>.json next to the screenshot. Wayback redirects to the nearest real capture,
+    so I record which timestamp was actually served, not only the one I asked for.
+    """
+    meta = {
+        "url": url,
+        "timestamp": file_path.stem,
+        "served_url": served_url,
+        "served_timestamp": snapshot_timestamp(served_url, file_path.stem),
+    }
+    file_path.with_suffix(".json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+def write_png(path, data):
+    """
+    Writes a new file instead of overwriting the old one in place: the old <ts>.png may be
+    a hard link into the frame store (frame_store.py), shared with other timestamps.
+    """
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+async def _capture_one(context, url, file_path, limit, retries, wait, jobs, on_frame):
+    """
+    Screenshots one snapshot into file_path (or hands the PNG bytes to `on_frame`). Returns True if it worked.
+    Failed attempts are retried with exponential backoff; the page slot is given back while waiting.
+    With a manifest (`jobs`) every attempt is recorded, and the backoff carries over between runs.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(retries + 1):
+        delay = manifest.seconds_until_due(jobs, url) if jobs else manifest.backoff(attempt)
+        if delay > 0:
+            print(f"  ...waiting {delay:.1f}s before trying {file_path.stem} again")
+            await asyncio.sleep(delay)
+
+        async with limit:
+            print(f"[INFO] Processing snapshot {file_path.stem} ..." if attempt == 0
+                  else f"  ...retrying {file_path.stem} ({attempt}/{retries})")
+            if attempt:
+                metrics.count("capture.retries")
+            if jobs:
+                manifest.mark_running(jobs, url)
+            started = loop.time()
+
+            with metrics.span("capture.snapshot", snapshot=file_path.stem, attempt=attempt) as span:
+                # Opens a new browser tab for this snapshot
+                page = await context.new_page()
+                try:
+                    try:
+                        # First tries the "slow path" (full load, clean page, best quality)
+                        await _slow_path(page, url, wait)
+                    except Exception:
+                        # If that fails (e.g., page hangs), falls back to "best effort"
+                        await _best_effort_path(page, url)
+                    with metrics.span("capture.screenshot"):
+                        data = await page.screenshot(full_page=False)
+                    metrics.count("capture.png_bytes", len(data))
+                    with metrics.span("capture.hand_over" if on_frame else "capture.save_png"):
+                        if on_frame:
+                            await on_frame(file_path, "captured", data)
+                        else:
+                            write_png(file_path, data)
+                    _write_metadata(file_path, url, page.url)
+                    if jobs:
+                        manifest.mark_done(jobs, url, loop.time() - started)
+                    metrics.count("capture.captured")
+                    return True
+                except Exception as e:
+                    print(f"  ...could not capture {file_path.stem}: {e}")
+                    span.set(failed=type(e).__name__)
+                    metrics.count("capture.errors")
+                    if jobs:
+                        manifest.mark_failed(jobs, url, str(e), loop.time() - started)
+                finally:
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass
+    metrics.count("capture.skipped")
+    return False
+
+async def _capture_with(browser, todo, viewport, limit, retries, wait, use_asset_cache, jobs, on_frame):
+    #  I used AI to write this particular part:
+    # Creates a new browser context (like a fresh browser profile).
+    # - Sets the viewport size for consistent screenshots.
+    # - Ignores HTTPS errors (important because many archived pages have broken certificates).
+    context = await browser.new_context(
+        viewport={"width": viewport[0], "height": viewport[1]},
+        ignore_https_errors=True,
+    )
+    await context.add_init_script(INIT_JS)
+
+    # repeated logos/CSS/JS/fonts come from data/asset_cache, toolbar and tracker requests are blocked
+    if use_asset_cache:
+        handler, cache_stats, close_cache = asset_cache.make_route_handler()
+        await context.route("**/*", handler)
+
+    async def capture(url, file_path):
+        ok = await _capture_one(context, url, file_path, limit, retries, wait, jobs, on_frame)
+        if not ok and on_frame:
+            await on_frame(file_path, "skipped", None)
+        return ok
+
+    try:
+        results = await asyncio.gather(*(capture(url, file_path) for url, file_path in todo))
+    finally:
+        await context.close()
+        if use_asset_cache:
+            close_cache()
+
+    if use_asset_cache:
+        asset_cache.report(cache_stats, snapshots=len(todo))
+        for name, n in cache_stats.items():
+            metrics.count(f"assets.{name}", n)
+    return results
+
+async def capture_all(urls, out_dir, viewport=(1280, 800), concurrency=CONCURRENCY, retries=1,
+                      readiness="stable", wait_for_images=True, wait_seconds_after_load=0, headless=True, browser=None,
+                      page_limit=None, use_asset_cache=True, manifest_file=manifest.MANIFEST_FILE, on_frame=None):
+    """
+    Screenshots all urls into out_dir/<timestamp>.png with up to `concurrency` pages at the same time,
+    so one page that hangs for a minute doesn't block everything behind it.
+    Pass an already launched `browser` to share it, otherwise one is started just for this call,
+    and a shared `page_limit` semaphore to cap the pages across several calls.
+    `readiness` is "stable" (capture once the page stops changing) or "load" (the old way: load event,
+    all images, then `wait_seconds_after_load`).
+    With a `manifest_file` (default data/capture_manifest.sqlite) snapshots finished in an earlier run are
+    not captured again, so an interrupted run picks up where it stopped. Pass None to always capture everything.
+    `on_frame(file_path, status, png_bytes)` (async) hears about every snapshot as soon as it's finished:
+    "captured" comes with the PNG bytes and then the callback has to save the file itself,
+    "existing" means the file is already on disk, "skipped" means it could not be captured.
+    Returns (saved, skipped) sorted by timestamp.
+    """
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    files = [out_path / f"{snapshot_timestamp(url, f'snapshot{i}')}.png" for i, url in enumerate(urls)]
+
+    jobs = manifest.open_manifest(manifest_file) if manifest_file else None
+    try:
+        if jobs:
+            done, broken, todo = manifest.plan(jobs, urls, files)
+            if done or broken:
+                print(f"[INFO] Resuming: {len(done)} already captured, {len(broken)} gave up on, {len(todo)} to do")
+        else:
+            done, broken, todo = [], [], list(zip(urls, files))
+
+        if on_frame:
+            for _, file_path in done:
+                await on_frame(file_path, "existing", None)
+            for _, file_path in broken:
+                await on_frame(file_path, "skipped", None)
+
+        results = []
+        if todo:
+            limit = page_limit or asyncio.Semaphore(concurrency)
+            wait = {"readiness": readiness, "wait_for_images": wait_for_images,
+                    "wait_seconds_after_load": wait_seconds_after_load}
+            args = (todo, viewport, limit, retries, wait, use_asset_cache, jobs, on_frame)
+            if browser is not None:
+                results = await _capture_with(browser, *args)
+            else:
+                async with async_playwright() as p:
+                    # Launch a Chromium browser (headless=True means no visible window).
+                    with metrics.span("capture.browser_launch"):
+                        browser = await p.chromium.launch(headless=headless)
+                    try:
+                        results = await _capture_with(browser, *args)
+                    finally:
+                        await browser.close()
+    finally:
+        if jobs:
+            jobs.close()
+
+    outcome = [(url, f, True) for url, f in done] + [(url, f, False) for url, f in broken]
+    outcome += [(url, f, ok) for (url, f), ok in zip(todo, results)]
+    saved, skipped = [], []
+    for url, file_path, ok in sorted(outcome, key=lambda item: item[1].stem):
+        if ok:
+            saved.append(str(file_path))
+        else:
+            skipped.append(url)
+    return saved, skipped
@@ -0,0 +1,183 @@
+import calendar
+import sqlite3
+from datetime import date
+from pathlib import Path
+import metrics
+
+# The archived history of a site never changes, so I keep every timestamp the CDX API
+# ever gave me in a small SQLite file. Later runs only ask the API for the parts of a range I don't have yet.
+CACHE_FILE = Path("data/cdx_cache.sqlite")
+INSERT_BATCH = 1000   # rows per INSERT/commit while a CDX stream is coming in
+SCHEMA_VERSION = 3    # bump this when the tables change, the old cache is then simply rebuilt
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    url TEXT NOT NULL,
+    proto TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    digest TEXT,
+    length INTEGER,
+    PRIMARY KEY (url, proto, timestamp)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS snapshots_by_timestamp ON snapshots (timestamp);
+
+-- which date ranges have already been fully fetched for a url + protocol (several, never overlapping)
+CREATE TABLE IF NOT EXISTS coverage (
+    url TEXT NOT NULL,
+    proto TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    PRIMARY KEY (url, proto, start)
+);
+"""
+
+def connect(cache_file=CACHE_FILE):
+    Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(str(cache_file), timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    if con.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        _rebuild(con)
+    return con
+
+def _rebuild(con):
+    # it's only a cache, so an old layout is thrown away instead of migrated. Every variant thread (and every
+    # domain in batch mode) has its own connection, so the check is done again under the write lock:
+    # another connection may have rebuilt the tables meanwhile and already be reading them
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        if con.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            con.execute("DROP TABLE IF EXISTS snapshots")
+            con.execute("DROP TABLE IF EXISTS coverage")
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    con.execute(statement)
+            con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+
+def _pad(date_str, fill):
+    """
+    Turns a CDX date ('2010', '2010-01-15', '20100115094530') into a full 14-digit timestamp.
+    The CDX API treats 'from' as the start and 'to' as the end of the given period, so I pad with 0s or 9s.
+    """
+    return date_str.replace("-", "").ljust(14, fill)
+
+def _store(con, url, proto, rows):
+    """Yields the rows of a live CDX stream while writing them into the cache in batches."""
+    batch = []
+    for row in rows:
+        batch.append((url, proto, *row))
+        if len(batch) >= INSERT_BATCH:
+            con.executemany("INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?, ?, ?)", batch)
+            con.commit()
+            batch.clear()
+        yield row
+    con.executemany("INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?, ?, ?)", batch)
+    con.commit()
+
+def _cdx_day(ts):
+    """
+    A padded timestamp as a valid CDX date (YYYYMMDD). '2004' padded with 9s is '20049999999999',
+    which isn't a real day; the fetch asks for whole days and the rows are cut to the exact range afterwards.
+    """
+    year, month, day = int(ts[:4]), min(max(int(ts[4:6]), 1), 12), int(ts[6:8])
+    day = min(max(day, 1), calendar.monthrange(year, month)[1])
+    return f"{year:04d}{month:02d}{day:02d}"
+
+def _intervals(con, url, proto, today):
+    """
+    The covered ranges in order. A range that reaches today only counts up to its newest row,
+    because the archive may have captured the site again since.
+    """
+    out = []
+    for start, end in con.execute("SELECT start, end FROM coverage WHERE url = ? AND proto = ? ORDER BY start",
+                                  (url, proto)).fetchall():
+        if end[:8] >= today:
+            newest = con.execute(
+                "SELECT MAX(timestamp) FROM snapshots WHERE url = ? AND proto = ? AND timestamp BETWEEN ? AND ?",
+                (url, proto, start, end)).fetchone()[0]
+            end = newest or start
+        out.append((start, end))
+    return out
+
+def _plan(lo, hi, intervals):
+    """Splits lo..hi into ("cache", a, b) and ("fetch", a, b) pieces, in timestamp order."""
+    pieces, pos = [], lo
+    for start, end in intervals:
+        if end < pos:
+            continue
+        if start > hi or pos >= hi:
+            break
+        if start > pos:
+            pieces.append(("fetch", pos, start))
+        pieces.append(("cache", max(pos, start), min(end, hi)))
+        pos = end
+    if pos < hi:
+        pieces.append(("fetch", pos, hi))
+    return pieces
+
+def _add_coverage(con, url, proto, start, end):
+    """Adds start..end to the covered ranges, merged with every range it touches or overlaps."""
+    touching = con.execute(
+        "SELECT start, end FROM coverage WHERE url = ? AND proto = ? AND start <= ? AND end >= ?",
+        (url, proto, end, start)).fetchall()
+    for s, e in touching:
+        start, end = min(start, s), max(end, e)
+    con.execute("DELETE FROM coverage WHERE url = ? AND proto = ? AND start <= ? AND end >= ?",
+                (url, proto, end, start))
+    con.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)", (url, proto, start, end))
+    con.commit()
+
+def cached_snapshots(url, proto, start_date, end_date, fetch, cache_file=CACHE_FILE):
+    """
+    Yields the sorted (timestamp, digest, length) rows for url + protocol between start_date and end_date.
+    - `fetch(from, to)` must return the live CDX stream for that range (and raise on errors,
+      so a failed download is never remembered as "covered").
+    - Every covered range is remembered on its own, so asking for 2010-2020, then 2000-2004 and then
+      2000-2020 only fetches 2005-2009 the third time; parts of the range I have come from the cache.
+    - A covered range that reaches today gets one small delta query after its newest row.
+    """
+    lo, hi = _pad(start_date, "0"), _pad(end_date, "9")
+    con = connect(cache_file)
+    try:
+        today = date.today().strftime("%Y%m%d")
+        last = None   # the last timestamp handed out, pieces share their edges
+        for kind, a, b in _plan(lo, hi, _intervals(con, url, proto, today)):
+            if kind == "cache":
+                metrics.count("cdx.cache_hits")
+                rows = con.execute(
+                    "SELECT timestamp, digest, length FROM snapshots WHERE url = ? AND proto = ? "
+                    "AND timestamp BETWEEN ? AND ? ORDER BY timestamp", (url, proto, a, b))
+            else:
+                metrics.count("cdx.cache_misses")
+                rows = _store(con, url, proto, fetch(start_date if a == lo else _cdx_day(a),
+                                                     end_date if b == hi else _cdx_day(b)))
+            for row in rows:
+                if a <= row[0] <= b and (last is None or row[0] > last):
+                    last = row[0]
+                    yield row
+            if kind == "fetch":
+                _add_coverage(con, url, proto, a, b)
+    finally:
+        con.close()
+
+def digests_for(timestamps, cache_file=CACHE_FILE):
+    """The set of cached digests for the given timestamps (any url or protocol)."""
+    timestamps = list(timestamps)
+    if not timestamps or not Path(cache_file).exists():
+        return set()
+    con = connect(cache_file)
+    try:
+        digests = set()
+        # SQLite limits the number of ? in one query, so I look them up in slices
+        for i in range(0, len(timestamps), 500):
+            part = timestamps[i:i + 500]
+            digests.update(d for (d,) in con.execute(
+                f"SELECT digest FROM snapshots WHERE timestamp IN ({', '.join('?' * len(part))})", part
+            ) if d)
+        return digests
+    finally:
+        con.close()
@@ -0,0 +1,183 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")   # no window needed, not even for the atlas build
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from atlas import ATLAS_DIR, build_atlas, open_atlas
+from process_images import ANALYSIS_WORKERS, MEDIA_DIR, media_dirs, screenshot_index
+from regions import load_regions, regions_path
+from viewer import IMAGE_AREA, dirty_rects
+
+# The viewer's fade-plus-glitch animation rendered without a window, for a whole timeline: every frame
+# of a video at `fps`, `seconds_per_step` per pair of screenshots. Instead of blitting surfaces with
+# set_alpha one frame at a time, a batch of slider positions between the same two screenshots is blended
+# at once with NumPy, the same way the viewer's blits on the black background add up:
+#     s = A * a1;  s += (B - s) * a2;  s += (G - s) * w     (G only inside the changed regions)
+# with a1 = 1-u, a2 = u and w = 2*min(u, 1-u), rounded to 1/255 like the surface alpha.
+# Pairs are rendered on all cores; frames go to a PNG sequence or, in order, to a raw RGB pipe (e.g. ffmpeg).
+EXPORT_DIR = Path("media/export")
+EXPORT_BATCH = 8    # slider positions blended at once (8 frames of 1080x540 are ~56 MB of float32)
+
+@lru_cache(maxsize=1)
+def _atlas_data(path):
+    """The atlas file, mapped once per worker process."""
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+def _picture(data, entry):
+    offset, w, h, x, y = entry[:5]
+    return np.asarray(data[offset:offset + w * h * 3]).reshape(h, w, 3), (x, y)
+
+def alphas(u):
+    """The alpha of A, B and the glitch for slider positions u (an array), as the viewer sets them."""
+    a1 = np.floor(255 * (1 - u)) / 255
+    a2 = np.floor(255 * u) / 255
+    w = np.floor(255 * 2 * np.minimum(u, 1 - u)) / 255
+    return a1, a2, w
+
+def blend(area, a, b, glitch, u, out=None):
+    """
+    Renders the frames for the slider positions `u` (1D array) between two screenshots as a
+    (len(u), height, width, 3) uint8 array of the image area. `a` and `b` are (pixels, pos), `b` may be None
+    (last screenshot); `glitch` is (pixels, pos, rects) or None.
+    """
+    k = len(u)
+    a1, a2, w = (x.astype(np.float32)[:, None, None, None] for x in alphas(np.asarray(u, dtype=np.float64)))
+    s = np.zeros((k, area[1], area[0], 3), dtype=np.float32)   # the black background
+
+    def place(pixels, pos):
+        h, wd = pixels.shape[:2]
+        return s[:, pos[1]:pos[1] + h, pos[0]:pos[0] + wd]
+
+    pixels, pos = a
+    place(pixels, pos)[:] = pixels * a1
+    if b is not None:
+        pixels, pos = b
+        dst = place(pixels, pos)
+        dst += (pixels - dst) * a2
+    if glitch is not None and w.any():
+        pixels, pos, rects = glitch
+        canvas = place(pixels, pos)
+        for x, y, rw, rh in rects:
+            dst = canvas[:, y:y + rh, x:x + rw]
+            dst += (pixels[y:y + rh, x:x + rw] - dst) * w
+
+    np.rint(s, out=s)
+    if out is None:
+        out = np.empty(s.shape, dtype=np.uint8)
+    out[:] = s
+    return out
+
+def _render_pair(job):
+    """
+    Renders the frames of one pair (runs in a worker process). Writes PNGs itself, or returns the raw
+    frames for the parent to write in order.
+    """
+    data = _atlas_data(job["atlas"])
+    a = _picture(data, job["a"])
+    b = _picture(data, job["b"]) if job["b"] else None
+    glitch = None
+    if job["glitch"]:
+        pixels, pos = _picture(data, job["glitch"])
+        glitch = (pixels, pos, job["rects"])
+
+    frames, raw = job["frames"], []
+    for start in range(0, len(frames), EXPORT_BATCH):
+        batch = frames[start:start + EXPORT_BATCH]
+        out = blend(job["area"], a, b, glitch, [u for _, u in batch])
+        for (number, _), frame in zip(batch, out):
+            if job["out_dir"]:
+                Image.fromarray(frame).save(Path(job["out_dir"]) / f"frame_{number:06d}.png", compress_level=1)
+            else:
+                raw.append(frame.tobytes())
+    return len(frames), raw
+
+def timeline_jobs(shots, atlas, area, fps, seconds_per_step, out_dir, media_dir=MEDIA_DIR):
+    """One job per pair of neighbouring screenshots (and one for the last frame) with its frame numbers and u."""
+    steps = max(1, round(fps * seconds_per_step))
+    frames, overlays = atlas.index["frames"], atlas.index["overlays"]
+    mask_dir = media_dirs(media_dir)[2]
+    jobs = []
+    for i, (path_a, hash_a) in enumerate(shots):
+        last = i == len(shots) - 1
+        job = {"atlas": str(atlas.data.filename), "area": area, "out_dir": str(out_dir) if out_dir else None,
+               "a": frames[hash_a], "b": None, "glitch": None, "rects": None,
+               "frames": [(i * steps, 0.0)] if last else [(i * steps + k, k / steps) for k in range(steps)]}
+        if not last:
+            path_b, hash_b = shots[i + 1]
+            job["b"] = frames[hash_b]
+            entry = overlays.get(f"{path_a.stem}__{path_b.stem}") if hash_a != hash_b else None
+            if entry:
+                size = (entry[1], entry[2])
+                index = load_regions(regions_path(mask_dir / f"{path_a.stem}__{path_b.stem}_mask.png"))
+                job["glitch"] = entry
+                # like the viewer: only where the page changed, the whole overlay if there is no region index
+                job["rects"] = [tuple(r) for r in dirty_rects(index, size)] if index else [(0, 0, *size)]
+        jobs.append(job)
+    return jobs
+
+def export_timeline(out=EXPORT_DIR, fmt="png", fps=30, seconds_per_step=1.0, area=IMAGE_AREA,
+                    workers=ANALYSIS_WORKERS, media_dir=MEDIA_DIR):
+    """
+    Renders the whole timeline of media_dir (its atlas is built or updated first). fmt="png" writes out/frame_000000.png, ...; fmt="raw" writes rgb24 frames
+    of `area` one after another to the file or pipe `out` ("-" is stdout). Returns the number of frames.
+    """
+    # stdout may be the video stream, everything else goes to stderr
+    with redirect_stdout(sys.stderr):
+        shots = screenshot_index(media_dir)
+        if not shots:
+            print("[INFO] No screenshots found.")
+            return 0
+        atlas_dir = Path(media_dir) / ATLAS_DIR.name
+        build_atlas(area, atlas_dir, media_dir)   # only adds what is missing
+        atlas = open_atlas(area, atlas_dir)
+
+    out_dir = None
+    if fmt == "png":
+        out_dir = Path(out)
+        out_dir.mkdir(parents=True, exist_ok=True)
+    elif fmt != "raw":
+        raise ValueError(f"Unknown export format: {fmt}")
+    jobs = timeline_jobs(shots, atlas, area, fps, seconds_per_step, out_dir, media_dir)
+    stream = None
+    if fmt == "raw":
+        stream = sys.stdout.buffer if str(out) == "-" else open(out, "wb")
+        print(f"[INFO] Raw rgb24 {area[0]}x{area[1]} at {fps} fps, e.g. "
+              f"ffmpeg -f rawvideo -pix_fmt rgb24 -s {area[0]}x{area[1]} -r {fps} -i - out.mp4", file=sys.stderr)
+
+    total = 0
+    try:
+        with ProcessPoolExecutor(max(1, workers)) as pool:
+            # a few pairs in flight per worker; results are taken in order, so raw frames stay in order
+            window = max(1, workers) * 2
+            pending = [pool.submit(_render_pair, job) for job in jobs[:window]]
+            for n in range(len(jobs)):
+                count, raw = pending[n].result()
+                pending[n] = None
+                if n + window < len(jobs):
+                    pending.append(pool.submit(_render_pair, jobs[n + window]))
+                for frame in raw:
+                    stream.write(frame)
+                total += count
+    finally:
+        if stream is not None and stream is not sys.stdout.buffer:
+            stream.close()
+        elif stream is not None:
+            stream.flush()
+    print(f"[INFO] Exported {total} frame(s) of {len(shots)} screenshot(s)", file=sys.stderr)
+    return total
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Renders the fade-and-glitch timeline without a window.")
+    args.add_argument("out", nargs="?", default=str(EXPORT_DIR), help="directory for PNGs, or file/pipe ('-') for raw")
+    args.add_argument("--format", choices=("png", "raw"), default="png")
+    args.add_argument("--fps", type=int, default=30)
+    args.add_argument("--seconds-per-step", type=float, default=1.0)
+    args.add_argument("--workers", type=int, default=ANALYSIS_WORKERS)
+    args.add_argument("--media", default=str(MEDIA_DIR), help="media directory (e.g. one domain of a batch run)")
+    opts = args.parse_args()
+    export_timeline(opts.out, opts.format, opts.fps, opts.seconds_per_step, workers=opts.workers, media_dir=opts.media)
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+from PIL import Image
+
+# Static sites give me dozens of screenshots with exactly the same pixels. Every unique frame is kept once
+# as a blob named after the hash of its decoded pixels, and media/screenshots/<timestamp>.png becomes a
+# hard link to that blob. The index (timestamp -> hash) lets the analysis and the viewer see right away
+# that two frames are the same, without looking at a single pixel.
+STORE_DIR = Path("media/frames")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    timestamp TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,   -- file size and mtime of the screenshot when it was hashed,
+    mtime REAL NOT NULL      -- so a replaced file is hashed again
+);
+"""
+
+def open_store(store_dir=STORE_DIR):
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(str(store_dir / "index.sqlite"), timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(SCHEMA)
+    return con
+
+def pixel_hash(img):
+    """Hash of the decoded RGB pixels (and the size), so two PNGs with the same picture get the same hash."""
+    rgb = img.convert("RGB")
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{rgb.width}x{rgb.height}".encode())
+    h.update(rgb.tobytes())
+    return h.hexdigest()
+
+def blob_path(digest, store_dir=STORE_DIR):
+    return Path(store_dir) / "blobs" / digest[:2] / f"{digest}.png"
+
+def link_or_copy(src, dst):
+    """Puts a hard link to src at dst (replacing dst); copies where hard links aren't possible."""
+    dst = Path(dst)
+    tmp = dst.with_suffix(".tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        tmp.write_bytes(Path(src).read_bytes())
+    tmp.replace(dst)
+
+def add(con, path, img=None, store_dir=STORE_DIR):
+    """
+    Adds one screenshot (named <timestamp>.png) to the store and returns its hash.
+    The first frame with a hash becomes the blob; later copies are replaced by a link to it.
+    `img` saves decoding the file again when the caller already has it open.
+    """
+    path = Path(path)
+    if img is None:
+        with Image.open(path) as opened:
+            digest = pixel_hash(opened)
+    else:
+        digest = pixel_hash(img)
+
+    blob = blob_path(digest, store_dir)
+    if not blob.exists():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        link_or_copy(path, blob)
+    elif not path.samefile(blob):
+        link_or_copy(blob, path)
+
+    st = path.stat()
+    con.execute("INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?)", (path.stem, digest, st.st_size, st.st_mtime))
+    con.commit()
+    return digest
+
+def sync(con, screenshot_dir, store_dir=STORE_DIR):
+    """
+    Brings the index up to date with the screenshot folder: new or replaced screenshots are hashed
+    (and deduplicated), deleted ones are dropped. Returns {timestamp: hash}.
+    """
+    known = {ts: (digest, size, mtime) for ts, digest, size, mtime in con.execute("SELECT * FROM frames")}
+    frames = {}
+    for path in Path(screenshot_dir).glob("*.png"):
+        st = path.stat()
+        row = known.get(path.stem)
+        if row and row[1] == st.st_size and row[2] == st.st_mtime:
+            frames[path.stem] = row[0]
+        else:
+            frames[path.stem] = add(con, path, store_dir=store_dir)
+
+    gone = [(ts,) for ts in known if ts not in frames]
+    if gone:
+        con.executemany("DELETE FROM frames WHERE timestamp = ?", gone)
+        con.commit()
+    return frames
+
+def stats(con, store_dir=STORE_DIR):
+    """How many screenshots there are, how many different frames, and the bytes the blobs take."""
+    frames, unique = con.execute("SELECT COUNT(*), COUNT(DISTINCT hash) FROM frames").fetchone()
+    size = sum(p.stat().st_size for p in (Path(store_dir) / "blobs").glob("*/*.png"))
+    return {"screenshots": frames, "unique": unique, "bytes": size}
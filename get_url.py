@@ -1,65 +1,266 @@
 import requests # I need this to make requests to the Waybackmachine API
 
-from datetime import datetime
+import queue
+import sqlite3
+import threading
+from contextlib import nullcontext
+from heapq import merge
+from itertools import groupby
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from cdx_cache import cached_snapshots, digests_for
+import metrics
+from selection import parse_timestamps, thin_by_gap
 
-# I need this function so I can cover both HTTP and HTTPS snapshots, not to miss any
-# archived versions, and keeping my code modular
-# source: https://aws.amazon.com/compare/the-difference-between-https-and-http/
+CDX_URL = "https://web.archive.org/cdx/search/cdx"
+CDX_PAGE_SIZE = 5000   # rows per CDX request, big domains are fetched page by page
+CDX_WORKERS = 4        # how many CDX requests may run at the same time
+CDX_QUEUE_PAGES = 8    # pages each query may buffer while the merge catches up
+PROTOCOLS = ["https://", "http://"]   # if both have the same timestamp, the first one wins
 
-# for more infos on this function look up my documentation
-def get_snapshots_url(proto_url, start_date, end_date):
-    cdx_url = "https://web.archive.org/cdx/search/cdx"
+def make_session(max_concurrent=CDX_WORKERS):
+    """One pooled session, so all the CDX queries share their keep-alive connections."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_concurrent)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _stream_cdx(proto_url, start_date, end_date, cdx_url=CDX_URL, page_size=CDX_PAGE_SIZE, session=None, limiter=None):
+    """
+    Streams (timestamp, digest, length) rows for one URL from the CDX API.
+    The digest is a hash of the archived HTML, so two captures with the same digest look the same.
+    Instead of one huge JSON answer I ask for plain text pages of `page_size` rows (showResumeKey) and
+    yield the rows page by page, so memory stays flat no matter how many snapshots a domain has.
+    `limiter` (a semaphore) is only held while a page downloads, never while its rows are handed out.
+    Raises requests.RequestException if a page fails.
+    """
+    http = session or requests
     params = {
         "url": proto_url,
         "from": start_date.replace("-", ""),
         "to": end_date.replace("-", ""),
-        "output": "json",
-        "fl": "timestamp",
+        "fl": "timestamp,digest,length",
         "filter": "statuscode:200",
-        "collapse": "digest"
+        "collapse": "digest",
+        "limit": page_size,
+        "showResumeKey": "true",
     }
 
-    try:
-        resp = requests.get(cdx_url, params=params, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
+    while True:
+        resume_key = None
+        rows = []
+        size = 0
+        with limiter or nullcontext(), metrics.span("cdx.page", url=proto_url) as span:
+            with http.get(cdx_url, params=params, timeout=20, stream=True) as resp:
+                resp.raise_for_status()
+                lines = resp.iter_lines(chunk_size=64 * 1024)
+                for line in lines:
+                    if not line:
+                        # an empty line separates the rows from the key for the next page
+                        resume_key = next(lines, b"").decode("utf-8").strip() or None
+                        break
+                    size += len(line) + 1
+                    ts, digest, length = line.decode("utf-8").split(" ")[:3]
+                    rows.append((ts, digest, int(length) if length.isdigit() else None))
+            span.set(rows=len(rows))
+        metrics.count("cdx.pages")
+        metrics.count("cdx.rows", len(rows))
+        metrics.count("cdx.bytes", size)
 
-    # ChatGPT prompt: "Give me Python code that calls an API with requests, prints an error if it fails or if the JSON is invalid,
-    # and returns an empty list in both cases."
+        yield from rows
+        if not resume_key:
+            return
+        params["resumeKey"] = resume_key
 
+def fetch_snapshots(proto_url, start_date, end_date, cdx_url=CDX_URL, page_size=CDX_PAGE_SIZE, session=None):
+    """Same stream as _stream_cdx, but prints an error and stops instead of raising."""
+    try:
+        yield from _stream_cdx(proto_url, start_date, end_date, cdx_url, page_size, session)
     except requests.RequestException as e:
         print(f"ERROR: Failed to get snapshots for {proto_url}: {e}")
-        return []
-    except ValueError:
-        print(f"ERROR: Non-JSON response from CDX API for {proto_url}")
-        return []
 
-    return sorted([row[0] for row in data[1:]])
+# I need this function so I can cover both HTTP and HTTPS snapshots, not to miss any
+# archived versions, and keeping my code modular
+# source: https://aws.amazon.com/compare/the-difference-between-https-and-http/
+
+# for more infos on this function look up my documentation
+def get_snapshots_url(proto_url, start_date, end_date):
+    return sorted(row[0] for row in fetch_snapshots(proto_url, start_date, end_date))
+
+def url_variants(domain, include_www=True):
+    """
+    All the spellings of a domain I query: https and http, with and without 'www.'.
+    The domain as typed comes first, so it wins when two variants share a timestamp.
+    """
+    hosts = [domain]
+    if include_www:
+        hosts.append(domain.removeprefix("www.") if domain.startswith("www.") else "www." + domain)
+    return [(proto, host) for host in hosts for proto in PROTOCOLS]
 
-def get_snapshots(domain, start_date, end_date, frequency_days=90, save_to=None):
-    protocol_map = {}
-    for proto in ["http://", "https://"]:
-        ts_list = get_snapshots_url(proto + domain, start_date, end_date)
-        for ts in ts_list:
-            protocol_map[ts] = proto  # remembers which protocol this timestamp came from
+def _tagged(proto, host, start_date, end_date, cdx_url, use_cache, session, limiter):
+    def fetch(frm, to):
+        return _stream_cdx(proto + host, frm, to, cdx_url, session=session, limiter=limiter)
+
+    last = None   # the last timestamp handed out, so a fallback carries on after it
+    try:
+        if use_cache:
+            try:
+                for ts, digest, _length in cached_snapshots(host, proto, start_date, end_date, fetch):
+                    last = ts
+                    yield ts, proto + host, digest
+                return
+            except sqlite3.Error as e:
+                # a broken cache costs this variant its caching, not its snapshots
+                print(f"WARN: CDX cache failed for {proto + host} ({e}), asking the API directly")
+        for ts, digest, _length in fetch(start_date if last is None else last[:8], end_date):
+            if last is None or ts > last:
+                yield ts, proto + host, digest
+    except requests.RequestException as e:
+        print(f"ERROR: Failed to get snapshots for {proto + host}: {e}")
+
+def _put(q, item, stop):
+    # keeps trying to put, but gives up as soon as the reader is gone
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _in_background(rows, max_pages=CDX_QUEUE_PAGES, page_size=CDX_PAGE_SIZE):
+    """
+    Runs a row generator in its own thread, so all variants download at the same time,
+    and hands the rows over in page-sized chunks through a bounded queue.
+    If the generator fails, the reader gets the same exception after the rows that came before it.
+    """
+    q = queue.Queue(max_pages)
+    stop = threading.Event()
+    done = object()
+
+    def work():
+        end = done
+        try:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= page_size:
+                    if not _put(q, chunk, stop):
+                        return
+                    chunk = []
+            if chunk:
+                _put(q, chunk, stop)
+        except Exception as e:
+            end = e
+        finally:
+            rows.close()
+            _put(q, end, stop)
+
+    def read():
+        try:
+            while (chunk := q.get()) is not done:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield from chunk
+        finally:
+            stop.set()
+
+    # the thread starts right away, not when the merge first asks for a row
+    threading.Thread(target=work, daemon=True).start()
+    return read()
+
+def screenshot_digests(screenshot_dir):
+    """
+    The CDX digests of the screenshots I already have (files are named after their timestamp),
+    looked up in the CDX cache. Snapshots with one of these digests would look exactly the same again.
+    """
+    stems = [p.stem for p in Path(screenshot_dir).glob("*.png") if p.stem.isdigit() and len(p.stem) == 14]
+    return digests_for(stems)
+
+def get_snapshots(domain, start_date, end_date, frequency_days=90, save_to=None, cdx_url=CDX_URL, use_cache=True,
+                  include_www=True, max_concurrent=CDX_WORKERS, skip_digests=(), limiter=None):
+    # All variants (http/https, www/non-www) are queried at the same time over one pooled session,
+    # with at most `max_concurrent` requests in flight. Every stream comes back sorted by timestamp,
+    # so I merge them on the fly, drop duplicate timestamps and thin + write the URLs while the pages
+    # are still coming in. With use_cache the timestamps come from data/cdx_cache.sqlite and only the
+    # new ones are asked for.
+    # Snapshots whose digest (archived HTML) is in `skip_digests` or was picked earlier in the range are
+    # passed over while thinning, so unchanged pages never cost a browser load. Only picked digests count:
+    # a capture the thinning dropped doesn't block a later one with the same content.
+    # Pass a shared `limiter` (semaphore) to cap the requests of several get_snapshots calls together.
+    # the output file is opened first, so if it can't be nothing has started downloading yet
+    out = None
+    if save_to:
+        Path(save_to).parent.mkdir(parents=True, exist_ok=True)
+        out = open(save_to, "w")
 
-    # I sort by timestamps and filter by frequency
     archive_urls = []
     last_date = None
-    for ts in sorted(protocol_map.keys()):
-        snapshot_dt = datetime.strptime(ts, "%Y%m%d%H%M%S")
-        if not last_date or (snapshot_dt - last_date).days >= frequency_days:
-            proto = protocol_map[ts]
-            archive_urls.append(f"https://web.archive.org/web/{ts}/{proto}{domain}")
-            last_date = snapshot_dt
+    seen = set(skip_digests)
+    duplicates = 0
+
+    def thin(chunk):
+        # thins one page worth of (timestamp, variant, digest) rows at once, carrying the last pick over
+        nonlocal last_date, duplicates
+
+        def new_content(i):
+            nonlocal duplicates
+            digest = chunk[i][2]
+            if digest in seen:
+                duplicates += 1
+                return False
+            seen.add(digest)
+            return True
 
+        with metrics.span("cdx.thin", rows=len(chunk)):
+            times = parse_timestamps([ts for ts, _, _ in chunk])
+            keep = thin_by_gap(times, frequency_days, last=last_date, accept=new_content)
+        for i in keep:
+            ts, variant, _ = chunk[i]
+            url = f"https://web.archive.org/web/{ts}/{variant}"
+            archive_urls.append(url)
+            if out:
+                out.write(url + "\n")
+        if keep.size:
+            last_date = times[keep[-1]]
+
+    session = None
+    streams = []
+    with metrics.span("cdx.query", domain=domain) as span:
+        try:
+            session = make_session(max_concurrent)
+            limiter = limiter or threading.BoundedSemaphore(max_concurrent)
+            streams = [
+                _in_background(_tagged(proto, host, start_date, end_date, cdx_url, use_cache, session, limiter))
+                for proto, host in url_variants(domain, include_www)
+            ]
+            merged = merge(*streams, key=lambda row: row[0])
+            chunk = []
+            for ts, rows in groupby(merged, key=lambda row: row[0]):
+                _, variant, digest = next(rows)   # remembers which protocol/host this timestamp came from
+                if digest in seen:
+                    duplicates += 1
+                    continue
+                chunk.append((ts, variant, digest))
+                if len(chunk) >= CDX_PAGE_SIZE:
+                    thin(chunk)
+                    chunk = []
+            thin(chunk)
+        finally:
+            for stream in streams:
+                stream.close()
+            if session:
+                session.close()
+            if out:
+                out.close()
+        span.set(snapshots=len(archive_urls), duplicates=duplicates)
+
+    metrics.count("cdx.duplicates", duplicates)
+    metrics.count("cdx.snapshots", len(archive_urls))
+    if duplicates:
+        print(f"INFO: Skipped {duplicates} snapshot(s) with the same content as another one")
     if save_to:
-        Path(save_to).parent.mkdir(parents=True, exist_ok=True)
-        with open(save_to, "w") as f:
-            for url in archive_urls:
-                f.write(url + "\n")
         print(f"INFO: Saved {len(archive_urls)} snapshot URLs to {save_to}")
 
     return archive_urls
-
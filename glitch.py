@@ -0,0 +1,125 @@
+import threading
+import numpy as np
+
+# The glitch effect in one pass per channel. Instead of six shifted channel copies and boolean-mask
+# gathers/scatters, every shifted channel is written with plain slices into a scratch buffer that is
+# reused for the next pair of the same size, and the mix replaces B only where mask is True.
+# A mask with only a few scattered pixels set is the exception: shifting whole channels for those
+# costs more than looking up the shifted pixels one by one, so those pixels are gathered directly.
+SPARSE = 0.02   # at most this share of the changed rows' pixels set: gather the pixels instead
+
+# offsets as (dy, dx) for the R, G and B channel, of A and of B
+PRESETS = {
+    "default":  {"a": ((0, -10), (10, 0), (0, 10)), "b": ((0, 10), (10, 0), (0, 10))},   # what make_glitch always did
+    "subtle":   {"a": ((0, -3), (3, 0), (0, 3)),    "b": ((0, 3), (3, 0), (0, 3))},
+    "heavy":    {"a": ((0, -30), (30, 0), (0, 30)), "b": ((0, 30), (30, 0), (0, 30))},
+    "vertical": {"a": ((-10, 0), (0, 0), (10, 0)),  "b": ((10, 0), (0, 0), (-10, 0))},
+}
+
+def shift_into(dst, src, dy=0, dx=0, top=0):
+    """
+    Writes src shifted down by dy and right by dx into dst. The pixels shifted in at the edges repeat
+    the first/last row/column, like process_images.shift. dst can be a band of rows only: it then
+    gets rows top .. top + len(dst) of the shifted image.
+    """
+    h, w = src.shape
+    n = dst.shape[0]
+    dy = max(-(h - 1), min(dy, h - 1))
+    dx = max(-(w - 1), min(dx, w - 1))
+    left, right = max(dx, 0), w + min(dx, 0)           # columns copied straight from src
+    first = min(max(dy, top), top + n)                   # rows copied straight from src: first .. end
+    end = max(min(h + dy, top + n), first)
+    cols = slice(left - dx, right - dx)
+    if first < end:
+        dst[first - top:end - top, left:right] = src[first - dy:end - dy, cols]
+    # the edges: rows above/below repeat src's first/last row, then the columns left/right
+    if first > top:
+        dst[:first - top, left:right] = src[0, cols]
+    if end < top + n:
+        dst[end - top:, left:right] = src[h - 1, cols]
+    if left:
+        dst[:, :left] = dst[:, left:left + 1]
+    if right < w:
+        dst[:, right:] = dst[:, right - 1:right]
+    return dst
+
+class GlitchRenderer:
+    """
+    Keeps the scratch and output buffers between pairs. One renderer per thread
+    (the buffers are overwritten by the next render).
+    """
+    def __init__(self, preset="default"):
+        self.preset = PRESETS[preset] if isinstance(preset, str) else preset
+        self._shape = None
+
+    def _buffers(self, shape):
+        if self._shape != shape:
+            h, w = shape[:2]
+            self._a = np.empty((h, w), dtype=np.uint8)
+            self._b = np.empty((h, w), dtype=np.uint8)
+            self._keep = np.empty((h, w), dtype=np.uint8)   # 255 where the mix goes, 0 where B stays
+            self._drop = np.empty((h, w), dtype=np.uint8)   # the opposite
+            self._out = np.empty((h, w, 3), dtype=np.uint8)
+            self._shape = shape
+        return self._a, self._b, self._keep, self._drop, self._out
+
+    def render(self, arr_a, arr_b, mask, preset=None):
+        """
+        Glitch of two aligned uint8 RGB arrays: B everywhere, and where mask is True each channel is
+        (shifted A + shifted B) // 2, with the sum wrapping around at 256 like the uint8 math always did.
+        Returns the output buffer, which is reused by the next call.
+        """
+        preset = self.preset if preset is None else (PRESETS[preset] if isinstance(preset, str) else preset)
+        buf_a, buf_b, keep, drop, out = self._buffers(arr_b.shape)
+        np.copyto(out, arr_b)
+        changed_rows = np.flatnonzero(mask.any(axis=1))
+        if changed_rows.size == 0:
+            return out
+
+        # only the band of rows with changes is mixed, the rest stays B
+        top, bottom = changed_rows[0], changed_rows[-1] + 1
+        n = bottom - top
+        changed = np.count_nonzero(mask[top:bottom])
+        if changed <= SPARSE * n * mask.shape[1]:
+            return self._render_sparse(arr_a, arr_b, mask, preset, out)
+        buf_a, buf_b, keep, drop = buf_a[:n], buf_b[:n], keep[:n], drop[:n]
+        band = out[top:bottom]
+        full = changed == band.shape[0] * band.shape[1]   # the whole band changed, no B to keep
+        if not full:
+            # choosing between the mix and B with bit masks is a lot faster than mask indexing or copyto(where=)
+            np.negative(mask[top:bottom].view(np.uint8), out=keep)   # True -> 0 - 1 -> 255
+            np.invert(keep, out=drop)
+        for c in range(3):
+            shift_into(buf_a, arr_a[..., c], *preset["a"][c], top=top)
+            shift_into(buf_b, arr_b[..., c], *preset["b"][c], top=top)
+            np.add(buf_a, buf_b, out=buf_a)          # uint8, wraps around
+            if full:
+                np.right_shift(buf_a, 1, out=band[..., c])
+                continue
+            np.right_shift(buf_a, 1, out=buf_a)      # // 2
+            np.bitwise_and(buf_a, keep, out=buf_a)
+            np.bitwise_and(band[..., c], drop, out=buf_b)
+            np.bitwise_or(buf_a, buf_b, out=band[..., c])
+        return out
+
+    @staticmethod
+    def _render_sparse(arr_a, arr_b, mask, preset, out):
+        # the shifted pixel at (y, x) is src[y - dy, x - dx], with the coordinates clamped to the frame
+        # (that is the edge repeat of shift_into)
+        h, w = mask.shape
+        ys, xs = np.divmod(np.flatnonzero(mask), w)
+        for c in range(3):
+            (dya, dxa), (dyb, dxb) = preset["a"][c], preset["b"][c]
+            mix = arr_a[np.clip(ys - dya, 0, h - 1), np.clip(xs - dxa, 0, w - 1), c]
+            mix += arr_b[np.clip(ys - dyb, 0, h - 1), np.clip(xs - dxb, 0, w - 1), c]   # uint8, wraps around
+            mix >>= 1
+            out[ys, xs, c] = mix
+        return out
+
+_local = threading.local()
+
+def renderer():
+    """The GlitchRenderer of the current thread."""
+    if not hasattr(_local, "renderer"):
+        _local.renderer = GlitchRenderer()
+    return _local.renderer
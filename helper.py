@@ -0,0 +1,62 @@
+# little helper functions that several modules need
+import threading
+from collections import OrderedDict
+
+def snapshot_timestamp(url, fallback="snapshot"):
+    """Extracts the timestamp (the long YYYYMMDDhhmmss number) from a Wayback Machine snapshot URL."""
+    try:
+        return url.split("/web/")[1].split("/")[0]
+    except IndexError:
+        return fallback
+
+def clean_domain(domain: str) -> str:
+    """
+    Removes 'http://' or 'https://' and trailing slashes from a domain string.
+    This that the domain is in a clean format for the queries. Example: 'https://www.example.com/' -> 'www.example.com'
+    """
+    return domain.removeprefix("http://").removeprefix("https://").strip("/")
+
+class ByteLRU:
+    """
+    A least-recently-used cache with a budget in bytes instead of a number of entries
+    (one full-size frame can weigh as much as fifty thumbnails). Safe to use from several threads.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._items = OrderedDict()   # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._items:
+                self.bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.bytes += size
+            # the newest entry always stays, even if it alone is over budget
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"entries": len(self._items), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hits / total if total else 0.0}
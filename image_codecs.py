@@ -0,0 +1,106 @@
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+# How masks and glitch images are written to disk. Default-compression PNG spends most of its time in zlib,
+# and a mask only needs one bit per pixel, so there are a few faster formats to choose from.
+# Readers never need to know which one was used: they go by the file suffix.
+# (Not called codecs.py, that would hide Python's own codecs module.)
+#
+# masks:   "png"       8-bit grayscale PNG, what analyse_all always wrote
+#          "png-fast"  1-bit PNG with light compression
+#          "packbits"  np.packbits into a compressed .npz (tiny and fast, masks are mostly zeros)
+#          "raw"       a plain .npy of bools, memory-mappable, no encoding at all
+# glitches: "png"      default compression
+#          "png-fast"  compress_level=1
+#          "webp"      lossless WebP, fastest method
+#          "raw"       a plain .npy (height x width x 3 uint8), memory-mappable
+
+MASK_SUFFIXES = {"png": ".png", "png-fast": ".png", "packbits": ".npz", "raw": ".npy"}
+GLITCH_SUFFIXES = {"png": ".png", "png-fast": ".png", "webp": ".webp", "raw": ".npy"}
+SUFFIXES = (".png", ".npz", ".npy", ".webp")   # in the order find() looks for them
+
+def _atomic_write(path, write):
+    """Writes into a temporary file and renames it, so a half written file never has the real name."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    tmp.replace(path)
+    return path
+
+def write_mask(mask, f, codec="packbits"):
+    """Encodes a 2D bool mask into the open binary file f."""
+    if codec == "png":
+        Image.fromarray(mask.astype(np.uint8) * 255).save(f, "PNG")
+    elif codec == "png-fast":
+        Image.fromarray(mask).save(f, "PNG", compress_level=1)
+    elif codec == "packbits":
+        np.savez_compressed(f, bits=np.packbits(mask, axis=None), shape=np.array(mask.shape))
+    elif codec == "raw":
+        np.save(f, np.ascontiguousarray(mask, dtype=bool))
+    else:
+        raise ValueError(f"Unknown mask codec: {codec}")
+
+def save_mask(mask, path, codec="packbits"):
+    """Saves a mask at `path` (its suffix has to match the codec, see MASK_SUFFIXES)."""
+    return _atomic_write(path, lambda f: write_mask(mask, f, codec))
+
+def load_mask(path, mmap=False):
+    """Reads a mask in any of the formats above as a 2D bool array (.npy can be memory-mapped)."""
+    path = Path(path)
+    if path.suffix == ".npz":
+        with np.load(path) as data:
+            h, w = data["shape"]
+            return np.unpackbits(data["bits"], count=h * w).reshape(h, w).view(bool)
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r" if mmap else None)
+    with Image.open(path) as img:
+        return np.asarray(img.convert("L")) > 127
+
+def write_glitch(img, f, codec="png-fast"):
+    """Encodes a glitch image (PIL image or uint8 RGB array) into the open binary file f."""
+    if codec == "raw":
+        arr = np.asarray(img.convert("RGB") if isinstance(img, Image.Image) else img, dtype=np.uint8)
+        np.save(f, np.ascontiguousarray(arr))
+        return
+    if not isinstance(img, Image.Image):
+        img = Image.fromarray(img)
+    if codec == "png":
+        img.save(f, "PNG")
+    elif codec == "png-fast":
+        img.save(f, "PNG", compress_level=1)
+    elif codec == "webp":
+        img.save(f, "WEBP", lossless=True, method=0)
+    else:
+        raise ValueError(f"Unknown glitch codec: {codec}")
+
+def save_glitch(img, path, codec="png-fast"):
+    """Saves a glitch image at `path` (its suffix has to match the codec, see GLITCH_SUFFIXES)."""
+    return _atomic_write(path, lambda f: write_glitch(img, f, codec))
+
+def load_glitch(path, mmap=False):
+    """Reads a glitch image in any of the formats above as a uint8 RGB array."""
+    path = Path(path)
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r" if mmap else None)
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGB"))
+
+def find(base):
+    """
+    The saved file for `base` (a path without suffix, e.g. media/masks/a__b_mask) in whatever format
+    it was written, or None.
+    """
+    base = Path(base)
+    for suffix in SUFFIXES:
+        path = base.with_name(base.name + suffix)
+        if path.exists():
+            return path
+    return None
+
+def remove(base):
+    """Deletes the file for `base` in every format (before writing it again, maybe in another one)."""
+    base = Path(base)
+    for suffix in SUFFIXES:
+        base.with_name(base.name + suffix).unlink(missing_ok=True)
@@ -1,47 +1,78 @@
 # Importing all the dependecies
+import argparse
+import sys
 from pathlib import Path
-import numpy as np
-from datetime import datetime, date
+from datetime import date
 from dateutil import parser
-from get_url import get_snapshots
-from screenshot import take_screenshots
-from process_images import analyse_all
-from viewer import run_viewer
+from get_url import CDX_WORKERS, get_snapshots, screenshot_digests
+from resolve import resolve_snapshots
+from helper import clean_domain
+from selection import POLICIES, select_urls
+from pipeline import capture_and_analyse
+from process_images import ANALYSIS_WORKERS, analyse_all
+from viewer import IMAGE_AREA, run_viewer
+from atlas import build_atlas
+from thumbnails import build_thumbnails
+from batch import BATCH_DIR, DOMAIN_LIMIT, PAGE_LIMIT, load_jobs, make_job, run_batch
+import metrics
 
 SNAPSHOT_FILE = Path("data/snapshot_urls.txt")   # where snapshot URLs will be stored
 SCREENSHOT_DIR = Path("media/screenshots")       # where screenshots will be saved
 SNAPSHOT_FILE.parent.mkdir(parents=True, exist_ok=True)
 MAX_SNAPS = 5   # limit on how many snapshots to process (avoids long waits from screenshots.py)
 
-def clean_domain(domain: str) -> str:
-    """
-    Removes 'http://' or 'https://' and trailing slashes from a domain string.
-    This that the domain is in a clean format for the queries. Example: 'https://www.example.com/' -> 'www.example.com'
-    """
-    return domain.removeprefix("http://").removeprefix("https://").strip("/")
-
-def parse_timestamp(url: str) -> datetime:
-    """
-    This extracts the timestamp (YYYYMMDDHHMMSS) from a Wayback Machine snapshot URL
-    and return it as a datetime object.
-    """
-    ts = url.split("/web/")[1].split("/")[0]
-    return datetime.strptime(ts, "%Y%m%d%H%M%S")
-
-def filter_by_frequency(urls, freq_days: int):
-    pass
-
-def pick_evenly(urls, max_snaps=5):
-    if len(urls) <= max_snaps:
-        return urls
-    idxs = np.linspace(0, len(urls)-1, max_snaps, dtype=int)  # picks snapshots evenly based on the given time frame
-    return [urls[i] for i in idxs]
-
 # print function because this is often used
 def step(n, msg):
     print(f"\n[STEP {n}] {msg}...")
 
+def parse_args(argv=None):
+    args = argparse.ArgumentParser(
+        description="Website Time Capsule. Without domains it asks for one and opens the viewer; "
+                    "with domains or a job file it runs them all without asking anything (see batch.py).")
+    args.add_argument("domains", nargs="*", help="domains to run in batch mode")
+    args.add_argument("--jobs", help="JSON job file (see batch.load_jobs)")
+    args.add_argument("--start", help="start date (default: earliest)")
+    args.add_argument("--end", help="end date (default: today)")
+    args.add_argument("--select", choices=POLICIES, help="how snapshots are picked (default: even)")
+    args.add_argument("--max-snaps", type=int, help=f"snapshots per domain, 0 = no limit (default: {MAX_SNAPS})")
+    args.add_argument("--frequency-days", type=int, help="minimum days between two snapshots (default: 1)")
+    args.add_argument("--no-atlas", action="store_true", help="batch mode: don't build the viewer's atlas")
+    args.add_argument("--out", default=str(BATCH_DIR), help="batch mode: one directory per domain in here")
+    args.add_argument("--parallel-domains", type=int, default=DOMAIN_LIMIT, help="domains in progress at once")
+    args.add_argument("--cdx-requests", type=int, default=CDX_WORKERS, help="CDX requests at once, all domains")
+    args.add_argument("--pages", type=int, default=PAGE_LIMIT, help="browser pages at once, all domains")
+    args.add_argument("--analysis-workers", type=int, default=ANALYSIS_WORKERS, help="analysis processes")
+    args.add_argument("--metrics", nargs="?", const=str(metrics.METRICS_DIR), metavar="DIR",
+                      help=f"time every stage and write a JSON trace + Prometheus textfile (default dir: {metrics.METRICS_DIR})")
+    return args.parse_args(argv)
+
+def batch_main(opts):
+    """Batch mode: the jobs from the arguments and/or the job file."""
+    defaults = {"start": opts.start, "end": opts.end, "select": opts.select, "max_snaps": opts.max_snaps,
+                "frequency_days": opts.frequency_days, "atlas": False if opts.no_atlas else None}
+    defaults = {k: v for k, v in defaults.items() if v is not None}
+    jobs = load_jobs(opts.jobs, defaults) if opts.jobs else []
+    jobs += [make_job({"domain": domain}, defaults) for domain in opts.domains]
+    return run_batch(jobs, opts.out, domains=opts.parallel_domains, cdx=opts.cdx_requests,
+                     analysis_workers=opts.analysis_workers, pages=opts.pages)
+
 def main():
+    opts = parse_args()
+    if not opts.metrics:
+        return run(opts)
+    metrics.start()
+    try:
+        return run(opts)
+    finally:
+        metrics.report()
+        print(f"[INFO] Metrics written to {metrics.write(opts.metrics)}")
+
+def run(opts):
+    if opts.domains or opts.jobs:
+        sys.exit(1 if batch_main(opts) else 0)
+    max_snaps = MAX_SNAPS if opts.max_snaps is None else opts.max_snaps
+    frequency_days = 1 if opts.frequency_days is None else opts.frequency_days
+
     print(f"\n === Website Time Capsule ===\n")
 
     domain = clean_domain(input("Enter website domain (e.g. www.example.com): ").strip())
@@ -60,35 +91,54 @@ def main():
     else:
         end_date = date.today().strftime("%Y%m%d")
 
-    # 1. Get URLs
+    # 1. Get URLs (snapshots that look exactly like a screenshot I already have are skipped right here)
     step(1, "Checking available snapshots")
-    all_urls = get_snapshots(domain=domain, start_date=start_date, end_date=end_date, frequency_days=1)
+    with metrics.span("step.snapshots", domain=domain):
+        all_urls = get_snapshots(domain=domain, start_date=start_date, end_date=end_date,
+                                 frequency_days=frequency_days, skip_digests=screenshot_digests(SCREENSHOT_DIR))
     print(f"Total snapshots found: {len(all_urls)}")
     if not all_urls:
-        print("ERROR: No snapshots found.")
-        return
-
-    filtered = pick_evenly(all_urls, MAX_SNAPS)
+        if not any(SCREENSHOT_DIR.glob("*.png")):
+            print("ERROR: No snapshots found.")
+            return
+        print("INFO: No new snapshots, using the screenshots I already have.")
+
+    filtered = select_urls(all_urls, opts.select or "even", max_snaps)
+    # follows the Wayback redirects once, so the screenshots are named after the capture really served
+    # and two picks that land on the same capture only cost one page load
+    with metrics.span("step.resolve"):
+        filtered = resolve_snapshots(filtered)
     print(f"Using {len(filtered)} snapshot(s).")
 
     SNAPSHOT_FILE.write_text("\n".join(filtered), encoding="utf-8")
 
-    # 2. Takes scrennshots
-    step(2, "Taking screenshots")
-    saved, skipped = take_screenshots(input_file=str(SNAPSHOT_FILE), out_dir=str(SCREENSHOT_DIR),
-        viewport=(1280, 800),     # I fixed browser size for consistency
-        retries=2,                # retry failed snapshots twice
-        wait_seconds_after_load=2 # wait a bit for images to load before screenshot
-    )
-    print(f"Screenshots saved: {len(saved)}, skipped: {len(skipped)}")
-
-    # 3. Analyses screenshots & create glitch overlays
+    # 2. Takes scrennshots, every pair is analysed as soon as both of its screenshots are there
+    if filtered:
+        step(2, "Taking screenshots (and analysing them on the way)")
+        with metrics.span("step.capture"):
+            saved, skipped = capture_and_analyse(input_file=str(SNAPSHOT_FILE),
+                viewport=(1280, 800),     # I fixed browser size for consistency
+                retries=2,                # retry failed snapshots twice
+                readiness="stable"        # captures as soon as the page stops changing, no fixed wait
+            )
+        print(f"Screenshots saved: {len(saved)}, skipped: {len(skipped)}")
+
+    # 3. Analyses whatever pairs are still missing (e.g. when there was nothing new to capture)
     step(3, "Analysing screenshots & generating glitches")
-    analyse_all()
+    with metrics.span("step.analysis"):
+        analyse_all()
+
+    # 4. Everything scaled to the viewer size once, so scrubbing never has to decode or scale,
+    #    plus the thumbnail pyramid for the filmstrip
+    step(4, "Building the frame atlas and thumbnails")
+    with metrics.span("step.atlas"):
+        build_atlas(IMAGE_AREA)
+        build_thumbnails()
 
     # Launches viewer
-    step(4, "Launching viewer")
-    run_viewer()
+    step(5, "Launching viewer")
+    with metrics.span("step.viewer"):
+        run_viewer()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+import sqlite3
+import time
+from pathlib import Path
+
+# A small job list for the screenshot step. Every snapshot URL gets a row with its status, how often I tried,
+# the last error and how long it took. If main.py crashes or I stop it, the next run only does what's left.
+MANIFEST_FILE = Path("data/capture_manifest.sqlite")
+MAX_ATTEMPTS = 6      # over all runs; after that a snapshot counts as broken and is skipped
+BACKOFF_BASE = 2.0    # seconds before the 1st retry, then 4, 8, 16, ...
+BACKOFF_MAX = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    url TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',   -- pending, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    duration REAL,                            -- seconds of the last attempt
+    total_duration REAL NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,     -- unix time, for the backoff
+    updated REAL
+);
+"""
+
+def backoff(attempts):
+    """Seconds to wait after `attempts` failed tries (exponential, but capped)."""
+    if attempts <= 0:
+        return 0.0
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+def open_manifest(manifest_file=MANIFEST_FILE):
+    Path(manifest_file).parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(str(manifest_file), timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(SCHEMA)
+    return con
+
+def plan(con, urls, files):
+    """
+    Adds new jobs and sorts all of them into three lists:
+    - done: captured in an earlier run and the file is still there -> nothing to do
+    - broken: failed MAX_ATTEMPTS times already -> skipped
+    - todo: pending, failed or interrupted ("running" when the last run died) -> captured now
+    """
+    now = time.time()
+    done, broken, todo = [], [], []
+    for url, file_path in zip(urls, files):
+        con.execute("INSERT OR IGNORE INTO jobs (url, file, updated) VALUES (?, ?, ?)", (url, str(file_path), now))
+        row = con.execute("SELECT file, status, attempts FROM jobs WHERE url = ?", (url,)).fetchone()
+        if row[1] == "done" and row[0] == str(file_path) and Path(file_path).exists():
+            done.append((url, file_path))
+        elif row[1] == "failed" and row[2] >= MAX_ATTEMPTS:
+            broken.append((url, file_path))
+        else:
+            if row[0] != str(file_path) or row[1] == "done":
+                # the file went missing or moved, so this job starts over
+                con.execute("UPDATE jobs SET file = ?, status = 'pending', attempts = 0, next_attempt = 0 "
+                            "WHERE url = ?", (str(file_path), url))
+            todo.append((url, file_path))
+    con.commit()
+    return done, broken, todo
+
+def seconds_until_due(con, url):
+    row = con.execute("SELECT next_attempt FROM jobs WHERE url = ?", (url,)).fetchone()
+    return max(0.0, row[0] - time.time()) if row else 0.0
+
+def mark_running(con, url):
+    con.execute("UPDATE jobs SET status = 'running', updated = ? WHERE url = ?", (time.time(), url))
+    con.commit()
+
+def mark_done(con, url, duration):
+    con.execute(
+        "UPDATE jobs SET status = 'done', attempts = attempts + 1, last_error = NULL, duration = ?, "
+        "total_duration = total_duration + ?, next_attempt = 0, updated = ? WHERE url = ?",
+        (duration, duration, time.time(), url))
+    con.commit()
+
+def mark_failed(con, url, error, duration):
+    now = time.time()
+    attempts = con.execute("SELECT attempts FROM jobs WHERE url = ?", (url,)).fetchone()[0] + 1
+    con.execute(
+        "UPDATE jobs SET status = 'failed', attempts = ?, last_error = ?, duration = ?, "
+        "total_duration = total_duration + ?, next_attempt = ?, updated = ? WHERE url = ?",
+        (attempts, error[:500], duration, duration, now + backoff(attempts), now, url))
+    con.commit()
+
+def summary(con):
+    """Number of jobs per status, e.g. {'done': 120, 'failed': 3}."""
+    return dict(con.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# Where does the time of a run go? Spans (timed blocks) around every stage and snapshot, and counters
+# (retries, skips, bytes, cache hits), collected for one run and written at the end as
+#   - a JSON trace in the Chrome trace format (open it in chrome://tracing or ui.perfetto.dev), with a
+#     summary per stage and all counters next to the events, and
+#   - a Prometheus textfile (for node_exporter's textfile collector, or just to read).
+# Off by default: span() then hands out one shared do-nothing context manager and count() returns right away,
+# so the instrumented code costs a function call per stage, nothing more.
+#
+#     metrics.start()
+#     with metrics.span("capture.goto", snapshot=ts):
+#         ...
+#     metrics.count("capture.retries")
+#     metrics.write("data/metrics")
+METRICS_DIR = Path("data/metrics")
+PROM_FILE = "website_time_capsule.prom"
+MAX_EVENTS = 200_000     # single spans kept for the trace; the per-stage totals count everything
+
+_run = None              # the Run being recorded, None when metrics are off
+
+class Run:
+    def __init__(self):
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = []
+        self.dropped = 0
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0])   # name -> [calls, seconds, max seconds]
+        self.counters = defaultdict(int)
+
+    def add(self, name, start, seconds, attrs):
+        with self.lock:
+            stage = self.stages[name]
+            stage[0] += 1
+            stage[1] += seconds
+            stage[2] = max(stage[2], seconds)
+            if len(self.events) < MAX_EVENTS:
+                self.events.append({"name": name, "ph": "X", "ts": round((start - self.origin) * 1e6),
+                                    "dur": round(seconds * 1e6), "pid": os.getpid(),
+                                    "tid": threading.get_ident(), "args": attrs})
+            else:
+                self.dropped += 1
+
+class _Span:
+    __slots__ = ("run", "name", "attrs", "start")
+
+    def __init__(self, run, name, attrs):
+        self.run, self.name, self.attrs = run, name, attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.run.add(self.name, self.start, time.perf_counter() - self.start, self.attrs)
+        return False
+
+    def set(self, **attrs):
+        """Adds attributes that are only known at the end (e.g. the size of what was written)."""
+        self.attrs.update(attrs)
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+def enabled():
+    return _run is not None
+
+def start():
+    """Starts recording a new run (and forgets anything recorded before)."""
+    global _run
+    _run = Run()
+
+def stop():
+    """Stops recording and returns what was recorded as a dict (see merge), or None if nothing was."""
+    global _run
+    run, _run = _run, None
+    if run is None:
+        return None
+    return {"events": run.events, "dropped": run.dropped, "stages": dict(run.stages),
+            "counters": dict(run.counters), "origin": run.origin}
+
+def span(name, **attrs):
+    """Times the block under `name`; `attrs` (e.g. the snapshot) go into the trace event."""
+    run = _run
+    if run is None:
+        return _NO_SPAN
+    return _Span(run, name, attrs)
+
+def add(name, seconds, **attrs):
+    """A span the caller has timed itself, ending now (for blocks that don't fit a with statement)."""
+    run = _run
+    if run is None:
+        return
+    run.add(name, time.perf_counter() - seconds, seconds, attrs)
+
+def count(name, n=1):
+    """Adds n to the counter `name`."""
+    run = _run
+    if run is None:
+        return
+    with run.lock:
+        run.counters[name] += n
+
+def merge(data):
+    """
+    Adds what another process recorded (the dict from its stop()) to this run, e.g. the analysis workers.
+    perf_counter is the same clock in every process on one machine, so the events line up.
+    """
+    run = _run
+    if run is None or not data:
+        return
+    shift = round((data["origin"] - run.origin) * 1e6)
+    with run.lock:
+        for name, (calls, seconds, longest) in data["stages"].items():
+            stage = run.stages[name]
+            stage[0] += calls
+            stage[1] += seconds
+            stage[2] = max(stage[2], longest)
+        for name, n in data["counters"].items():
+            run.counters[name] += n
+        room = max(0, MAX_EVENTS - len(run.events))
+        run.events.extend(dict(e, ts=e["ts"] + shift) for e in data["events"][:room])
+        run.dropped += data["dropped"] + max(0, len(data["events"]) - room)
+
+def summary():
+    """Calls, total, mean and longest seconds per stage, slowest total first."""
+    run = _run
+    if run is None:
+        return {}
+    with run.lock:
+        stages = sorted(run.stages.items(), key=lambda item: -item[1][1])
+    return {name: {"calls": calls, "seconds": round(seconds, 6), "mean": round(seconds / calls, 6),
+                   "max": round(longest, 6)} for name, (calls, seconds, longest) in stages}
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+def _number(n):
+    # whole numbers without exponent, so byte counts stay exact
+    return str(int(n)) if float(n).is_integer() else repr(float(n))
+
+def prometheus_text():
+    """The run in the Prometheus text format: seconds and calls per stage, every counter, and when it ran."""
+    run = _run
+    lines = [
+        "# HELP wtc_stage_seconds_total Seconds spent in each stage during the last run.",
+        "# TYPE wtc_stage_seconds_total counter",
+    ]
+    stages = summary()
+    lines += [f'wtc_stage_seconds_total{{stage="{name}"}} {s["seconds"]}' for name, s in stages.items()]
+    lines += ["# HELP wtc_stage_calls_total Times each stage ran during the last run.",
+              "# TYPE wtc_stage_calls_total counter"]
+    lines += [f'wtc_stage_calls_total{{stage="{name}"}} {s["calls"]}' for name, s in stages.items()]
+    lines += ["# HELP wtc_stage_max_seconds Longest single run of each stage during the last run.",
+              "# TYPE wtc_stage_max_seconds gauge"]
+    lines += [f'wtc_stage_max_seconds{{stage="{name}"}} {s["max"]}' for name, s in stages.items()]
+    with run.lock:
+        counters = sorted(run.counters.items())
+    for name, n in counters:
+        metric = f"wtc_{_metric_name(name)}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {_number(n)}"]
+    lines += ["# HELP wtc_run_seconds Wall time of the last run.", "# TYPE wtc_run_seconds gauge",
+              f"wtc_run_seconds {time.time() - run.started:.3f}",
+              "# HELP wtc_run_timestamp_seconds When the last run started.", "# TYPE wtc_run_timestamp_seconds gauge",
+              f"wtc_run_timestamp_seconds {run.started:.0f}"]
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path, text):
+    # a scraper never sees half a file
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+
+def write(out_dir=METRICS_DIR):
+    """
+    Writes out_dir/trace-<start time>.json and out_dir/website_time_capsule.prom (replaced every run).
+    Returns the trace path, or None if metrics are off.
+    """
+    run = _run
+    if run is None:
+        return None
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with run.lock:
+        events = list(run.events)
+        counters = dict(run.counters)
+    trace = {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run.started)),
+        "seconds": round(time.time() - run.started, 3),
+        "stages": summary(),
+        "counters": counters,
+        "dropped_events": run.dropped,
+    }
+    trace_path = out_dir / f"trace-{time.strftime('%Y%m%d-%H%M%S', time.localtime(run.started))}.json"
+    _write_atomic(trace_path, json.dumps(trace))
+    _write_atomic(out_dir / PROM_FILE, prometheus_text())
+    return trace_path
+
+def report(top=12):
+    """Prints the slowest stages and the counters."""
+    stages = summary()
+    if not stages:
+        return
+    print(f"\n[INFO] Time per stage ({len(stages)} stage(s), slowest first):")
+    for name, s in list(stages.items())[:top]:
+        print(f"  {name:<28} {s['seconds']:9.2f}s  {s['calls']:7d} call(s)  mean {s['mean'] * 1000:8.1f} ms"
+              f"  max {s['max'] * 1000:8.1f} ms")
+    with _run.lock:
+        counters = sorted(_run.counters.items())
+    if counters:
+        print("  " + ", ".join(f"{name} {_number(n)}" for name, n in counters))
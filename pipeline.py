@@ -0,0 +1,169 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from io import BytesIO
+from pathlib import Path
+from PIL import Image
+from capture import CONCURRENCY, capture_all, write_png
+from helper import snapshot_timestamp
+import frame_store
+import metrics
+from process_images import (MEDIA_DIR, analyse_pair, make_media_dirs, media_dirs, pair_done, pair_paths,
+                            save_identical_pair, save_pair)
+
+# Capture and analysis at the same time instead of one after the other.
+# Playwright hands every screenshot over as PNG bytes, they go through a small queue to one analysis thread,
+# and that thread diffs the pair (i, i+1) as soon as both screenshots are there. Saving the PNGs, masks and
+# glitches happens on a few writer threads, so neither the browser nor the analysis waits for the disk.
+QUEUE_SIZE = 8       # screenshots waiting for the analysis; when it's full, capture waits a moment
+WRITER_THREADS = 2
+DONE = object()      # put on the queue after the last screenshot
+
+def _analysis_worker(frames, stems, media_dir, writer, threshold, stats, slots):
+    """
+    Reads (path, png bytes / path / None) from the queue and analyses neighbouring pairs in timestamp order.
+    Screenshots arrive in whatever order the pages finish, so I keep the ones that came too early
+    until the screenshot before them is there. None means the snapshot could not be captured.
+    Every screenshot goes into the frame store; two identical neighbours don't need any pixel work.
+    `slots` (a semaphore or None) is held while a pair is diffed, to cap the analyses across several runs.
+    """
+    order = {stem: i for i, stem in enumerate(stems)}
+    arrived = {}
+    cursor = 0           # next position in `stems` to look at
+    prev = None          # (path, hash, image or None) of the last screenshot that exists
+    writes = []          # (pair name, future of its save); a pair only counts once it is on disk
+    con = None
+
+    def decode(data):
+        img = Image.open(BytesIO(data) if isinstance(data, bytes) else data)
+        img.load()
+        return img
+
+    try:
+        out_path, _, _, store_dir = media_dirs(media_dir)
+        con = frame_store.open_store(store_dir)
+        known = frame_store.sync(con, out_path, store_dir)   # screenshots already on disk don't need to be hashed again
+
+        while True:
+            item = frames.get()
+            if item is DONE:
+                break
+            path, data = item
+            if path.stem in order:
+                arrived[path.stem] = (path, data)
+
+            while cursor < len(stems) and stems[cursor] in arrived:
+                path, data = arrived.pop(stems[cursor])
+                cursor += 1
+                if data is None:
+                    continue
+                try:
+                    img = None
+                    if isinstance(data, bytes) or path.stem not in known:
+                        img = decode(data)
+                        with metrics.span("analysis.hash"):
+                            known[path.stem] = frame_store.add(con, path, img, store_dir)
+                    digest = known[path.stem]
+                    if prev is not None:
+                        if not pair_done(prev[0].stem, path.stem, media_dir):
+                            glitch_path, mask_path = pair_paths(prev[0].stem, path.stem, media_dir=media_dir)
+                            if prev[1] == digest:
+                                future = writer.submit(save_identical_pair, path, glitch_path, mask_path)
+                            else:
+                                img = decode(data) if img is None else img
+                                img_a = decode(prev[0]) if prev[2] is None else prev[2]
+                                with slots or nullcontext():
+                                    mask, glitch_img = analyse_pair(img_a, img, threshold)
+                                future = writer.submit(save_pair, mask, glitch_img, glitch_path, mask_path)
+                            writes.append((f"{prev[0].stem}__{path.stem}", future))
+                except Exception as e:
+                    # one broken screenshot shouldn't stop the rest (and the queue has to keep draining)
+                    print(f"WARN: Could not analyse {path.stem}: {e}")
+                    continue
+                prev = (path, digest, img)
+    except Exception as e:
+        # the capture keeps handing over screenshots and would wait forever on a full queue
+        print(f"ERROR: The analysis stopped: {e}")
+        while frames.get() is not DONE:
+            pass
+    finally:
+        if con is not None:
+            con.close()
+        for name, future in writes:
+            try:
+                future.result()
+                stats["pairs"] += 1
+            except Exception as e:
+                print(f"WARN: Could not save the pair {name}: {e}")
+
+async def capture_and_analyse_all(urls, media_dir=MEDIA_DIR, threshold=15, queue_size=QUEUE_SIZE, analysis_slots=None,
+                                  **capture_args):
+    """
+    Runs capture_all and the pair analysis together. `capture_args` go straight to capture_all.
+    Screenshots go to media_dir/screenshots, masks and glitches next to them (see process_images.media_dirs).
+    Screenshots already there take part too, so a new snapshot between two old ones gets both of its pairs.
+    `analysis_slots` (a threading semaphore) caps the pairs diffed at the same time across several runs.
+    Returns (saved, skipped, number of pairs analysed).
+    """
+    out_path = media_dirs(media_dir)[0]
+    out_path.mkdir(parents=True, exist_ok=True)
+    make_media_dirs(media_dir)
+    run_stems = {snapshot_timestamp(url, f"snapshot{i}") for i, url in enumerate(urls)}
+    on_disk = {p.stem for p in out_path.glob("*.png")}
+    stems = sorted(run_stems | on_disk)
+
+    frames = queue.Queue(maxsize=queue_size)
+    stats = {"pairs": 0}
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(WRITER_THREADS) as writer:
+        worker = threading.Thread(target=_analysis_worker, daemon=True,
+                                  args=(frames, stems, media_dir, writer, threshold, stats, analysis_slots))
+        worker.start()
+
+        async def hand_over(item):
+            # a full queue blocks, so that happens on a helper thread and not in the event loop
+            await loop.run_in_executor(None, frames.put, item)
+
+        # old screenshots that aren't part of this run are read from disk by the worker
+        for stem in sorted(on_disk - run_stems):
+            path = out_path / f"{stem}.png"
+            await hand_over((path, path))
+
+        async def on_frame(file_path, status, data):
+            if status == "captured":
+                # the PNG is on disk before capture_all marks the snapshot as done
+                await asyncio.wrap_future(writer.submit(write_png, file_path, data))
+            elif file_path.exists():
+                data = file_path   # done in an earlier run (or an old copy of a snapshot that failed now)
+            await hand_over((file_path, data))
+
+        try:
+            saved, skipped = await capture_all(urls, out_path, on_frame=on_frame, **capture_args)
+        finally:
+            await hand_over(DONE)
+            await loop.run_in_executor(None, worker.join)
+    return saved, skipped, stats["pairs"]
+
+def capture_and_analyse(input_file="data/snapshot_urls.txt", media_dir=MEDIA_DIR, viewport=(1280, 800),
+                        retries=1, concurrency=CONCURRENCY, readiness="stable", threshold=15):
+    """Synchronous entry point for main.py, reads the URL list like take_screenshots does."""
+    input_path = Path(input_file)
+    if not input_path.exists():
+        print(f"[ERROR] Input file not found: {input_path}")
+        return [], []
+    urls = [u.strip() for u in input_path.read_text(encoding="utf-8").splitlines() if u.strip()]
+    if not urls:
+        print("[ERROR] URL list is empty.")
+        return [], []
+
+    saved, skipped, pairs = asyncio.run(capture_and_analyse_all(
+        urls, media_dir, threshold=threshold, viewport=viewport, retries=retries,
+        concurrency=concurrency, readiness=readiness,
+    ))
+    print(f"\n[INFO] Saved {len(saved)} screenshot(s) to {media_dirs(media_dir)[0]}, analysed {pairs} pair(s) on the way")
+    if skipped:
+        print(f"[INFO] Skipped {len(skipped)} snapshot(s).")
+    return saved, skipped
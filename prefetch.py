@@ -0,0 +1,80 @@
+import queue
+import threading
+
+# A background thread that loads what the viewer is going to need, so the 60 FPS loop never waits for the disk.
+# The viewer says what it wants, most important first (the frames on screen, then the ones ahead of the
+# slider in the direction it's moving); a newer wish list simply replaces the old one. Finished loads are
+# picked up by the render loop with drain().
+
+class FrameLoader:
+    def __init__(self, load, on_ready=None):
+        """
+        `load(job)` runs on the loader thread and returns whatever the render loop needs to build a surface.
+        `on_ready()` (also on the loader thread) is called after every finished load, e.g. to wake up a loop
+        that sleeps while there is nothing to do.
+        """
+        self._load = load
+        self._on_ready = on_ready
+        self._wanted = []               # [(key, job)], most important first
+        self._ready = queue.Queue()
+        self._ready_keys = set()        # loaded but not drained yet, so not loaded twice
+        self._busy_key = None
+        self._cond = threading.Condition()
+        self._stop = False
+        self.loaded = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def want(self, jobs):
+        """Replaces the wish list. Keys that are already loaded or being loaded are left out."""
+        with self._cond:
+            self._wanted = [(key, job) for key, job in jobs
+                            if key not in self._ready_keys and key != self._busy_key]
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._wanted)
+
+    def drain(self, max_items=None):
+        """Everything loaded since the last call (at most max_items), as [(key, result)]."""
+        out = []
+        while max_items is None or len(out) < max_items:
+            try:
+                key, result = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            with self._cond:
+                self._ready_keys.discard(key)
+            out.append((key, result))
+        return out
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._wanted and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                key, job = self._wanted.pop(0)
+                self._busy_key = key
+            try:
+                result = self._load(job)
+                self.loaded += 1
+            except Exception as e:
+                print(f"WARN: Could not load {key}: {e}")
+                result = None
+                self.failed += 1
+            with self._cond:
+                self._busy_key = None
+                self._ready_keys.add(key)
+            self._ready.put((key, result))
+            if self._on_ready:
+                self._on_ready()
@@ -1,18 +1,54 @@
 # src/process_image.py
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import lru_cache
 from pathlib import Path
 from PIL import Image
 import numpy as np
-
-# directories for input and output
-SCREENSHOT_DIR = Path("media/screenshots")   # raw screenshots from Playwright
-GLITCH_DIR = Path("media/glitches")          # colorful glitch effects
-MASK_DIR = Path("media/masks")               # black & white difference masks
-
-for d in (GLITCH_DIR, MASK_DIR):
-    d.mkdir(parents=True, exist_ok=True)
-
-def list_screenshots():
-    return sorted(SCREENSHOT_DIR.glob("*.png"))
+from glitch import renderer
+from regions import empty_index, find_regions, regions_path, save_regions
+import frame_store
+import image_codecs
+import metrics
+
+# directories for input and output (batch.py gives every domain its own media directory)
+MEDIA_DIR = Path("media")
+SCREENSHOT_DIR = MEDIA_DIR / "screenshots"   # raw screenshots from Playwright
+GLITCH_DIR = MEDIA_DIR / "glitches"          # colorful glitch effects
+MASK_DIR = MEDIA_DIR / "masks"               # black & white difference masks
+
+ANALYSIS_WORKERS = os.cpu_count() or 1
+DIFF_STRIP_ROWS = 64    # compute_mask diffs this many rows at a time (see benchmarks/bench_compute_mask.py)
+MASK_CODEC = "packbits"     # how masks and glitches are saved, see image_codecs.py
+GLITCH_CODEC = "png-fast"
+DECODE_CACHE_SIZE = 2   # a chunk walks pair by pair, so only the current and the previous screenshot are needed
+
+def media_dirs(media_dir=MEDIA_DIR):
+    """The screenshot, glitch, mask and frame store directories inside a media directory."""
+    media_dir = Path(media_dir)
+    return media_dir / "screenshots", media_dir / "glitches", media_dir / "masks", media_dir / "frames"
+
+def make_media_dirs(media_dir=MEDIA_DIR):
+    for d in media_dirs(media_dir)[1:3]:
+        d.mkdir(parents=True, exist_ok=True)
+
+def screenshot_index(media_dir=MEDIA_DIR):
+    """
+    All screenshots in timestamp order as (path, pixel hash), through the frame store (frame_store.py).
+    New screenshots are hashed and deduplicated on the way.
+    """
+    screenshot_dir, _, _, store_dir = media_dirs(media_dir)
+    con = frame_store.open_store(store_dir)
+    try:
+        with metrics.span("analysis.index"):
+            frames = frame_store.sync(con, screenshot_dir, store_dir)
+    finally:
+        con.close()
+    return [(screenshot_dir / f"{ts}.png", frames[ts]) for ts in sorted(frames)]
+
+def list_screenshots(media_dir=MEDIA_DIR):
+    return [path for path, _ in screenshot_index(media_dir)]
 
 # this function concerts the Pillow image to Numpy array
 def to_rgb_array(img: Image.Image):
@@ -33,19 +69,44 @@ def center_crop(a: Image.Image, b: Image.Image):
     return crop(a), crop(b)
 
 
-def compute_mask(img_a, img_b, threshold=15):
+def diff_mask(arr_a, arr_b, threshold=15, strip_rows=None):
+    """
+    True where any RGB channel of the two uint8 arrays differs by more than `threshold`.
+    Stays in uint8 the whole time: |a - b| is max(a, b) - min(a, b), which can't wrap around,
+    and everything is written into a few reused buffers. With `strip_rows` the frame is done a band
+    of rows at a time, so the buffers are only that big (useful for long full-page captures).
+    Gives exactly the same mask as np.abs(a.astype(int) - b.astype(int)).max(axis=2) > threshold.
+    """
+    h, w = arr_a.shape[:2]
+    mask = np.empty((h, w), dtype=bool)
+    rows = min(strip_rows or h, h) or 1
+    hi = np.empty((rows, w, 3), dtype=np.uint8)
+    lo = np.empty((rows, w, 3), dtype=np.uint8)
+    channel_max = np.empty((rows, w), dtype=np.uint8)
+
+    for top in range(0, h, rows):
+        a, b = arr_a[top:top + rows], arr_b[top:top + rows]
+        n = a.shape[0]   # the last strip can be shorter
+        d, m, c = hi[:n], lo[:n], channel_max[:n]
+        np.maximum(a, b, out=d)
+        np.minimum(a, b, out=m)
+        np.subtract(d, m, out=d)
+        np.maximum(d[..., 0], d[..., 1], out=c)
+        np.maximum(c, d[..., 2], out=c)
+        np.greater(c, threshold, out=mask[top:top + n])
+    return mask
+
+
+def compute_mask(img_a, img_b, threshold=15, strip_rows=DIFF_STRIP_ROWS):
     """
     This function compares the two images and returns:
       - mask (True where pixels differ more than `threshold`)
     The mask is a boolean array (same size as the images).
     """
     a, b = center_crop(img_a, img_b)
-    arr_a, arr_b = to_rgb_array(a).astype(int), to_rgb_array(b).astype(int)
-
-    diff = np.abs(arr_a - arr_b).max(axis=2)
 
     # marks a change / adds to mask if difference > threshold
-    mask = diff > threshold
+    mask = diff_mask(to_rgb_array(a), to_rgb_array(b), threshold, strip_rows)
     return mask, a, b
 
 
@@ -73,75 +134,195 @@ def shift(channel, dy=0, dx=0):
     return out
 
 
-def make_glitch(img_a, img_b, mask):
+def make_glitch(img_a, img_b, mask, preset="default"):
     """
     This builds a glitch effect from two aligned images using the mask.
     - It starts building from image B and for changed pixels (mask==True), replaces with RGB channel shifts
       that mix A and B together.
+    The shifting and mixing happens in glitch.py (one pass per channel, buffers reused between pairs);
+    `preset` is one of glitch.PRESETS or an offset table like them.
     """
-    arr_a = to_rgb_array(img_a)
-    arr_b = to_rgb_array(img_b)
+    out = renderer().render(to_rgb_array(img_a), to_rgb_array(img_b), mask, preset)
+    return Image.fromarray(out)   # copies, so the buffer can be reused for the next pair
 
-    # split into channels
-    r_a, g_a, b_a = arr_a[...,0], arr_a[...,1], arr_a[...,2]
-    r_b, g_b, b_b = arr_b[...,0], arr_b[...,1], arr_b[...,2]
 
-    # shifted versions of A
-    r_a_s = shift(r_a, dx=-10)
-    g_a_s = shift(g_a, dy=10)
-    b_a_s = shift(b_a, dx=10)
+def pair_paths(stem_a, stem_b, glitch_codec=GLITCH_CODEC, mask_codec=MASK_CODEC, media_dir=MEDIA_DIR):
+    """Where the glitch and the mask of the pair (a, b) are saved (the suffix depends on the codec)."""
+    name = f"{stem_a}__{stem_b}"
+    _, glitch_dir, mask_dir, _ = media_dirs(media_dir)
+    return (glitch_dir / (name + image_codecs.GLITCH_SUFFIXES[glitch_codec]),
+            mask_dir / (name + "_mask" + image_codecs.MASK_SUFFIXES[mask_codec]))
 
-    # shifted versions of B
-    r_b_s = shift(r_b, dx=10)
-    g_b_s = shift(g_b, dy=10)
-    b_b_s = shift(b_b, dx=10)
 
-    # starts from B as base
-    out = arr_b.copy()
+def saved_pair(stem_a, stem_b, media_dir=MEDIA_DIR):
+    """The glitch and mask files of the pair (a, b) in whatever format they were saved (None if missing)."""
+    name = f"{stem_a}__{stem_b}"
+    _, glitch_dir, mask_dir, _ = media_dirs(media_dir)
+    return image_codecs.find(glitch_dir / name), image_codecs.find(mask_dir / f"{name}_mask")
 
-    # This mixes the shifted A and B channels only where mask==True
-    out[...,0][mask] = ((r_a_s[mask] + r_b_s[mask]) // 2).astype(np.uint8)
-    out[...,1][mask] = ((g_a_s[mask] + g_b_s[mask]) // 2).astype(np.uint8)
-    out[...,2][mask] = ((b_a_s[mask] + b_b_s[mask]) // 2).astype(np.uint8)
 
-    return Image.fromarray(out)
+def pair_done(stem_a, stem_b, media_dir=MEDIA_DIR):
+    return all(saved_pair(stem_a, stem_b, media_dir))
 
 
-def analyse_all(threshold=15):
+def analyse_pair(img_a, img_b, threshold=15):
+    """
+    Computes the mask and the glitch image for two screenshots (Pillow images).
+    Returns (mask, glitch image).
+    """
+    with metrics.span("analysis.compute_mask"):
+        mask, A_aligned, B_aligned = compute_mask(img_a, img_b, threshold)
+    with metrics.span("analysis.glitch"):
+        glitch_img = make_glitch(A_aligned, B_aligned, mask)
+    metrics.count("analysis.pairs")
+    return mask, glitch_img
+
+
+def save_pair(mask, glitch_img, glitch_path, mask_path, glitch_codec=GLITCH_CODEC, mask_codec=MASK_CODEC):
+    # saves mask (True = changed pixels) and the glitch effect, replacing older files of the pair in any format
+    # (files are written to a temporary name and renamed, so an old glitch that is a hard link stays untouched)
+    image_codecs.remove(Path(mask_path).with_suffix(""))
+    image_codecs.remove(Path(glitch_path).with_suffix(""))
+    with metrics.span("analysis.save_mask", codec=mask_codec):
+        image_codecs.save_mask(mask, mask_path, mask_codec)
+    with metrics.span("analysis.save_glitch", codec=glitch_codec):
+        image_codecs.save_glitch(glitch_img, glitch_path, glitch_codec)
+    # and where it changed (regions.py), so nobody has to scan the mask again
+    with metrics.span("analysis.regions"):
+        save_regions(find_regions(mask), regions_path(mask_path))
+    if metrics.enabled():
+        metrics.count("analysis.bytes_written", Path(mask_path).stat().st_size + Path(glitch_path).stat().st_size)
+
+
+def save_identical_pair(path_b, glitch_path, mask_path, mask_codec=MASK_CODEC):
+    """
+    Two screenshots with the same pixels: the mask is empty and the glitch is just B,
+    so nothing has to be decoded or compared. The glitch is a link to B's PNG, whatever the glitch codec.
+    """
+    with Image.open(path_b) as img:   # only reads the header
+        w, h = img.size
+    glitch_base, mask_base = Path(glitch_path).with_suffix(""), Path(mask_path).with_suffix("")
+    image_codecs.remove(mask_base)
+    image_codecs.remove(glitch_base)
+    image_codecs.save_mask(np.zeros((h, w), dtype=bool), mask_path, mask_codec)
+    frame_store.link_or_copy(path_b, glitch_base.with_suffix(".png"))
+    save_regions(empty_index(w, h), regions_path(mask_path))
+    metrics.count("analysis.identical_pairs")
+
+
+def backfill_regions(mask_path):
+    """Builds the region index of a mask saved before there were region indexes."""
+    mask = image_codecs.load_mask(mask_path)
+    save_regions(find_regions(mask), regions_path(mask_path))
+
+
+def load_screenshot(path):
+    """
+    Opens and decodes a screenshot once; the pair after it gets the same image from the cache.
+    Converting to RGB before cropping gives the same pixels as cropping first.
+    A screenshot that was taken again (new mtime or size) is decoded again.
+    """
+    st = Path(path).stat()
+    return _decode(path, st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def _decode(path, mtime_ns, size):
+    # mtime_ns and size are only part of the cache key
+    with metrics.span("analysis.decode"), Image.open(path) as img:
+        return img.convert("RGB")
+
+
+def _analyse_chunk(shots, threshold, glitch_codec=GLITCH_CODEC, mask_codec=MASK_CODEC, media_dir=MEDIA_DIR):
+    """
+    Analyses the consecutive pairs of `shots` (a run of (path, hash) in order) and saves the results.
+    Each screenshot is decoded once, except the first one, which the chunk before has decoded as well.
+    Pairs of identical frames aren't decoded at all.
+    Returns the names of the glitch images saved.
+    """
+    saved = []
+    for (path_a, hash_a), (path_b, hash_b) in zip(shots, shots[1:]):
+        glitch_path, mask_path = pair_paths(path_a.stem, path_b.stem, glitch_codec, mask_codec, media_dir)
+        if hash_a == hash_b:
+            save_identical_pair(path_b, glitch_path, mask_path, mask_codec)
+        else:
+            mask, glitch_img = analyse_pair(load_screenshot(path_a), load_screenshot(path_b), threshold)
+            save_pair(mask, glitch_img, glitch_path, mask_path, glitch_codec, mask_codec)
+        saved.append(glitch_path.name)
+    return saved
+
+
+def _analyse_chunk_traced(*args):
+    """_analyse_chunk in a worker process while metrics are on: returns (saved, what the worker recorded)."""
+    metrics.start()   # a forked worker starts with a copy of the parent's run, which mustn't be sent back
+    saved = _analyse_chunk(*args)
+    return saved, metrics.stop()
+
+
+def _chunks(todo, chunk_size):
+    """Splits the pair indices into runs of consecutive pairs, at most chunk_size long."""
+    run = []
+    for i in todo:
+        if run and (i != run[-1] + 1 or len(run) == chunk_size):
+            yield run
+            run = []
+        run.append(i)
+    if run:
+        yield run
+
+
+def analyse_all(threshold=15, workers=ANALYSIS_WORKERS, chunk_size=None, glitch_codec=GLITCH_CODEC,
+                mask_codec=MASK_CODEC, media_dir=MEDIA_DIR, pool=None):
     """
     This is the main function:
-    - Gooes through each pair of consecutive screenshots
+    - Gooes through each pair of consecutive screenshots that hasn't been analysed yet
     - Computes mask (differences)
-    - Saves mask (black & white)
-    - Saves glitch (colorful effect)
+    - Saves mask (bit-packed, see MASK_CODEC)
+    - Saves glitch (colorful effect, see GLITCH_CODEC)
+    - Saves the changed regions (JSON next to the mask)
+    The pairs are split into chunks of consecutive pairs which run on `workers` processes;
+    the results are the same as doing them one by one (workers=1).
+    Identical neighbours (same pixel hash in the frame store) get an empty mask without any pixel work.
+    Pass a `pool` (ProcessPoolExecutor) to share one set of worker processes between several media directories.
     """
-    shots = list_screenshots()
+    shots = screenshot_index(media_dir)
     if len(shots) < 2:
         print("Need at least 2 screenshots.")
         return
+    make_media_dirs(media_dir)
 
+    todo = []
     for i in range(len(shots)-1):
-        name = f"{shots[i].stem}__{shots[i+1].stem}.png"
-        glitch_path = GLITCH_DIR / name
-        mask_path = MASK_DIR / name.replace(".png","_mask.png")
-
-        if glitch_path.exists() and mask_path.exists():
-            continue
-
-        # 1. opens both screenshots
-        A, B = Image.open(shots[i]), Image.open(shots[i+1])
-
-        # 2. computes mask + aligned images
-        mask, A_aligned, B_aligned = compute_mask(A, B, threshold)
+        glitch_path, mask_path = saved_pair(shots[i][0].stem, shots[i+1][0].stem, media_dir)
+        if not (glitch_path and mask_path):
+            todo.append(i)
+        elif not regions_path(mask_path).exists():
+            backfill_regions(mask_path)
+    if not todo:
+        return
 
-        # 3. saves mask (white = changed pixels, black = unchanged)
-        Image.fromarray(mask.astype(np.uint8)*255).save(mask_path)
+    workers = max(1, min(workers or 1, len(todo)))
+    # a few chunks per worker, so a slow chunk at the end doesn't leave the other cores idle
+    chunk_size = chunk_size or max(1, -(-len(todo) // (workers * 4)))
+    chunks = [shots[run[0]:run[-1] + 2] for run in _chunks(todo, chunk_size)]
 
-        # 4. saves glitch effect
-        glitch_img = make_glitch(A_aligned, B_aligned, mask)
-        glitch_img.save(glitch_path)
+    if pool is None and (workers == 1 or len(chunks) == 1):
+        for paths in chunks:
+            for name in _analyse_chunk(paths, threshold, glitch_codec, mask_codec, media_dir):
+                print("Saved", name)
+        return
 
-        print("Saved", glitch_path.name)
+    traced = metrics.enabled()
+    with nullcontext(pool) if pool else ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_analyse_chunk_traced if traced else _analyse_chunk,
+                               paths, threshold, glitch_codec, mask_codec, media_dir) for paths in chunks]
+        for future in as_completed(futures):
+            saved = future.result()
+            if traced:
+                saved, recorded = saved
+                metrics.merge(recorded)
+            for name in saved:
+                print("Saved", name)
 
 
 if __name__=="__main__":
@@ -0,0 +1,120 @@
+import json
+from pathlib import Path
+import numpy as np
+
+# A small index of where a pair of screenshots changed, so the viewer (or a report) doesn't have to
+# scan the whole mask again. The mask is cut into tiles, neighbouring changed tiles form one region,
+# and for every region I keep the bounding box of its changed pixels and how many there are.
+TILE = 16          # pixels per tile side
+DILATE = 4         # changed pixels closer than this (in px) end up in the same region
+MAX_REGIONS = 256  # the rest is merged into one box, a noisy diff shouldn't make a huge file
+
+def regions_path(mask_path):
+    """media/masks/a__b_mask.npz (or .png, ...) -> media/masks/a__b_regions.json"""
+    mask_path = Path(mask_path)
+    return mask_path.with_name(mask_path.stem.removesuffix("_mask") + "_regions.json")
+
+def dilate(mask, radius):
+    """Grows the True areas of a 2D bool mask by `radius` pixels (a square, done row- and column-wise)."""
+    if radius <= 0:
+        return mask
+    out = mask.copy()
+    for k in range(1, radius + 1):
+        out[k:] |= mask[:-k]
+        out[:-k] |= mask[k:]
+    rows = out.copy()
+    for k in range(1, radius + 1):
+        out[:, k:] |= rows[:, :-k]
+        out[:, :-k] |= rows[:, k:]
+    return out
+
+def _tiles(mask, tile):
+    """The mask padded to whole tiles, as a (rows of tiles, tile, columns of tiles, tile) view."""
+    h, w = mask.shape
+    gh, gw = -(-h // tile), -(-w // tile)
+    padded = np.zeros((gh * tile, gw * tile), dtype=bool)
+    padded[:h, :w] = mask
+    return padded.reshape(gh, tile, gw, tile)
+
+def _components(grid):
+    """Groups of 8-connected True cells of a small 2D bool grid (flood fill with a stack)."""
+    gh, gw = grid.shape
+    seen = np.zeros_like(grid)
+    groups = []
+    for y, x in np.argwhere(grid):
+        if seen[y, x]:
+            continue
+        seen[y, x] = True
+        stack, group = [(y, x)], []
+        while stack:
+            cy, cx = stack.pop()
+            group.append((cy, cx))
+            for ny in (cy - 1, cy, cy + 1):
+                for nx in (cx - 1, cx, cx + 1):
+                    if 0 <= ny < gh and 0 <= nx < gw and grid[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        stack.append((ny, nx))
+        groups.append(group)
+    return groups
+
+def empty_index(width, height, tile=TILE, radius=DILATE):
+    """The index of a pair without any change."""
+    return {"width": width, "height": height, "tile": tile, "dilate": radius, "changed_pixels": 0,
+            "changed_fraction": 0.0, "regions": []}
+
+def find_regions(mask, tile=TILE, radius=DILATE):
+    """
+    Returns the region index of a change mask as a dict:
+    size, changed pixels, changed fraction and the regions (x, y, w, h, pixels), biggest first.
+    """
+    h, w = mask.shape
+    index = empty_index(w, h, tile, radius)
+    changed = int(np.count_nonzero(mask))
+    if changed == 0:
+        return index
+    index["changed_pixels"] = changed
+    index["changed_fraction"] = changed / mask.size
+
+    tiles = _tiles(mask, tile)
+    counts = tiles.sum(axis=(1, 3))
+    grid = _tiles(dilate(mask, radius), tile).any(axis=(1, 3))
+
+    # first/last changed row and column inside every tile, for exact bounding boxes
+    rows_hit, cols_hit = tiles.any(axis=3), tiles.any(axis=1)     # (gh, tile, gw) and (gh, gw, tile)
+    top = rows_hit.argmax(axis=1)
+    bottom = tile - 1 - rows_hit[:, ::-1].argmax(axis=1)
+    left = cols_hit.argmax(axis=2)
+    right = tile - 1 - cols_hit[:, :, ::-1].argmax(axis=2)
+
+    regions = []
+    for group in _components(grid):
+        # tiles that are only part of the region through dilation have no pixels of their own
+        cells = [(y, x) for y, x in group if counts[y, x]]
+        if not cells:
+            continue
+        ys, xs = np.array(cells).T
+        y0 = int((ys * tile + top[ys, xs]).min())
+        y1 = int((ys * tile + bottom[ys, xs]).max()) + 1
+        x0 = int((xs * tile + left[ys, xs]).min())
+        x1 = int((xs * tile + right[ys, xs]).max()) + 1
+        regions.append({"x": x0, "y": y0, "w": x1 - x0, "h": y1 - y0, "pixels": int(counts[ys, xs].sum())})
+
+    regions.sort(key=lambda r: r["pixels"], reverse=True)
+    if len(regions) > MAX_REGIONS:
+        rest = regions[MAX_REGIONS - 1:]
+        x0, y0 = min(r["x"] for r in rest), min(r["y"] for r in rest)
+        x1, y1 = max(r["x"] + r["w"] for r in rest), max(r["y"] + r["h"] for r in rest)
+        regions = regions[:MAX_REGIONS - 1] + [
+            {"x": x0, "y": y0, "w": x1 - x0, "h": y1 - y0, "pixels": sum(r["pixels"] for r in rest)}]
+    index["regions"] = regions
+    return index
+
+def save_regions(index, path):
+    Path(path).write_text(json.dumps(index), encoding="utf-8")
+
+def load_regions(path):
+    """The region index saved next to a mask, or None if there is none (yet)."""
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,70 @@
+import json
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from get_url import make_session
+from helper import snapshot_timestamp
+
+# The Wayback Machine redirects a requested timestamp to the nearest capture it really has.
+# So two different URLs from the CDX list can end up on the very same page. I ask once (HEAD, no page load),
+# remember the answer on disk and drop the duplicates before Playwright ever opens them.
+REDIRECT_CACHE = Path("data/redirects.json")   # requested URL -> final capture URL
+RESOLVE_WORKERS = 8
+
+def _resolve_one(session, url):
+    """Follows the redirects of one snapshot URL and returns the final capture URL (or None if that failed)."""
+    try:
+        resp = session.head(url, allow_redirects=True, timeout=15)
+        if resp.status_code == 405:   # in case HEAD isn't allowed, I only read the headers of a GET
+            resp = session.get(url, allow_redirects=True, timeout=15, stream=True)
+            resp.close()
+    except requests.RequestException as e:
+        print(f"WARN: Could not resolve {url}: {e}")
+        return None
+    final = resp.url
+    return final if "/web/" in final else None
+
+def load_cache(cache_file=REDIRECT_CACHE):
+    path = Path(cache_file)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        return {}
+
+def save_cache(cache, cache_file=REDIRECT_CACHE):
+    path = Path(cache_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(cache, indent=0, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)   # so a crash never leaves a half written cache
+
+def resolve_snapshots(urls, cache_file=REDIRECT_CACHE, max_workers=RESOLVE_WORKERS):
+    """
+    Maps every snapshot URL to the capture the Wayback Machine really serves for it
+    and returns those final URLs in the same order, with duplicate timestamps dropped.
+    URLs that can't be resolved are kept as they are (and asked again next time).
+    """
+    cache = load_cache(cache_file)
+    todo = [url for url in dict.fromkeys(urls) if url not in cache]
+
+    if todo:
+        with make_session(max_workers) as session, ThreadPoolExecutor(max_workers) as pool:
+            for url, final in zip(todo, pool.map(lambda u: _resolve_one(session, u), todo)):
+                if final:
+                    cache[url] = final
+        save_cache(cache, cache_file)
+
+    resolved, seen = [], set()
+    for url in urls:
+        final = cache.get(url, url)
+        ts = snapshot_timestamp(final, final)
+        if ts in seen:
+            continue
+        seen.add(ts)
+        resolved.append(final)
+
+    if len(resolved) < len(urls):
+        print(f"INFO: {len(urls)} snapshot(s) point to only {len(resolved)} different capture(s)")
+    return resolved
@@ -1,19 +1,13 @@
+import asyncio
 from pathlib import Path
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
-import time
+from capture import CONCURRENCY, capture_all
 
-# ChatGPT prompt: "Write a Python function that removes the Wayback Machine’s toolbar and banners from a webpage when
-# using Playwright. It should run JavaScript in page.evaluate() to select and delete all elements with IDs starting with wm-
+# The older version of screenshot.py. It now uses the same capture engine (capture.py),
+# so retries, timeouts and the best-effort fallback work the same way in both.
 
-def _remove_wayback_banner(page):
-    page.evaluate("""
-    () => {
-      document.querySelectorAll('[id^="wm-"], #donato, #banner').forEach(el => el.remove());
-      document.body.style.marginTop = '0';
-    }
-    """)
-
-def take_screenshots(input_file="data/snapshot_urls.txt", out_dir="media/screenshots", viewport=(1280, 800), retries=1, wait_seconds_after_load=1):
+def take_screenshots(input_file="data/snapshot_urls.txt", out_dir="media/screenshots", viewport=(1280, 800), retries=1,
+                     wait_seconds_after_load=1, concurrency=CONCURRENCY,
+                     readiness="stable"):
     input_path = Path(input_file)
     out_path = Path(out_dir)
     out_path.mkdir(parents=True, exist_ok=True)
@@ -27,56 +21,10 @@ def take_screenshots(input_file="data/snapshot_urls.txt", out_dir="media/screens
         print("ERROR: URL list is empty.")
         return [], []
 
-    saved, skipped = [], []
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page(viewport={"width": viewport[0], "height": viewport[1]})
-
-        # I increase the loading time for slow pages
-        page.set_default_navigation_timeout(60_000)
-        page.set_default_timeout(60_000)
-
-        # I name the screenshots after their timestamp
-        for url in urls:
-            ts = url.split("/web/")[1].split("/")[0]
-            file_path = out_path / f"{ts}.png"
-
-        # Retry loop in case something went wrong the first time
-            for attempt in range(retries + 1):
-                try:
-                    print(f"INFO: Screenshotting {url}")
-                    page.goto(url, wait_until="load")
-
-                    _remove_wayback_banner(page)
-
-                    # This part makes the script wait until all images report as fully loaded (img.complete)
-                    # and actually have pixels (naturalWidth > 0).
-                    try:
-                        page.wait_for_function(
-                            "Array.from(document.images).every(img => img.complete && img.naturalWidth > 0)"
-                        )
-                    except Exception:
-                        pass
-
-                    if wait_seconds_after_load > 0:
-                        time.sleep(wait_seconds_after_load)
-
-                    # Save screenshot (I don't want the full page, just the viewport I set)
-                    page.screenshot(path=str(file_path), full_page=False)
-                    saved.append(str(file_path))
-                    break
-
-                except PlaywrightTimeout:
-                    print(f"ERROR: Timeout at {url}")
-                    if attempt == retries:
-                        skipped.append(url)
-                except Exception as idk:
-                    print(f"[WARN] Error with {url}: {idk}")
-                    if attempt == retries:
-                        skipped.append(url)
-
-        browser.close()
+    saved, skipped = asyncio.run(capture_all(
+        urls, out_path, viewport=viewport, concurrency=concurrency, retries=retries,
+        readiness=readiness, wait_seconds_after_load=wait_seconds_after_load,
+    ))
 
     print(f"Saved {len(saved)} screenshot(s) to {out_path}")
     if skipped:
@@ -85,4 +33,3 @@ def take_screenshots(input_file="data/snapshot_urls.txt", out_dir="media/screens
         print("No skips — all snapshots captured.")
 
     return saved, skipped
-
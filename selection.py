@@ -0,0 +1,123 @@
+import numpy as np
+from helper import snapshot_timestamp
+
+# Picking which snapshots to keep, done on whole NumPy arrays instead of one datetime at a time.
+# All functions take sorted times (datetime64[s], see parse_timestamps) and return the indices to keep.
+
+DAY = 86_400   # seconds
+
+def parse_timestamps(timestamps):
+    """
+    Turns Wayback timestamps ('20100115094530') into a datetime64[s] array.
+    I read the digits straight out of one big byte buffer instead of calling strptime a million times.
+    """
+    n = len(timestamps)
+    if n == 0:
+        return np.empty(0, dtype="datetime64[s]")
+    raw = np.frombuffer("".join(timestamps).encode("ascii"), dtype=np.uint8)
+    if raw.size != n * 14:
+        raise ValueError("Wayback timestamps must have exactly 14 digits (YYYYMMDDhhmmss)")
+    digits = raw.reshape(n, 14) - np.uint8(ord("0"))   # non-digits wrap around to values > 9
+    if digits.max() > 9:
+        raise ValueError("Wayback timestamps must only contain digits")
+
+    def number(start, end):
+        value = np.zeros(n, dtype=np.int64)
+        for col in range(start, end):
+            value *= 10
+            value += digits[:, col]
+        return value
+
+    year, month, day = number(0, 4), number(4, 6), number(6, 8)
+    months = ((year - 1970) * 12 + (month - 1)).astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + (day - 1)
+    seconds = number(8, 10) * 3600 + number(10, 12) * 60 + number(12, 14)
+    return days.astype("datetime64[s]") + seconds
+
+def thin_by_gap(times, min_gap_days, last=None, accept=None):
+    """
+    Keeps the first snapshot and then every next one that is at least `min_gap_days` after the last one kept.
+    This gives exactly the same picks as my old loop ((snapshot_dt - last_date).days >= frequency_days),
+    but jumps from pick to pick with a binary search, so the cost depends on the number of picks, not of snapshots.
+    `last` is the time of the last pick from an earlier chunk, so a long stream can be thinned chunk by chunk.
+    `accept(i)` is asked about every snapshot before it is kept; one it turns down is passed over and the
+    next one is tried, as if the turned down one had never been there.
+    """
+    secs = times.astype("datetime64[s]").astype(np.int64)
+    if secs.size == 0:
+        return np.empty(0, dtype=np.intp)
+
+    # .days rounds down, so "at least N days" really means a whole number of days
+    gap = int(np.ceil(min_gap_days)) * DAY
+    start = 0 if last is None else int(np.searchsorted(secs, np.datetime64(last, "s").astype(np.int64) + gap))
+    if gap <= 0:
+        if accept is None:
+            return np.arange(start, secs.size)
+        return np.asarray([i for i in range(start, secs.size) if accept(i)], dtype=np.intp)
+
+    picks = []
+    i = start
+    while i < secs.size:
+        if accept is not None and not accept(i):
+            i += 1
+            continue
+        picks.append(i)
+        i = int(np.searchsorted(secs, secs[i] + gap))
+    return np.asarray(picks, dtype=np.intp)
+
+def pick_evenly_in_time(times, n):
+    """
+    Picks up to n snapshots spread evenly in time (not by list position) between the first and the last one.
+    Each pick is the snapshot closest to its target time; two targets never get the same snapshot.
+    """
+    secs = times.astype("datetime64[s]").astype(np.int64)
+    if secs.size <= n:
+        return np.arange(secs.size)
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    targets = np.linspace(secs[0], secs[-1], n)
+    right = np.clip(np.searchsorted(secs, targets), 1, secs.size - 1)
+    nearest = np.where(targets - secs[right - 1] <= secs[right] - targets, right - 1, right)
+
+    # if snapshots are clustered, neighbouring targets can land on the same one, so I push them apart
+    picks = np.empty(n, dtype=np.intp)
+    prev = -1
+    for k, idx in enumerate(nearest):
+        idx = min(max(idx, prev + 1), secs.size - (n - k))
+        picks[k] = prev = idx
+    return picks
+
+def first_per_bucket(times, unit="M"):
+    """Keeps the first snapshot of every calendar month ('M') or year ('Y')."""
+    buckets = times.astype(f"datetime64[{unit}]")
+    if buckets.size == 0:
+        return np.empty(0, dtype=np.intp)
+    return np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+
+# The same on lists of snapshot URLs (main.py and batch.py)
+POLICIES = ("even", "monthly", "yearly", "all")
+
+def url_times(urls):
+    """The snapshot times of a list of Wayback URLs as one datetime64 array."""
+    return parse_timestamps([snapshot_timestamp(url) for url in urls])
+
+def pick_evenly(urls, max_snaps=5):
+    if len(urls) <= max_snaps:
+        return urls
+    idxs = pick_evenly_in_time(url_times(urls), max_snaps)  # picks snapshots evenly spread in time, not by position
+    return [urls[i] for i in idxs]
+
+def select_urls(urls, policy="even", max_snaps=5):
+    """
+    Picks the snapshots to capture: "even" spreads max_snaps evenly in time, "monthly"/"yearly" keep the first
+    snapshot of every month/year and "all" keeps everything. Except for "all", at most max_snaps
+    (0 means no limit) are kept, spread evenly in time.
+    """
+    if policy == "monthly" or policy == "yearly":
+        urls = [urls[i] for i in first_per_bucket(url_times(urls), "M" if policy == "monthly" else "Y")]
+    elif policy not in POLICIES:
+        raise ValueError(f"Unknown selection policy: {policy}")
+    if policy == "all" or not max_snaps:
+        return urls
+    return pick_evenly(urls, max_snaps)
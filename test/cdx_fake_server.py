@@ -0,0 +1,82 @@
+# A small fake CDX server so I can try get_url.py without hammering the real Wayback Machine.
+# It understands the parameters I use (url, from, to, limit, showResumeKey, resumeKey) and
+# answers with plain text pages, like the real API.
+#
+# Run it with: python test/cdx_fake_server.py 200000
+# and then point get_snapshots(..., cdx_url="http://127.0.0.1:8765/cdx") at it.
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_timestamps(n, start=datetime(1996, 1, 1), step_seconds=3600):
+    """Returns n sorted 14-digit timestamps, one every `step_seconds`."""
+    return [(start + timedelta(seconds=i * step_seconds)).strftime("%Y%m%d%H%M%S") for i in range(n)]
+
+
+def make_rows(timestamps, distinct=None):
+    """
+    Adds a fake digest and length to every timestamp. With `distinct` the page only has that many
+    different versions, which come back again and again (like a site that switches between layouts).
+    """
+    rows = []
+    for i, ts in enumerate(timestamps):
+        version = i if distinct is None else (i // 3) % distinct
+        rows.append((ts, f"DIGEST{version:010d}", str(1000 + version)))
+    return rows
+
+
+def make_handler(rows, delay=0.0):
+    # plain timestamps work too, they just get a digest each
+    if rows and isinstance(rows[0], str):
+        rows = make_rows(rows)
+    timestamps = [row[0] for row in rows]
+
+    class FakeCDXHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)   # pretend to be a slow, far away server
+            q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            lo = q.get("from", "").ljust(14, "0")
+            hi = q.get("to", "").ljust(14, "9") if q.get("to") else "9" * 14
+            first, end = bisect_left(timestamps, lo), bisect_right(timestamps, hi)
+            fields = [("timestamp", "digest", "length").index(f) for f in q.get("fl", "timestamp").split(",")]
+
+            # the resume key is just the index of the next row here; only the page is sliced out,
+            # so a million rows don't get copied for every page
+            offset = int(q.get("resumeKey", "0"))
+            limit = int(q.get("limit", (end - first) or 1))
+            page = rows[first + offset:min(end, first + offset + limit)]
+
+            body = "".join(" ".join(row[f] for f in fields) + "\n" for row in page)
+            if q.get("showResumeKey") == "true" and first + offset + limit < end:
+                body += f"\n{offset + limit}\n"
+
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return FakeCDXHandler
+
+
+def start_server(rows, port=0, delay=0.0):
+    """Starts the fake server in a background thread and returns (server, cdx_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(rows, delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/cdx"
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    server = ThreadingHTTPServer(("127.0.0.1", 8765), make_handler(make_timestamps(n)))
+    print(f"Fake CDX server with {n} snapshots on http://127.0.0.1:8765/cdx")
+    server.serve_forever()
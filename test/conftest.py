@@ -0,0 +1,25 @@
+import pytest
+import cdx_fake_server
+
+
+@pytest.fixture
+def cdx_server():
+    """Starts fake CDX servers for the given rows (see cdx_fake_server.make_rows); returns their URLs."""
+    servers = []
+
+    def start(rows):
+        server, url = cdx_fake_server.start_server(rows)
+        servers.append(server)
+        return url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def in_tmp(tmp_path, monkeypatch):
+    """Runs the test in an empty directory, so data/... caches start empty and are thrown away."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,126 @@
+import sqlite3
+from datetime import date, timedelta
+import cdx_fake_server
+import cdx_cache
+from cdx_cache import SCHEMA_VERSION, cached_snapshots, connect
+from get_url import _stream_cdx
+
+
+def yearly(first, last):
+    return [f"{year}0615120000" for year in range(first, last + 1)]
+
+
+def recording_fetch(cdx_url, calls):
+    def fetch(frm, to):
+        calls.append((frm, to))
+        return _stream_cdx("http://example.com", frm, to, cdx_url, page_size=3)
+    return fetch
+
+
+def timestamps(rows):
+    return [row[0] for row in rows]
+
+
+def test_first_query_is_fetched_and_cached(cdx_server, tmp_path):
+    url = cdx_server(cdx_fake_server.make_rows(yearly(2000, 2020)))
+    calls, cache = [], tmp_path / "cdx.sqlite"
+    fetch = recording_fetch(url, calls)
+    first = list(cached_snapshots("example.com", "http://", "2010", "2020", fetch, cache))
+    again = list(cached_snapshots("example.com", "http://", "2010", "2020", fetch, cache))
+    assert timestamps(first) == yearly(2010, 2020)
+    assert again == first
+    assert calls == [("2010", "2020")]
+
+
+def test_disjoint_ranges_keep_their_coverage(cdx_server, tmp_path):
+    # 2010-2020, then 2000-2004 (ends before the cached range), then 2000-2020: only the gap is fetched
+    url = cdx_server(cdx_fake_server.make_rows(yearly(2000, 2020)))
+    calls, cache = [], tmp_path / "cdx.sqlite"
+    fetch = recording_fetch(url, calls)
+    list(cached_snapshots("example.com", "http://", "2010", "2020", fetch, cache))
+    assert timestamps(cached_snapshots("example.com", "http://", "2000", "2004", fetch, cache)) == yearly(2000, 2004)
+    calls.clear()
+    rows = list(cached_snapshots("example.com", "http://", "2000", "2020", fetch, cache))
+    assert timestamps(rows) == yearly(2000, 2020)
+    assert len(calls) == 1
+    frm, to = calls[0]
+    assert "20041231" <= frm and to <= "20100101"
+
+
+def test_range_inside_and_around_coverage(cdx_server, tmp_path):
+    url = cdx_server(cdx_fake_server.make_rows(yearly(2000, 2020)))
+    calls, cache = [], tmp_path / "cdx.sqlite"
+    fetch = recording_fetch(url, calls)
+    list(cached_snapshots("example.com", "http://", "2005", "2009", fetch, cache))
+    list(cached_snapshots("example.com", "http://", "2012", "2014", fetch, cache))
+    calls.clear()
+    assert timestamps(cached_snapshots("example.com", "http://", "2006", "2008", fetch, cache)) == yearly(2006, 2008)
+    assert calls == []
+    rows = list(cached_snapshots("example.com", "http://", "2001", "2016", fetch, cache))
+    assert timestamps(rows) == yearly(2001, 2016)
+    assert len(calls) == 3   # before, between and after the two cached ranges
+
+
+def test_range_up_to_today_gets_a_delta_query(tmp_path):
+    # the archive keeps capturing, so a range that reaches today asks again for what came after its newest row
+    today = date.today()
+    archive = [((today - timedelta(days=d)).strftime("%Y%m%d") + "120000", f"D{d}", 100) for d in (30, 20, 10)]
+    calls = []
+
+    def fetch(frm, to):
+        calls.append((frm, to))
+        lo, hi = frm.ljust(14, "0"), to.ljust(14, "9")
+        return iter([row for row in sorted(archive) if lo <= row[0] <= hi])
+
+    cache = tmp_path / "cdx.sqlite"
+    start, end = (today - timedelta(days=60)).strftime("%Y%m%d"), today.strftime("%Y%m%d")
+    assert len(list(cached_snapshots("example.com", "http://", start, end, fetch, cache))) == 3
+
+    archive.append((today.strftime("%Y%m%d") + "000001", "NEW", 100))
+    calls.clear()
+    rows = list(cached_snapshots("example.com", "http://", start, end, fetch, cache))
+    assert [r[1] for r in rows] == ["D30", "D20", "D10", "NEW"]
+    assert calls == [((today - timedelta(days=10)).strftime("%Y%m%d"), end)]
+
+
+def test_failed_fetch_is_not_covered(cdx_server, tmp_path):
+    url = cdx_server(cdx_fake_server.make_rows(yearly(2000, 2020)))
+    cache = tmp_path / "cdx.sqlite"
+
+    def broken(frm, to):
+        yield from _stream_cdx("http://example.com", frm, to, url, page_size=3)
+        raise OSError("connection lost")
+
+    try:
+        list(cached_snapshots("example.com", "http://", "2000", "2020", broken, cache))
+    except OSError:
+        pass
+    calls = []
+    rows = list(cached_snapshots("example.com", "http://", "2000", "2020", recording_fetch(url, calls), cache))
+    assert timestamps(rows) == yearly(2000, 2020)
+    assert calls == [("2000", "2020")]
+
+
+
+def test_old_cache_is_rebuilt(tmp_path):
+    cache = tmp_path / "cdx.sqlite"
+    old = sqlite3.connect(str(cache))
+    old.executescript("CREATE TABLE snapshots (url TEXT, timestamp TEXT); PRAGMA user_version = 1;")
+    old.close()
+    con = connect(cache)
+    assert con.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert con.execute("SELECT count(*) FROM coverage").fetchone() == (0,)
+    con.close()
+
+
+def test_late_rebuild_keeps_what_another_connection_built(tmp_path):
+    # a connection that read the old version before another one rebuilt the cache must not drop it again
+    cache = tmp_path / "cdx.sqlite"
+    first = connect(cache)
+    first.execute("INSERT INTO snapshots VALUES ('example.com', 'http://', '20100101000000', 'D', 1)")
+    first.commit()
+    late = sqlite3.connect(str(cache), timeout=30)
+    cdx_cache._rebuild(late)
+    assert first.execute("SELECT count(*) FROM snapshots").fetchone() == (1,)
+    late.close()
+    first.close()
@@ -0,0 +1,86 @@
+import os
+from io import BytesIO
+import pytest
+from PIL import Image
+import frame_store
+from capture import write_png
+
+
+def png(color, compress_level=6):
+    buf = BytesIO()
+    Image.new("RGB", (40, 30), color).save(buf, "PNG", compress_level=compress_level)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    shots, store_dir = tmp_path / "screenshots", tmp_path / "frames"
+    shots.mkdir()
+    con = frame_store.open_store(store_dir)
+    yield shots, store_dir, con
+    con.close()
+
+
+def test_identical_pixels_share_one_blob(store):
+    shots, store_dir, con = store
+    # the same picture, encoded differently
+    (shots / "20100101000000.png").write_bytes(png("red", 1))
+    (shots / "20100201000000.png").write_bytes(png("red", 9))
+    (shots / "20100301000000.png").write_bytes(png("blue"))
+    frames = frame_store.sync(con, shots, store_dir)
+
+    assert frames["20100101000000"] == frames["20100201000000"] != frames["20100301000000"]
+    blob = frame_store.blob_path(frames["20100101000000"], store_dir)
+    assert (shots / "20100101000000.png").samefile(blob)
+    assert (shots / "20100201000000.png").samefile(blob)
+    assert frame_store.stats(con, store_dir)["unique"] == 2
+    assert len(list((store_dir / "blobs").glob("*/*.png"))) == 2
+
+
+def test_recapturing_a_linked_frame_leaves_its_twin_alone(store):
+    shots, store_dir, con = store
+    a, b = shots / "20100101000000.png", shots / "20100201000000.png"
+    a.write_bytes(png("red"))
+    b.write_bytes(png("red"))
+    old = frame_store.sync(con, shots, store_dir)
+    twin = b.read_bytes()
+
+    write_png(a, png("green"))   # a new capture of a, the way capture.py saves it
+    assert b.read_bytes() == twin
+    assert frame_store.blob_path(old[b.stem], store_dir).read_bytes() == twin
+    assert not a.samefile(b)
+
+    frames = frame_store.sync(con, shots, store_dir)
+    assert frames[b.stem] == old[b.stem]
+    assert frames[a.stem] != old[a.stem]
+
+
+def test_sync_rehashes_changed_files_only(store, monkeypatch):
+    shots, store_dir, con = store
+    a, c = shots / "20100101000000.png", shots / "20100301000000.png"
+    a.write_bytes(png("red"))
+    c.write_bytes(png("blue"))
+    frame_store.sync(con, shots, store_dir)
+
+    added = []
+    real_add = frame_store.add
+    monkeypatch.setattr(frame_store, "add", lambda con, path, *args, **kw: added.append(path.stem) or
+                        real_add(con, path, *args, **kw))
+    frame_store.sync(con, shots, store_dir)
+    assert added == []
+
+    st = c.stat()
+    os.utime(c, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))   # same bytes, new mtime
+    frame_store.sync(con, shots, store_dir)
+    assert added == [c.stem]
+
+    st = a.stat()
+    write_png(a, png("yellow", 0))                                      # new size, old mtime
+    os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns))
+    frames = frame_store.sync(con, shots, store_dir)
+    assert added == [c.stem, a.stem]
+    with Image.open(a) as img:
+        assert frames[a.stem] == frame_store.pixel_hash(img)
+
+    a.unlink()
+    assert a.stem not in frame_store.sync(con, shots, store_dir)
@@ -0,0 +1,96 @@
+import sqlite3
+import pytest
+import cdx_fake_server
+import get_url
+from get_url import _in_background, _stream_cdx, get_snapshots
+
+
+def test_stream_follows_resume_keys(cdx_server):
+    stamps = cdx_fake_server.make_timestamps(1000)
+    url = cdx_server(cdx_fake_server.make_rows(stamps))
+    rows = list(_stream_cdx("http://example.com", "1996", "2030", url, page_size=7))
+    assert [row[0] for row in rows] == stamps
+    assert rows[0][1:] == ("DIGEST0000000000", 1000)
+
+
+def test_stream_respects_the_date_range(cdx_server):
+    stamps = cdx_fake_server.make_timestamps(200, step_seconds=86400)   # 1996-01-01 ... 1996-07-18
+    url = cdx_server(stamps)
+    rows = list(_stream_cdx("http://example.com", "19960201", "19960229", url, page_size=10))
+    assert [row[0] for row in rows] == [ts for ts in stamps if "19960201" <= ts[:8] <= "19960229"]
+
+
+def test_stream_exact_page_multiple(cdx_server):
+    # the last page is full, so there must be no extra (empty) request that adds rows twice
+    stamps = cdx_fake_server.make_timestamps(50)
+    url = cdx_server(stamps)
+    assert [row[0] for row in _stream_cdx("http://example.com", "1996", "2030", url, page_size=10)] == stamps
+
+
+def test_get_snapshots_thins_by_frequency(cdx_server, in_tmp):
+    stamps = cdx_fake_server.make_timestamps(24 * 60)   # hourly for 60 days
+    url = cdx_server(stamps)
+    urls = get_snapshots("example.com", "1996", "2030", frequency_days=7, cdx_url=url, use_cache=False,
+                         include_www=False)
+    assert [u.split("/web/")[1][:8] for u in urls] == [f"199601{d:02d}" for d in (1, 8, 15, 22, 29)] + \
+        ["19960205", "19960212", "19960219", "19960226"]
+
+
+def test_dropped_captures_do_not_hide_their_content(cdx_server, in_tmp):
+    # D2 first shows up an hour after D1, where thinning drops it; in February it must still be picked
+    rows = [("19960101000000", "D1", "1"), ("19960101010000", "D2", "2"),
+            ("19960103000000", "D1", "1"), ("19960201000000", "D2", "2")]
+    url = cdx_server(rows)
+    urls = get_snapshots("example.com", "1996", "1996", frequency_days=7, cdx_url=url, use_cache=False,
+                         include_www=False)
+    assert [u.split("/web/")[1][:14] for u in urls] == ["19960101000000", "19960201000000"]
+
+
+def test_repeated_content_is_passed_over(cdx_server, in_tmp):
+    # the week-later capture looks like the first one, so the next new content after it is taken instead
+    rows = [("19960101000000", "D1", "1"), ("19960108000000", "D1", "1"),
+            ("19960109000000", "D2", "2"), ("19960110000000", "D3", "3")]
+    url = cdx_server(rows)
+    urls = get_snapshots("example.com", "1996", "1996", frequency_days=7, cdx_url=url, use_cache=False,
+                         include_www=False, skip_digests={"D3"})
+    assert [u.split("/web/")[1][:14] for u in urls] == ["19960101000000", "19960109000000"]
+
+
+def test_background_errors_reach_the_reader():
+    def rows():
+        yield from range(5)
+        raise ValueError("broken row")
+
+    got = []
+    with pytest.raises(ValueError, match="broken row"):
+        for row in _in_background(rows(), page_size=2):
+            got.append(row)
+    assert got == [0, 1, 2, 3]   # the last, unfinished page is lost with the error
+
+
+def test_unwritable_output_fails_before_any_request(cdx_server, in_tmp):
+    (in_tmp / "out").mkdir()
+    with pytest.raises(OSError):
+        get_snapshots("example.com", "1996", "1996", save_to=in_tmp / "out", cdx_url=cdx_server([]),
+                      use_cache=False, include_www=False)
+
+
+def test_broken_cache_falls_back_to_the_api(cdx_server, in_tmp):
+    (in_tmp / "data" / "cdx_cache.sqlite").mkdir(parents=True)   # can't be opened as a database
+    stamps = cdx_fake_server.make_timestamps(10, step_seconds=86400)
+    urls = get_snapshots("example.com", "1996", "1996", frequency_days=0, cdx_url=cdx_server(stamps))
+    assert [u.split("/web/")[1][:14] for u in urls] == stamps
+
+
+def test_cache_failing_midway_carries_on_after_the_last_row(cdx_server, in_tmp, monkeypatch):
+    stamps = cdx_fake_server.make_timestamps(10, step_seconds=6 * 3600)
+    rows = cdx_fake_server.make_rows(stamps)
+
+    def failing_cache(host, proto, start_date, end_date, fetch):
+        yield from ((ts, digest, int(length)) for ts, digest, length in rows[:3])
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(get_url, "cached_snapshots", failing_cache)
+    urls = get_snapshots("example.com", "1996", "1996", frequency_days=0, cdx_url=cdx_server(rows),
+                         include_www=False)
+    assert [u.split("/web/")[1][:14] for u in urls] == stamps
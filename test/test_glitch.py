@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+import glitch
+from glitch import PRESETS, GlitchRenderer
+
+
+@pytest.mark.parametrize("preset", sorted(PRESETS))
+@pytest.mark.parametrize("shape", [(60, 80), (7, 5)])   # (7, 5): the offsets are bigger than the frame
+def test_sparse_masks_give_the_same_glitch(preset, shape, monkeypatch):
+    rng = np.random.default_rng(1)
+    h, w = shape
+    a = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    b = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    renderer = GlitchRenderer(preset)
+    for density in (0.01, 0.3, 1.0):
+        mask = rng.random((h, w)) < density
+        monkeypatch.setattr(glitch, "SPARSE", -1)    # always the shifted channels
+        by_band = renderer.render(a, b, mask).copy()
+        monkeypatch.setattr(glitch, "SPARSE", 1.0)   # always the gathered pixels
+        assert np.array_equal(renderer.render(a, b, mask), by_band)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from PIL import Image, features
+import image_codecs
+from image_codecs import GLITCH_SUFFIXES, MASK_SUFFIXES
+
+
+def needs(codec):
+    if codec == "webp" and not features.check("webp"):
+        pytest.skip("Pillow was built without WebP")
+
+
+@pytest.fixture
+def mask():
+    rng = np.random.default_rng(0)
+    m = np.zeros((37, 53), dtype=bool)   # odd sizes, so packbits has a partial last byte
+    m[5:20, 10:40] = True
+    m[rng.random(m.shape) < 0.02] = True
+    return m
+
+
+@pytest.fixture
+def glitch():
+    return np.random.default_rng(1).integers(0, 256, (37, 53, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("codec", sorted(MASK_SUFFIXES))
+def test_mask_round_trip(codec, mask, tmp_path):
+    path = image_codecs.save_mask(mask, tmp_path / f"a__b_mask{MASK_SUFFIXES[codec]}", codec)
+    loaded = image_codecs.load_mask(path)
+    assert loaded.dtype == bool and np.array_equal(loaded, mask)
+    assert not list(tmp_path.glob("*.tmp"))
+    if codec == "raw":
+        assert np.array_equal(image_codecs.load_mask(path, mmap=True), mask)
+
+
+@pytest.mark.parametrize("codec", sorted(GLITCH_SUFFIXES))
+@pytest.mark.parametrize("as_image", [False, True])
+def test_glitch_round_trip(codec, as_image, glitch, tmp_path):
+    needs(codec)
+    img = Image.fromarray(glitch) if as_image else glitch
+    path = image_codecs.save_glitch(img, tmp_path / f"a__b{GLITCH_SUFFIXES[codec]}", codec)
+    loaded = image_codecs.load_glitch(path)   # every glitch codec is lossless
+    assert loaded.dtype == np.uint8 and np.array_equal(loaded, glitch)
+
+
+def test_unknown_codecs_are_refused(mask, glitch, tmp_path):
+    with pytest.raises(ValueError):
+        image_codecs.save_mask(mask, tmp_path / "m.png", "jpeg")
+    with pytest.raises(ValueError):
+        image_codecs.save_glitch(glitch, tmp_path / "g.png", "jpeg")
+
+
+def test_find_and_remove_handle_a_stale_format(mask, tmp_path):
+    base = tmp_path / "a__b_mask"
+    assert image_codecs.find(base) is None
+
+    # an older run wrote the mask as PNG; this one uses packbits
+    stale = image_codecs.save_mask(~mask, tmp_path / "a__b_mask.png", "png")
+    assert image_codecs.find(base) == stale
+    image_codecs.save_mask(mask, tmp_path / "a__b_mask.npz", "packbits")
+    assert image_codecs.find(base) == stale   # .png is looked for first, which is why writers remove() first
+
+    image_codecs.remove(base)
+    assert image_codecs.find(base) is None
+    assert not list(tmp_path.iterdir())
+
+    fresh = image_codecs.save_mask(mask, tmp_path / "a__b_mask.npz", "packbits")
+    assert image_codecs.find(base) == fresh
+    assert np.array_equal(image_codecs.load_mask(image_codecs.find(base)), mask)
+
+
+def test_remove_leaves_other_pairs_alone(glitch, tmp_path):
+    keep = image_codecs.save_glitch(glitch, tmp_path / "a__bb.png")
+    image_codecs.save_glitch(glitch, tmp_path / "a__b.npy", "raw")
+    image_codecs.remove(tmp_path / "a__b")
+    assert list(tmp_path.iterdir()) == [keep]
@@ -0,0 +1,72 @@
+import pytest
+import manifest
+from manifest import BACKOFF_MAX, MAX_ATTEMPTS, backoff, mark_done, mark_failed, mark_running, open_manifest, plan
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    con = open_manifest(tmp_path / "manifest.sqlite")
+    yield con
+    con.close()
+
+
+def shots(tmp_path, n):
+    urls = [f"https://web.archive.org/web/2010010{i + 1}000000/http://example.com/" for i in range(n)]
+    return urls, [tmp_path / f"2010010{i + 1}000000.png" for i in range(n)]
+
+
+def test_backoff_doubles_up_to_the_cap():
+    assert backoff(0) == 0.0
+    waits = [backoff(n) for n in range(1, 12)]
+    assert waits[:5] == [2.0, 4.0, 8.0, 16.0, 32.0]
+    assert waits[5:] == [BACKOFF_MAX] * 6
+    assert BACKOFF_MAX == 60.0
+
+
+def test_resume_only_does_what_is_left(jobs, tmp_path):
+    urls, files = shots(tmp_path, 4)
+    done, broken, todo = plan(jobs, urls, files)
+    assert (done, broken, len(todo)) == ([], [], 4)
+
+    # the run dies after one capture, with a second one still running and a third one failed once
+    files[0].write_bytes(b"png")
+    mark_running(jobs, urls[0])
+    mark_done(jobs, urls[0], 1.5)
+    mark_running(jobs, urls[1])
+    mark_running(jobs, urls[2])
+    mark_failed(jobs, urls[2], "Timeout", 20.0)
+
+    done, broken, todo = plan(jobs, urls, files)
+    assert done == [(urls[0], files[0])]
+    assert broken == []
+    assert todo == list(zip(urls, files))[1:]
+    assert manifest.summary(jobs) == {"done": 1, "running": 1, "failed": 1, "pending": 1}
+
+
+def test_done_job_whose_file_is_gone_starts_over(jobs, tmp_path):
+    urls, files = shots(tmp_path, 1)
+    plan(jobs, urls, files)
+    mark_done(jobs, urls[0], 1.0)   # the file was never written (or deleted since)
+    done, broken, todo = plan(jobs, urls, files)
+    assert (done, broken, todo) == ([], [], [(urls[0], files[0])])
+    assert jobs.execute("SELECT status, attempts FROM jobs").fetchone() == ("pending", 0)
+
+
+def test_failures_wait_for_the_backoff_and_end_up_broken(jobs, tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(manifest.time, "time", lambda: now[0])
+    urls, files = shots(tmp_path, 1)
+    plan(jobs, urls, files)
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        mark_failed(jobs, urls[0], "net::ERR_CONNECTION_RESET", 3.0)
+        assert manifest.seconds_until_due(jobs, urls[0]) == backoff(attempt)
+        done, broken, todo = plan(jobs, urls, files)
+        if attempt < MAX_ATTEMPTS:
+            assert todo == [(urls[0], files[0])] and broken == []
+        now[0] += backoff(attempt)
+        assert manifest.seconds_until_due(jobs, urls[0]) == 0.0
+
+    assert (done, broken, todo) == ([], [(urls[0], files[0])], [])
+    row = jobs.execute("SELECT status, attempts, last_error, total_duration FROM jobs").fetchone()
+    assert row == ("failed", MAX_ATTEMPTS, "net::ERR_CONNECTION_RESET", 3.0 * MAX_ATTEMPTS)
@@ -0,0 +1,62 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image
+import pipeline
+from process_images import make_media_dirs, media_dirs
+
+
+def png(color):
+    buf = BytesIO()
+    Image.new("RGB", (32, 24), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def run_worker(items, media_dir, maxsize=2):
+    """Feeds `items` and DONE through a small queue, like capture does; returns the stats."""
+    frames = queue.Queue(maxsize=maxsize)
+    stats = {"pairs": 0}
+    stems = sorted(path.stem for path, _ in items)
+    with ThreadPoolExecutor(pipeline.WRITER_THREADS) as writer:
+        worker = threading.Thread(target=pipeline._analysis_worker, daemon=True,
+                                  args=(frames, stems, media_dir, writer, 15, stats, None))
+        worker.start()
+        for item in items:
+            frames.put(item, timeout=5)
+        frames.put(pipeline.DONE, timeout=5)
+        worker.join(timeout=10)
+        assert not worker.is_alive()
+    return stats
+
+
+def screenshots(media_dir, colors):
+    make_media_dirs(media_dir)
+    out = media_dirs(media_dir)[0]
+    out.mkdir(parents=True, exist_ok=True)
+    items = []
+    for i, color in enumerate(colors):
+        path = out / f"2010010{i + 1}000000.png"
+        data = png(color)
+        path.write_bytes(data)
+        items.append((path, data))
+    return items
+
+
+def test_worker_drains_the_queue_when_it_cannot_start(tmp_path, monkeypatch):
+    def broken(store_dir):
+        raise OSError("no frame store")
+
+    monkeypatch.setattr(pipeline.frame_store, "open_store", broken)
+    items = screenshots(tmp_path, ["red", "green", "blue", "white", "black"])
+    assert run_worker(items, tmp_path)["pairs"] == 0
+
+
+def test_only_saved_pairs_count(tmp_path, monkeypatch):
+    def failing_save(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pipeline, "save_pair", failing_save)
+    # red -> green needs a diff (whose save fails), green -> green is identical and saved
+    items = screenshots(tmp_path, ["red", "green", "green"])
+    assert run_worker(items, tmp_path)["pairs"] == 1
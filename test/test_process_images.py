@@ -0,0 +1,14 @@
+import os
+from PIL import Image
+from process_images import load_screenshot
+
+
+def test_retaken_screenshot_is_decoded_again(tmp_path):
+    path = tmp_path / "20100101000000.png"
+    Image.new("RGB", (8, 8), "red").save(path)
+    assert load_screenshot(path).getpixel((0, 0)) == (255, 0, 0)
+
+    Image.new("RGB", (8, 8), "blue").save(path)
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))   # same size, so only the mtime differs
+    assert load_screenshot(path).getpixel((0, 0)) == (0, 0, 255)
@@ -0,0 +1,48 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from selection import parse_timestamps, thin_by_gap
+
+
+def old_loop(stamps, frequency_days):
+    """The thinning get_snapshots did before selection.py, one strptime per snapshot."""
+    keep, last_date = [], None
+    for i, ts in enumerate(stamps):
+        snapshot_dt = datetime.strptime(ts, "%Y%m%d%H%M%S")
+        if not last_date or (snapshot_dt - last_date).days >= frequency_days:
+            keep.append(i)
+            last_date = snapshot_dt
+    return keep
+
+
+def random_stamps(n, seed):
+    # bursts of captures minutes apart, with gaps of days to months between them
+    rng = np.random.default_rng(seed)
+    gaps = np.where(rng.random(n) < 0.1, rng.integers(86_400, 90 * 86_400, n), rng.integers(1, 7_200, n))
+    secs = np.datetime64("1996-01-01T00:00:00") + np.cumsum(gaps).astype("timedelta64[s]")
+    return [str(t).replace("-", "").replace("T", "").replace(":", "") for t in secs]
+
+
+def test_parse_timestamps_matches_strptime():
+    stamps = random_stamps(500, 0) + ["20000229235959", "19991231000000"]
+    expected = [np.datetime64(datetime.strptime(ts, "%Y%m%d%H%M%S"), "s") for ts in stamps]
+    assert list(parse_timestamps(stamps)) == expected
+
+
+@pytest.mark.parametrize("frequency_days", [0, 1, 7, 30, 90])
+def test_thin_by_gap_matches_the_old_loop(frequency_days):
+    stamps = random_stamps(3000, frequency_days)
+    assert list(thin_by_gap(parse_timestamps(stamps), frequency_days)) == old_loop(stamps, frequency_days)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 250])
+def test_chunked_thinning_matches_the_old_loop(chunk):
+    stamps = random_stamps(2000, chunk)
+    keep, last = [], None
+    for start in range(0, len(stamps), chunk):
+        times = parse_timestamps(stamps[start:start + chunk])
+        picks = thin_by_gap(times, 7, last=last)
+        keep += [start + int(i) for i in picks]
+        if picks.size:
+            last = times[picks[-1]]
+    assert keep == old_loop(stamps, 7)
@@ -0,0 +1,145 @@
+import json
+from math import ceil
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from atlas import fit
+from process_images import MEDIA_DIR, screenshot_index
+
+# Small versions of every frame at a few sizes (a pyramid: each level is made from the one above it),
+# packed into sprite sheets. The viewer's filmstrip takes whichever level fits the zoom of the time axis,
+# and a fast scrub shows the biggest one until the full frame is loaded.
+# Sheets are raw .npy files (height x width x 3), so a thumbnail is a slice of a memory-mapped array.
+# index.json: {"base": [w, h], "levels": {"4": [cell w, cell h, per row, per sheet], ...},
+#              "frames": {hash: [slot, w, h]}}   (the slot is the same on every level)
+THUMB_DIR = Path("media/thumbs")
+LEVELS = (4, 16, 64)   # 1/4, 1/16 and 1/64 of the screenshot's width and height
+SHEET_SIZE = 2048      # max width and height of a sheet in pixels
+
+def cell_size(base, factor):
+    return ceil(base[0] / factor), ceil(base[1] / factor)
+
+def layout(base, factor):
+    """[cell w, cell h, cells per row, cells per sheet] of a level."""
+    w, h = cell_size(base, factor)
+    per_row = max(1, SHEET_SIZE // w)
+    return [w, h, per_row, per_row * max(1, SHEET_SIZE // h)]
+
+def sheet_path(thumb_dir, factor, n):
+    return Path(thumb_dir) / f"level{factor}_{n:03d}.npy"
+
+def load_index(thumb_dir=THUMB_DIR):
+    try:
+        return json.loads((Path(thumb_dir) / "index.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def pyramid(img, levels):
+    """The thumbnails of a PIL image, biggest first, each one box-filtered from the one before."""
+    out, prev = [], img.convert("RGB")
+    for w, h in levels:
+        size, _ = fit(prev.size, (w, h))
+        prev = prev.resize(size, Image.BOX)
+        out.append(prev)
+    return out
+
+def _save_sheet(path, sheet):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, sheet)
+    tmp.replace(path)
+
+def build_thumbnails(thumb_dir=THUMB_DIR, media_dir=MEDIA_DIR):
+    """
+    Adds the thumbnails of every frame of media_dir that doesn't have them yet. Frames are stored once per
+    pixel hash (see frame_store.py); only the sheets that get new thumbnails are written again.
+    """
+    thumb_dir = Path(thumb_dir)
+    thumb_dir.mkdir(parents=True, exist_ok=True)
+    shots = screenshot_index(media_dir)
+    if not shots:
+        return None
+
+    index = load_index(thumb_dir)
+    if not index or any(str(f) not in index["levels"] for f in LEVELS):
+        # the cells are sized for the first screenshot (they all have the browser's viewport size)
+        with Image.open(shots[0][0]) as img:
+            base = list(img.size)
+        index = {"base": base, "levels": {str(f): layout(base, f) for f in LEVELS}, "frames": {}}
+
+    frames = index["frames"]
+    new = {}
+    for path, digest in shots:
+        if digest not in frames and digest not in new:
+            new[digest] = path
+
+    levels = [index["levels"][str(f)] for f in LEVELS]
+    sheets = {}   # (factor, n) -> array, only the sheets that change
+    for digest, path in new.items():
+        slot = len(frames)
+        with Image.open(path) as img:
+            frames[digest] = [slot, img.size[0], img.size[1]]
+            thumbs = pyramid(img, [(lv[0], lv[1]) for lv in levels])
+        for factor, (w, h, per_row, per_sheet), thumb in zip(LEVELS, levels, thumbs):
+            n, cell = divmod(slot, per_sheet)
+            if (factor, n) not in sheets:
+                p = sheet_path(thumb_dir, factor, n)
+                sheets[factor, n] = np.load(p) if p.exists() else \
+                    np.zeros((-(-per_sheet // per_row) * h, per_row * w, 3), dtype=np.uint8)
+            y, x = (cell // per_row) * h, (cell % per_row) * w
+            sheets[factor, n][y:y + thumb.size[1], x:x + thumb.size[0]] = np.asarray(thumb)
+
+    for (factor, n), sheet in sheets.items():
+        _save_sheet(sheet_path(thumb_dir, factor, n), sheet)
+    tmp = thumb_dir / "index.json.tmp"
+    tmp.write_text(json.dumps(index), encoding="utf-8")
+    tmp.replace(thumb_dir / "index.json")
+    print(f"[INFO] Thumbnails: {len(frames)} frame(s), {len(new)} new, levels 1/{', 1/'.join(map(str, LEVELS))}")
+    return index
+
+class Thumbnails:
+    """
+    The sprite sheets, as the viewer uses them. Nothing is read until a thumbnail is asked for (on the
+    viewer's loader thread): then the small levels are read into memory a whole sheet at a time, the
+    biggest one is memory-mapped.
+    """
+    def __init__(self, index, thumb_dir):
+        self.index = index
+        self.thumb_dir = Path(thumb_dir)
+        self.levels = {int(f): lv for f, lv in index["levels"].items()}
+        self._sheets = {}
+
+    def size(self, digest, factor):
+        """The size of a frame's thumbnail on a level, or None if it has none."""
+        entry = self.index["frames"].get(digest)
+        if not entry:
+            return None
+        w, h = self.levels[factor][:2]
+        return fit((entry[1], entry[2]), (w, h))[0]
+
+    def level_for(self, width):
+        """The smallest level whose thumbnails are at least `width` pixels wide (the biggest if none is)."""
+        for factor in sorted(self.levels, reverse=True):
+            if self.levels[factor][0] >= width:
+                return factor
+        return min(self.levels)
+
+    def pixels(self, digest, factor):
+        """(RGB bytes, size) of a frame's thumbnail, or None."""
+        entry = self.index["frames"].get(digest)
+        if not entry:
+            return None
+        w, h, per_row, per_sheet = self.levels[factor]
+        n, cell = divmod(entry[0], per_sheet)
+        sheet = self._sheets.get((factor, n))
+        if sheet is None:
+            mmap_mode = "r" if factor == min(self.levels) else None
+            sheet = self._sheets[factor, n] = np.load(sheet_path(self.thumb_dir, factor, n), mmap_mode=mmap_mode)
+        tw, th = self.size(digest, factor)
+        y, x = (cell // per_row) * h, (cell % per_row) * w
+        return np.ascontiguousarray(sheet[y:y + th, x:x + tw]).tobytes(), (tw, th)
+
+def open_thumbnails(thumb_dir=THUMB_DIR):
+    """The thumbnails, or None if they were never built."""
+    index = load_index(thumb_dir)
+    return Thumbnails(index, thumb_dir) if index else None
@@ -1,18 +1,38 @@
+import time
 import pygame
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
-from math import floor
+from PIL import Image
+from math import floor, ceil
 from datetime import datetime
-from process_images import list_screenshots
+from process_images import MEDIA_DIR, media_dirs, screenshot_index
+from regions import load_regions, regions_path
+import image_codecs
+from atlas import ATLAS_DIR, fit, glitch_surface, open_atlas, scaled_pixels
+from thumbnails import THUMB_DIR, open_thumbnails
+from helper import ByteLRU
+from prefetch import FrameLoader
+import metrics
 
-UI_H = 110         # reserved height at bottom for slider + UI
+UI_H = 140         # reserved height at bottom for filmstrip + slider + UI
+STRIP_H = 56       # filmstrip height
 FPS = 60           # frames per second for smooth animations
 FRAME = 60         # margin around the content area
 BAR_H = 10         # slider bar height
 HANDLE_W = 18      # slider handle width
 HANDLE_H = 28      # slider handle height
-
-GLITCH_DIR = Path("media/glitches")
-MASK_DIR = Path("media/masks")
+WINDOW = (1200, 800)                                                   # window size
+IMAGE_AREA = (WINDOW[0] - 2 * FRAME, WINDOW[1] - 2 * FRAME - UI_H)     # where the screenshots go
+FRAME_CACHE_MB = 256      # scaled frames kept in memory, least recently used ones go first
+OVERLAY_CACHE_MB = 128
+PREFETCH = 6              # frames loaded ahead of the slider (and half of that behind it)
+LOADS_PER_FRAME = 4       # finished loads turned into surfaces per frame, so a burst doesn't cause a hitch
+LOADED = pygame.USEREVENT + 1   # posted by the loader thread, wakes up the idle loop
+STRIP_CACHE_MB = 16       # filmstrip thumbnails, scaled to their slot
+MIN_SLOT = 28             # narrowest filmstrip slot; when zoomed out, only every n-th snapshot gets one
+MIN_SPAN = 4              # how far the time axis zooms in (snapshots across the bar)
+FAST_SCRUB = 8.0          # snapshots per second; faster than that only thumbnails are shown and loaded
 
 def parse_date_from_filename(name: str) -> str:
     """
@@ -33,24 +53,191 @@ def clamp(x, a, b):
     """Clamp a number x so it always stays between a and b. This is a helper for example when sliding so the value is kept betweeen 0.0–1.0"""
     return max(a, min(b, x))
 
-def load_scaled_centered(path: Path, max_size: tuple[int, int]):
+def load_pixels(job, atlas, thumbs, image_area, media_dir=MEDIA_DIR):
+    """
+    Runs on the loader thread (prefetch.py): the RGB pixels of a frame, its preview (the biggest thumbnail,
+    see thumbnails.py), a filmstrip thumbnail or a glitch overlay, already scaled, from the atlas when it
+    has them and from the files otherwise. Returns a dict, or None when there is nothing to show.
+    No surfaces are converted here, that needs the display and happens in the loop.
+    """
+    with metrics.span("viewer.load", kind=job[0]):
+        return _load_pixels(job, atlas, thumbs, image_area, media_dir)
+
+def _load_pixels(job, atlas, thumbs, image_area, media_dir):
+    if job[0] == "thumb":
+        _, digest = job
+        found = thumbs.pixels(digest, min(thumbs.levels)) if thumbs else None
+        if not found:
+            return None
+        entry = thumbs.index["frames"][digest]
+        size, pos = fit((entry[1], entry[2]), image_area)
+        small = pygame.image.frombuffer(found[0], found[1], "RGB")
+        return {"pixels": scaled_pixels(small, size), "size": size, "pos": pos}
+
+    if job[0] == "strip":
+        _, digest, level, want_w = job
+        found = thumbs.pixels(digest, level) if thumbs else None
+        if not found:
+            return None
+        size = fit(found[1], (want_w, STRIP_H - 4))[0]
+        return {"pixels": scaled_pixels(pygame.image.frombuffer(found[0], found[1], "RGB"), size), "size": size}
+
+    if job[0] == "frame":
+        _, digest, path = job
+        found = atlas.frame_pixels(digest) if atlas else None
+        if not found:
+            surf = pygame.image.load(str(path))
+            size, pos = fit(surf.get_size(), image_area)
+            found = (scaled_pixels(surf, size), size, pos)
+        return {"pixels": found[0], "size": found[1], "pos": found[2]}
+
+    _, stem_a, stem_b, digest_a, path_a = job
+    _, glitch_dir, mask_dir, _ = media_dirs(media_dir)
+    regions = load_regions(regions_path(mask_dir / f"{stem_a}__{stem_b}_mask.png"))
+    if regions and regions["changed_pixels"] == 0:
+        return None   # nothing changed, nothing to glitch
+    found = atlas.overlay_pixels(stem_a, stem_b) if atlas else None
+    if not found:
+        gpath = image_codecs.find(glitch_dir / f"{stem_a}__{stem_b}")
+        if not gpath:
+            return None
+        # the overlay gets the size and position of frame A
+        entry = atlas.index["frames"].get(digest_a) if atlas else None
+        if entry:
+            size, pos = (entry[1], entry[2]), (entry[3], entry[4])
+        else:
+            with Image.open(path_a) as img:   # only reads the header
+                size, pos = fit(img.size, image_area)
+        found = (scaled_pixels(glitch_surface(gpath), size), size, pos)
+    return {"pixels": found[0], "size": found[1], "pos": found[2], "regions": regions}
+
+def dirty_rects(index, size):
+    """
+    The changed regions of a pair (see regions.py) scaled to the overlay size, as pygame Rects.
+    One pixel extra on each side because smoothscale blurs the edges a little.
+    """
+    sx, sy = size[0] / index["width"], size[1] / index["height"]
+    bounds = pygame.Rect((0, 0), size)
+    rects = []
+    for r in index["regions"]:
+        x0, y0 = floor(r["x"] * sx), floor(r["y"] * sy)
+        x1, y1 = ceil((r["x"] + r["w"]) * sx), ceil((r["y"] + r["h"]) * sy)
+        rects.append(pygame.Rect(x0, y0, x1 - x0, y1 - y0).inflate(2, 2).clip(bounds))
+    return rects
+
+def stats_line(frame_cache, overlay_cache, loader, frame_times):
+    """Cache hits/misses, memory in use and frame times, for the S key and the summary at the end."""
+    mb = 1024 * 1024
+    f, o = frame_cache.stats(), overlay_cache.stats()
+    times = sorted(frame_times) or [0.0]
+    return (f"frames {f['hits']}/{f['misses']} hit/miss ({f['hit_rate']:.0%}), {f['bytes'] / mb:.0f} MB, "
+            f"{f['evictions']} evicted | overlays {o['hits']}/{o['misses']} ({o['hit_rate']:.0%}), "
+            f"{o['bytes'] / mb:.0f} MB | loader {loader.loaded} loaded, {loader.pending()} queued | "
+            f"frame {sum(times) / len(times):.1f} ms avg, {times[int(len(times) * 0.99)]:.1f} ms p99, "
+            f"{times[-1]:.1f} ms max")
+
+def static_layer(size, font):
+    """
+    The parts of the window that never change: background, content area and the help text.
+    Returns the layer and where the filmstrip and the slider bar go (y).
+    """
+    sw, sh = size
+    inner_w, inner_h = sw - 2 * FRAME, sh - 2 * FRAME
+    layer = pygame.Surface(size).convert()
+    layer.fill((0, 0, 0))
+    pygame.draw.rect(layer, (18, 18, 18), (FRAME, FRAME, inner_w, inner_h), border_radius=12)
+
+    strip_y = FRAME + (inner_h - UI_H) + 10
+    bar_y = strip_y + STRIP_H + 14
+    # This draws help text
+    hint = font.render("Drag to slide • wheel to zoom, shift+wheel to pan • arrows step • S for stats • ESC to quit",
+                       True, (210, 210, 210))
+    layer.blit(hint, (FRAME, bar_y + 20))
+    return layer, strip_y, bar_y
+
+def axis_x(pos, view, width):
+    """Where snapshot position `pos` is on the slider bar (screen x) for the visible range `view`."""
+    v0, v1 = view
+    return FRAME + int((pos - v0) / (v1 - v0) * width) if v1 > v0 else FRAME
+
+def clamp_view(v0, span, count):
+    v0 = clamp(v0, 0.0, max(0.0, count - 1 - span))
+    return v0, v0 + span
+
+def zoom_view(view, anchor, factor, count):
+    """Zooms the visible range by `factor` (< 1 zooms in) and keeps snapshot position `anchor` where it is."""
+    v0, v1 = view
+    span = clamp((v1 - v0) * factor, min(MIN_SPAN, count - 1), count - 1)
+    t = (anchor - v0) / (v1 - v0) if v1 > v0 else 0.0
+    return clamp_view(anchor - t * span, span, count)
+
+def axis_layer(layer, view, hashes, thumbs, strip_cache, width):
     """
-    This loads an image and resizes it so it fits inside max_size without distortion.
-    Returns the scaled Pygame surface and an (x,y) offset so it is centered.
+    Draws the filmstrip and the slider bar with its tick marks for the visible range `view` into `layer`
+    (as wide as the window, filmstrip at the top). Redrawn only when the view changes.
+    The thumbnails come from the pyramid level that fits the slot width of this zoom. Only the ones in
+    `strip_cache` are drawn, the others get a placeholder; they are returned as loader jobs [(key, job)].
     """
-    surf = pygame.image.load(str(path)).convert()
-    iw, ih = surf.get_size()
-    mw, mh = max_size
-    scale = min(mw / iw, mh / ih)
-    new_size = (int(iw * scale), int(ih * scale))
-    surf = pygame.transform.smoothscale(surf, new_size)
-    pos = ((mw - new_size[0]) // 2, (mh - new_size[1]) // 2)
-    return surf, pos
+    missing = []
+    v0, v1 = view
+    layer.fill((18, 18, 18))   # the content area's colour
+    pygame.draw.rect(layer, (28, 28, 28), (FRAME, 0, width, STRIP_H), border_radius=6)
+    px = width / (v1 - v0) if v1 > v0 else float(width)   # pixels per snapshot
+
+    # filmstrip: one slot every `stride` snapshots, aligned to multiples of it so panning doesn't flicker
+    if thumbs:
+        stride = max(1, ceil(MIN_SLOT / px))
+        slot_w = stride * px
+        base = thumbs.index["base"]
+        want_w = fit(base, (max(1, int(slot_w) - 2), STRIP_H - 4))[0][0]
+        level = thumbs.level_for(want_w)
+        layer.set_clip(pygame.Rect(FRAME, 0, width, STRIP_H))
+        for k in range(ceil(v0 / stride) * stride, int(v1) + 1, stride):
+            key = ("strip", hashes[k], level, want_w)
+            surf = strip_cache.get(key)
+            if surf is False:
+                continue   # no thumbnail for this frame
+            if surf is None:
+                # the sheets are read on the loader thread, until then the slot gets a grey box of the same size
+                thumb_size = thumbs.size(hashes[k], level)
+                if not thumb_size:
+                    continue
+                missing.append((key, key))
+                w, h = fit(thumb_size, (want_w, STRIP_H - 4))[0]
+                x = axis_x(k, view, width) - w // 2
+                pygame.draw.rect(layer, (45, 45, 45), (x, (STRIP_H - h) // 2, w, h))
+                continue
+            x = axis_x(k, view, width) - surf.get_width() // 2
+            layer.blit(surf, (x, (STRIP_H - surf.get_height()) // 2))
+        layer.set_clip(None)
+
+    # This adds the slider bar with tick marks (at most one every 4 pixels)
+    bar_top = STRIP_H + 14
+    pygame.draw.rect(layer, (80, 80, 80), (FRAME, bar_top, width, BAR_H), border_radius=6)
+    if v1 > v0:
+        stride = max(1, ceil(4 / px))
+        for k in range(ceil(v0 / stride) * stride, int(v1) + 1, stride):
+            x = axis_x(k, view, width)
+            pygame.draw.line(layer, (200, 200, 200), (x, bar_top), (x, bar_top + BAR_H), 2)
+    return missing
+
+def blit_alpha(screen, surf, pos, alpha, rects=None):
+    """
+    Draws a cached surface into the content area with the given alpha (0-255), only inside `rects` if given.
+    The alpha is a setting of the surface, so this changes it in place instead of drawing a copy.
+    """
+    surf.set_alpha(None if alpha >= 255 else alpha)
+    x, y = FRAME + pos[0], FRAME + pos[1]
+    if rects is None:
+        screen.blit(surf, (x, y))
+    else:
+        for r in rects:
+            screen.blit(surf, (x + r.x, y + r.y), area=r)
 
 # This is the main code:
-def run_viewer():
+def run_viewer(media_dir=MEDIA_DIR):
     pygame.init()
-    sw, sh = 1200, 800   # window size
+    sw, sh = WINDOW
     screen = pygame.display.set_mode((sw, sh))
     pygame.display.set_caption("Snapshot Viewer")
     clock = pygame.time.Clock()
@@ -59,142 +246,289 @@ def run_viewer():
 
     # I need to define the inner area for the content (images)
     inner_w, inner_h = sw - 2 * FRAME, sh - 2 * FRAME
-    image_area = (inner_w, inner_h - UI_H)
+    image_area = IMAGE_AREA
+
+    # screenshots with the same pixels share one frame in the store (frame_store.py), and one surface here
+    with metrics.span("viewer.open"):
+        shots = screenshot_index(media_dir)
+        screenshots = [path for path, _ in shots]
+        frame_hashes = [digest for _, digest in shots]
+        if not screenshots:
+            print("[INFO] No screenshots found.")
+            return
+
+        # frames and overlays come from the pre-scaled atlas (atlas.py) when there is one,
+        # anything missing from it is loaded and scaled from the files
+        atlas = open_atlas(image_area, Path(media_dir) / ATLAS_DIR.name)
+        # the thumbnail pyramid (thumbnails.py), for the filmstrip and fast scrubs
+        thumbs = open_thumbnails(Path(media_dir) / THUMB_DIR.name)
+
+    # I store the images in caches to avoid reloading/re-scaling the same images, but only up to a
+    # memory budget. Everything is loaded on a background thread; the loop only uses what is ready.
+    frame_cache = ByteLRU(FRAME_CACHE_MB * 1024 * 1024)      # ("frame" or "thumb", hash) -> (surface, (x,y))
+    overlay_cache = ByteLRU(OVERLAY_CACHE_MB * 1024 * 1024)  # ("overlay", s1, s2) -> (surface, (x,y), rects) or False
+    strip_cache = ByteLRU(STRIP_CACHE_MB * 1024 * 1024)      # ("strip", hash, level, width) -> surface or False
+    loader = FrameLoader(lambda job: load_pixels(job, atlas, thumbs, image_area, media_dir),
+                         on_ready=lambda: pygame.event.post(pygame.event.Event(LOADED)))
+    frame_times = deque(maxlen=600)   # ms of work per frame, for the stats
+    show_stats = False
+
+    def frame_key(idx):
+        return ("frame", frame_hashes[idx])
+
+    def overlay_key(idx):
+        return ("overlay", screenshots[idx].stem, screenshots[idx + 1].stem)
+
+    def has_overlay(idx):
+        return 0 <= idx < len(screenshots) - 1 and frame_hashes[idx] != frame_hashes[idx + 1]
+
+    def wish_list(i, direction, fast):
+        """
+        What to load, most important first: the frames on screen, the filmstrip thumbnails that are still
+        missing, then the frames ahead of the slider, then behind it.
+        During a fast scrub only the previews of the frames on screen, full frames wait until it slows down.
+        """
+        strips = [(key, job) for key, job in strip_jobs if key not in strip_cache]
+        if fast:
+            keys = {("thumb", frame_hashes[idx]) for idx in (i, i + 1) if idx < len(screenshots)}
+            return [(key, key) for key in keys if thumbs and key not in frame_cache] + strips
+        jobs, seen = [], set()
+
+        def add(idx):
+            if not 0 <= idx < len(screenshots):
+                return
+            key = frame_key(idx)
+            if key not in seen and key not in frame_cache:
+                seen.add(key)
+                jobs.append((key, ("frame", frame_hashes[idx], screenshots[idx])))
+            if has_overlay(idx):
+                key = overlay_key(idx)
+                if key not in seen and key not in overlay_cache:
+                    seen.add(key)
+                    jobs.append((key, ("overlay", key[1], key[2], frame_hashes[idx], screenshots[idx])))
 
-    screenshots = list_screenshots()
-    if not screenshots:
-        print("[INFO] No screenshots found.")
-        return
+        add(i)
+        add(i + 1)
+        jobs += strips
+        for k in range(1, PREFETCH + 1):
+            add(i + direction * k)
+        for k in range(1, PREFETCH // 2 + 1):
+            add(i - direction * k)
+        return jobs
 
-    # I store the images in caches to avoid reloading/re-scaling the same images
-    scaled_cache = {}    # idx -> (surface, (x,y))
-    overlay_cache = {}   # (s1, s2, kind) -> overlay surface
+    def adopt(key, result):
+        """Turns a finished load into a surface (this part needs the display, so it runs in the loop)."""
+        nonlocal axis_view
+        if key[0] == "strip":
+            surf = pygame.image.frombuffer(result["pixels"], result["size"], "RGB").convert() if result else False
+            strip_cache.put(key, surf, surf.get_width() * surf.get_height() * 4 if surf else 64)
+            axis_view = None   # the filmstrip is drawn again with the new thumbnail
+            return
+        cache = overlay_cache if key[0] == "overlay" else frame_cache
+        if not result:
+            cache.put(key, False, 64)
+            return
+        surf = pygame.image.frombuffer(result["pixels"], result["size"], "RGB").convert()
+        nbytes = surf.get_width() * surf.get_height() * surf.get_bytesize()
+        if key[0] != "overlay":
+            cache.put(key, (surf, result["pos"]), nbytes)
+        else:
+            rects = dirty_rects(result["regions"], surf.get_size()) if result["regions"] else None
+            cache.put(key, (surf, result["pos"], rects), nbytes)
 
-    def get_image(idx: int):
-        if idx not in scaled_cache:
-            scaled_cache[idx] = load_scaled_centered(screenshots[idx], image_area)
-        return scaled_cache[idx]
+    def get_image(idx: int, preview=True):
+        """The scaled frame, or its preview while it is still loading (None if there is neither)."""
+        found = frame_cache.get(frame_key(idx))
+        if not found and preview and thumbs:
+            found = frame_cache.get(("thumb", frame_hashes[idx]))
+        return found or None
 
     def get_overlay(idx: int):
         """
-        This loads the glitch or mask overlay for the pair (idx, idx+1).
+        The glitch overlay for the pair (idx, idx+1), or None (still loading, or no change at all).
+        With a region index only the changed rectangles are returned for drawing.
         """
-        if idx >= len(screenshots) - 1:
+        if not has_overlay(idx):
             return None
+        found = overlay_cache.get(overlay_key(idx))
+        if not found:
+            return None
+        ov, pos, rects = found
+        return ov, pos, rects, "glitch"
 
-        name_i = screenshots[idx].stem
-        name_j = screenshots[idx + 1].stem
-
-        # glitch overlay
-        key_g = (name_i, name_j, "glitch")
-        if key_g not in overlay_cache:
-            gpath = GLITCH_DIR / f"{name_i}__{name_j}.png"
-            if gpath.exists():
-                base_surf, pos = get_image(idx)
-                ov = pygame.image.load(str(gpath)).convert()
-                ov = pygame.transform.smoothscale(ov, base_surf.get_size())
-                overlay_cache[key_g] = (ov, pos)
-        if key_g in overlay_cache:
-            ov, pos = overlay_cache[key_g]
-            return ov, pos, "glitch"
+    # Everything that doesn't move is drawn once into this layer: background, content area, help text.
+    # The filmstrip and the slider bar with its ticks go into a second layer that is only redrawn when
+    # the time axis is zoomed or panned. Either way the cost of a redraw doesn't depend on the timeline length.
+    background, strip_y, bar_y = static_layer((sw, sh), font_small)
+    axis = pygame.Surface((sw, bar_y + BAR_H - strip_y)).convert()
+    count = len(screenshots)
+    view = (0.0, float(count - 1))   # the visible part of the timeline, in snapshot positions
+    axis_view = None                 # the view the axis layer was drawn for
+    strip_jobs = []                  # filmstrip thumbnails the axis layer is still waiting for
+    dates = [parse_date_from_filename(path.name) for path in screenshots]
 
-        return None
+    @lru_cache(maxsize=64)
+    def date_label(text):
+        return pygame.transform.rotate(font_small.render(text, True, (240, 240, 240)), 90)
 
     slider_pos = 0.0
     dragging = False  # looks whether user is dragging the slider
     running = True
+    direction = 1     # which way the slider moved last, that's where the prefetching goes
+    speed = 0.0       # how fast the slider moves (snapshots per second, smoothed)
+    last_tick = time.perf_counter()
+    last_a = None     # the last frame drawn, shown while the next one is still loading
+    more_ready = False  # the loader has finished more than one frame's worth, keep going
+    drawn = None        # the slider state of the last redraw, nothing is redrawn while it stays the same
 
     while running:
+        # Nothing to do until something happens: sleep on the event queue (the loader posts LOADED
+        # when it finishes something). While dragging the mouse position is polled at FPS instead.
+        idle = drawn is not None and not more_ready and not dragging
+        events = [pygame.event.wait()] if idle else []
+        exposed = False
         # This handles events (quit, keys, mouse)
-        for e in pygame.event.get():
+        for e in events + pygame.event.get():
             if e.type == pygame.QUIT:
                 running = False
             elif e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE:
                 running = False
+            elif e.type == pygame.KEYDOWN and e.key == pygame.K_s:
+                show_stats = not show_stats
+            elif e.type == pygame.KEYDOWN and e.key in (pygame.K_LEFT, pygame.K_RIGHT) and not dragging:
+                direction = 1 if e.key == pygame.K_RIGHT else -1
+                slider_pos = float(clamp(int(round(slider_pos)) + direction, 0, count - 1))
+                # the view follows the slider
+                span = view[1] - view[0]
+                if not view[0] <= slider_pos <= view[1]:
+                    view = clamp_view(slider_pos - span / 2, span, count)
+            elif e.type == pygame.MOUSEWHEEL and count > 1:
+                span = view[1] - view[0]
+                pan = e.x or (e.y if pygame.key.get_mods() & pygame.KMOD_SHIFT else 0)
+                if pan:
+                    view = clamp_view(view[0] - pan * span / 10, span, count)
+                else:
+                    mx = pygame.mouse.get_pos()[0]
+                    anchor = view[0] + clamp((mx - FRAME) / max(1, inner_w), 0.0, 1.0) * span
+                    view = zoom_view(view, anchor, 0.8 ** e.y, count)
             elif e.type == pygame.MOUSEBUTTONDOWN and e.button == 1:
                 dragging = True
             elif e.type == pygame.MOUSEBUTTONUP and e.button == 1:
                 dragging = False
                 # snaps slider to nearest screenshot index
                 slider_pos = float(int(round(slider_pos)))
+            elif e.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                exposed = True
+        if not running:
+            break
 
-        # updates slider position if dragging
-        if dragging and len(screenshots) > 1:
+        started = time.perf_counter()
+        dt, last_tick = started - last_tick, started
+        # updates slider position if dragging (within the visible part of the timeline)
+        if dragging and count > 1:
             mx = pygame.mouse.get_pos()[0]
             t = clamp((mx - FRAME) / max(1, inner_w), 0.0, 1.0)
-            slider_pos = t * (len(screenshots) - 1)
+            new_pos = view[0] + t * (view[1] - view[0])
+            if new_pos != slider_pos:
+                direction = 1 if new_pos > slider_pos else -1
+            speed = 0.7 * speed + 0.3 * abs(new_pos - slider_pos) / max(dt, 1e-3)
+            slider_pos = new_pos
+        else:
+            speed = 0.0
+        fast = thumbs is not None and speed > FAST_SCRUB
 
         i = int(floor(slider_pos))
         j = clamp(i + 1, 0, len(screenshots) - 1)
         u = 0.0 if i == j else (slider_pos - i)
 
-        screen.fill((0, 0, 0))
-        pygame.draw.rect(screen, (18, 18, 18), (FRAME, FRAME, inner_w, inner_h), border_radius=12)
+        # picks up what the loader has finished and tells it what's needed next
+        done = loader.drain(LOADS_PER_FRAME)
+        for key, result in done:
+            adopt(key, result)
+        # the axis layer is redrawn first, so the thumbnails it is missing go on this wish list
+        if view != axis_view:
+            strip_jobs = axis_layer(axis, view, frame_hashes, thumbs, strip_cache, inner_w)
+            axis_view = view
+        loader.want(wish_list(i, direction, fast))
+        # a full batch means there may be more waiting, so don't go to sleep yet
+        more_ready = len(done) == LOADS_PER_FRAME
+
+        state = (slider_pos, show_stats, view, fast)
+        if not done and not exposed and state == drawn:
+            if dragging:
+                clock.tick(FPS)
+            continue
+        drawn = state
+
+        screen.blit(background, (0, 0))
+        screen.blit(axis, (0, strip_y))
 
-        # This draws the images with cross-fade
-        (surf_a, pos_a) = get_image(i)
-        (surf_b, pos_b) = get_image(j)
-        if u == 0:  # shows only A
-            screen.blit(surf_a, (FRAME + pos_a[0], FRAME + pos_a[1]))
-        elif u == 1:  # shows only B
-            screen.blit(surf_b, (FRAME + pos_b[0], FRAME + pos_b[1]))
+        # This draws the images with cross-fade (a frame that isn't loaded yet shows its preview, or is left out).
+        # The alpha is set on the cached surfaces themselves, no copies.
+        # During a fast scrub only the nearest frame is shown, without blending.
+        if fast:
+            i = j = int(round(slider_pos))
+            u = 0.0
+        img_a, img_b = get_image(i), get_image(j)
+        if img_a:
+            last_a = img_a
+        elif u == 0 or not img_b:
+            img_a = last_a
+        if u == 0 or not img_b:  # shows only A
+            if img_a:
+                blit_alpha(screen, img_a[0], img_a[1], 255)
+        elif u == 1 or not img_a:  # shows only B
+            blit_alpha(screen, img_b[0], img_b[1], 255)
         else:  # blends A and B
-            a = surf_a.copy();
-            a.set_alpha(int(255 * (1 - u)))
-            b = surf_b.copy();
-            b.set_alpha(int(255 * u))
-            screen.blit(a, (FRAME + pos_a[0], FRAME + pos_a[1]))
-            screen.blit(b, (FRAME + pos_b[0], FRAME + pos_b[1]))
+            blit_alpha(screen, img_a[0], img_a[1], int(255 * (1 - u)))
+            blit_alpha(screen, img_b[0], img_b[1], int(255 * u))
 
         # This draws the glitch overlay (only between A and B)
         if 0 < u < 1:
             ov_info = get_overlay(i)
             if ov_info:
-                ov, pos_ov, kind = ov_info
-                ov_draw = ov.copy()
+                ov, pos_ov, rects, kind = ov_info
                 glitch_strength = 2 * min(u, 1 - u)  # strongest in the middle
-                ov_draw.set_alpha(int(255 * glitch_strength))
-                screen.blit(ov_draw, (FRAME + pos_ov[0], FRAME + pos_ov[1]))
+                # only where the page changed, the rest of the glitch image is just B anyway
+                blit_alpha(screen, ov, pos_ov, int(255 * glitch_strength), rects)
 
         # I had AI help me write this part of the code:
         # This puts rotated date label on right side
         if u == 0:
-            label = parse_date_from_filename(screenshots[i].name)
+            label = dates[i]
         elif u == 1:
-            label = parse_date_from_filename(screenshots[j].name)
+            label = dates[j]
         else:
-            label = f"{parse_date_from_filename(screenshots[i].name)} to {parse_date_from_filename(screenshots[j].name)}"
-        label_surf = font_small.render(label, True, (240, 240, 240))
-        label_surf = pygame.transform.rotate(label_surf, 90)
+            label = f"{dates[i]} to {dates[j]}"
+        label_surf = date_label(label)
         screen.blit(label_surf, (
             FRAME + inner_w - label_surf.get_width() - 5,
             FRAME + 20
         ))
 
-        # This adds the slider bar with tick marks
-        bar_y = FRAME + (inner_h - UI_H) + 38
-        pygame.draw.rect(screen, (80, 80, 80), (FRAME, bar_y, inner_w, BAR_H), border_radius=6)
-
-        if len(screenshots) > 1:
-            for k in range(len(screenshots)):
-                x = FRAME + int((k / (len(screenshots) - 1)) * inner_w)
-                pygame.draw.line(screen, (200, 200, 200), (x, bar_y), (x, bar_y + BAR_H), 2)
-
-        # This draws the slider handle
-        if len(screenshots) == 1:
-            handle_x = FRAME
-        else:
-            handle_x = FRAME + int((slider_pos / (len(screenshots) - 1)) * inner_w)
+        # This draws the slider handle (if it is in the visible part of the timeline)
+        handle_x = axis_x(slider_pos, view, inner_w)
         handle_rect = pygame.Rect(0, 0, HANDLE_W, HANDLE_H)
         handle_rect.center = (handle_x, bar_y + BAR_H // 2)
-        pygame.draw.rect(screen, (200, 60, 60), handle_rect, border_radius=6)
-        pygame.draw.rect(screen, (240, 180, 180), handle_rect, 2, border_radius=6)
+        if view[0] <= slider_pos <= view[1]:
+            pygame.draw.rect(screen, (200, 60, 60), handle_rect, border_radius=6)
+            pygame.draw.rect(screen, (240, 180, 180), handle_rect, 2, border_radius=6)
 
-        # This draws help text
-        hint = font_small.render("Drag to slide between images • ESC to quit", True, (210, 210, 210))
-        screen.blit(hint, (FRAME, bar_y + 20))
+        if show_stats:
+            stats = font_small.render(stats_line(frame_cache, overlay_cache, loader, frame_times), True, (150, 220, 150))
+            screen.blit(stats, (FRAME, FRAME - 20))
 
+        frame_times.append((time.perf_counter() - started) * 1000)
+        metrics.add("viewer.frame", frame_times[-1] / 1000, fast=fast)
         pygame.display.flip()
         clock.tick(FPS)
 
-    pygame.quit()
\ No newline at end of file
+    loader.stop()
+    print("[INFO] Viewer:", stats_line(frame_cache, overlay_cache, loader, frame_times))
+    for name, cache in (("frames", frame_cache), ("overlays", overlay_cache), ("strip", strip_cache)):
+        stats = cache.stats()
+        for key in ("hits", "misses", "evictions"):
+            metrics.count(f"viewer.{name}_cache_{key}", stats[key])
+    metrics.count("viewer.loaded", loader.loaded)
+    metrics.count("viewer.load_failures", loader.failed)
+    pygame.quit()